@@ -0,0 +1,66 @@
+import time
+import logging
+from typing import Any, Dict, List, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from app.services.metrics import LLM_REQUEST_SECONDS, LLM_TOKENS, current_stage, record_timing
+from app.services.summarizer import count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """
+    Records latency and token usage of every call made through a chat model,
+    labelled with the pipeline stage it ran in. Streaming responses carry no
+    usage, so their tokens are estimated from the text.
+    """
+
+    run_inline = True  # read the caller's stage contextvar
+
+    def __init__(self):
+        self._runs: Dict[UUID, Tuple[float, str, str, Any]] = {}
+
+    def on_chat_model_start(
+        self,
+        serialized: Dict[str, Any],
+        messages: List[List[Any]],
+        *,
+        run_id: UUID,
+        **kwargs: Any
+    ) -> None:
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model") or params.get("model_name") or ""
+        # Calls that cannot run inside a stage block (streams) name it in their metadata
+        stage = (kwargs.get("metadata") or {}).get("stage") or current_stage()
+        self._runs[run_id] = (time.perf_counter(), stage, model, messages)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        started, stage_name, model, messages = run
+        elapsed = time.perf_counter() - started
+        LLM_REQUEST_SECONDS.observe(elapsed, stage=stage_name, model=model)
+        record_timing("llm", elapsed)
+
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage:
+            prompt_tokens, completion_tokens = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+        else:
+            prompt_tokens = sum(count_tokens(str(m.content)) for batch in messages for m in batch)
+            completion_tokens = sum(count_tokens(g.text) for gens in response.generations for g in gens)
+        LLM_TOKENS.inc(prompt_tokens, stage=stage_name, model=model, kind="prompt")
+        LLM_TOKENS.inc(completion_tokens, stage=stage_name, model=model, kind="completion")
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            LLM_REQUEST_SECONDS.observe(time.perf_counter() - run[0], stage=run[1], model=run[2])
+
+
+# Attached to every chat model the agents use
+LLM_METRICS = LLMMetricsHandler()
@@ -0,0 +1,108 @@
+import json
+import logging
+from typing import Any, Dict, List, Literal, Optional
+
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from langchain.prompts import PromptTemplate
+from langchain_openai import ChatOpenAI
+
+from app.services.shopifyql import ShopifyQLSyntaxError
+from app.services.joins import validate_query
+from app.prompts.agent_prompts import PLANNING_PROMPT, PLANNING_RETRY_FEEDBACK
+
+logger = logging.getLogger(__name__)
+
+PLAN_FUNCTION = "analysis_plan"
+# One retry with the validation error fed back to the model
+PLAN_ATTEMPTS = 2
+
+PLAN_PROMPT = PromptTemplate(
+    template=PLANNING_PROMPT,
+    input_variables=["question", "feedback"]
+)
+
+
+class PlanningError(ValueError):
+    """The LLM did not produce a usable intent and query"""
+
+
+class AnalysisPlan(BaseModel):
+    """Intent and ShopifyQL for a question, as returned by the planning call"""
+    domain: Literal["orders", "products", "inventory", "customers"] = Field(
+        description="Data domain the question is about (the main one for cross-domain questions)"
+    )
+    metrics: List[str] = Field(default_factory=list, description="Metrics needed, e.g. count, sum, average")
+    time_period: Optional[str] = Field(None, description="Time period, e.g. last_7_days, this_month")
+    filters: Dict[str, Any] = Field(default_factory=dict, description="Filters or conditions")
+    intent_summary: str = Field("", description="Brief description of the intent")
+    query: str = Field(description="ShopifyQL query answering the question (WITH ... JOIN for several domains)")
+
+    @field_validator("query")
+    @classmethod
+    def _valid_shopifyql(cls, query: str) -> str:
+        query = query.strip().strip("`").strip()
+        if query[:3].lower() == "sql":
+            query = query[3:].strip()
+        try:
+            validate_query(query)
+        except ShopifyQLSyntaxError as e:
+            raise ValueError(f"invalid ShopifyQL: {e}")
+        return query
+
+    @property
+    def intent(self) -> Dict[str, Any]:
+        return self.model_dump(exclude={"query"})
+
+
+def _plan_tool() -> Dict[str, Any]:
+    schema = AnalysisPlan.model_json_schema()
+    schema.pop("title", None)
+    return {
+        "type": "function",
+        "function": {
+            "name": PLAN_FUNCTION,
+            "description": "Record the intent analysis and ShopifyQL query for the question",
+            "parameters": schema
+        }
+    }
+
+
+PLAN_TOOL = _plan_tool()
+
+
+def _tool_arguments(message: Any) -> str:
+    """Raw arguments of the forced function call (falls back to the message text)"""
+    tool_calls = message.additional_kwargs.get("tool_calls") or []
+    for call in tool_calls:
+        if call.get("function", {}).get("name") == PLAN_FUNCTION:
+            return call["function"].get("arguments") or ""
+    return message.content or ""
+
+
+class QueryPlanner:
+    """
+    Single LLM round trip for intent + ShopifyQL.
+
+    The model is forced to call the analysis_plan function, whose arguments are
+    validated into an AnalysisPlan (including a parse/plan of the query). A
+    malformed response is retried once with the error in the prompt.
+    """
+
+    def __init__(self, llm: ChatOpenAI):
+        self.chain = PLAN_PROMPT | llm.bind_tools([PLAN_TOOL], tool_choice=PLAN_FUNCTION)
+
+    async def plan(self, question: str) -> AnalysisPlan:
+        feedback = ""
+        error = None
+
+        for attempt in range(1, PLAN_ATTEMPTS + 1):
+            message = await self.chain.ainvoke({"question": question, "feedback": feedback})
+            arguments = _tool_arguments(message)
+            try:
+                return AnalysisPlan.model_validate_json(arguments)
+            except (ValidationError, json.JSONDecodeError) as e:
+                error = e
+                logger.warning(f"Malformed plan (attempt {attempt}/{PLAN_ATTEMPTS}): {str(e)}")
+                feedback = PLANNING_RETRY_FEEDBACK.format(error=str(e), previous=arguments[:2000])
+
+        raise PlanningError(f"Could not plan a query for the question: {error}")
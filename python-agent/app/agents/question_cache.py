@@ -0,0 +1,223 @@
+import os
+import re
+import math
+import hashlib
+import logging
+from collections import Counter, OrderedDict, defaultdict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from app.services.cache_service import CacheService
+from app.services.singleflight import DistributedSingleFlight, MISSING
+from app.services.metrics import ANSWER_CACHE
+from app.services.shopifyql import named_range
+from app.agents.intent_classifier import STOPWORDS, find_time_period
+
+logger = logging.getLogger(__name__)
+
+# Full answers go stale with the store's data; plans (intent + query) only depend on the question
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "300"))
+PLAN_CACHE_TTL = int(os.getenv("PLAN_CACHE_TTL", "86400"))
+
+# Local near-duplicate matching for plans (0 disables it)
+QUESTION_SIMILARITY_THRESHOLD = float(os.getenv("QUESTION_SIMILARITY_THRESHOLD", "0.85"))
+QUESTION_INDEX_SIZE = int(os.getenv("QUESTION_INDEX_SIZE", "5000"))
+
+# Cross-worker lock for a question's pipeline run (covers LLM calls, so longer than the cache lock)
+QUESTION_LOCK_TTL = float(os.getenv("QUESTION_LOCK_TTL", "60"))
+QUESTION_POLL_INTERVAL = 0.25
+
+ANSWER_PREFIX = "answer"
+PLAN_PREFIX = "plan"
+
+# Words that change what is asked even though they look like filler
+KEEP_WORDS = {"not", "no", "without", "than", "more", "less", "most", "least", "each", "per"}
+QUESTION_STOPWORDS = (STOPWORDS | {"how", "many", "much", "did", "we", "get", "were", "there", "been", "some", "any", "about", "like", "see"}) - KEEP_WORDS
+
+
+def normalize_question(question: str, now: Optional[datetime] = None) -> str:
+    """
+    Canonical form of a question for cache keys.
+
+    Lowercases, drops punctuation and stopwords (word order is kept) and
+    replaces a relative time phrase with the absolute date window it resolves
+    to now, so "sales last week" keys differently next week.
+    """
+    now = now or datetime.now(timezone.utc)
+    text = question.lower()
+
+    window = ""
+    found = find_time_period(text)
+    if found:
+        period, (start, end) = found
+        first, last = named_range(period, now)
+        window = f"@{first.date().isoformat()}..{last.date().isoformat()}"
+        text = f"{text[:start]} {text[end:]}"
+
+    words = [w for w in re.findall(r"[a-z0-9]+", text.replace("'", "")) if w not in QUESTION_STOPWORDS]
+    return " ".join(words + ([window] if window else []))
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class QuestionIndex:
+    """
+    In-process TF-IDF index over recently planned normalised questions.
+
+    Candidates come from an inverted index on shared terms; a neighbour only
+    counts if it has the same numbers and date window (top 5 vs top 10 or
+    this week vs last week must never be merged) and cosine similarity at or
+    above the threshold.
+    """
+
+    def __init__(self, max_size: int = QUESTION_INDEX_SIZE, threshold: float = QUESTION_SIMILARITY_THRESHOLD):
+        self.max_size = max_size
+        self.threshold = threshold
+        self._questions: "OrderedDict[str, Counter]" = OrderedDict()
+        self._postings: Dict[str, Set[str]] = defaultdict(set)
+
+    @staticmethod
+    def _terms(normalized: str) -> Counter:
+        return Counter(normalized.split())
+
+    @staticmethod
+    def _fixed(terms: Counter) -> frozenset:
+        # Numbers and the date window must match exactly
+        return frozenset(t for t in terms if t.isdigit() or t.startswith("@"))
+
+    def _idf(self, term: str) -> float:
+        return math.log((1 + len(self._questions)) / (1 + len(self._postings.get(term, ())))) + 1
+
+    def _vector(self, terms: Counter) -> Dict[str, float]:
+        vector = {t: count * self._idf(t) for t, count in terms.items()}
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {t: v / norm for t, v in vector.items()}
+
+    def add(self, normalized: str) -> None:
+        if normalized in self._questions:
+            self._questions.move_to_end(normalized)
+            return
+
+        terms = self._terms(normalized)
+        self._questions[normalized] = terms
+        for term in terms:
+            self._postings[term].add(normalized)
+
+        while len(self._questions) > self.max_size:
+            evicted, old_terms = self._questions.popitem(last=False)
+            for term in old_terms:
+                self._postings[term].discard(evicted)
+                if not self._postings[term]:
+                    del self._postings[term]
+
+    def nearest(self, normalized: str) -> Optional[Tuple[str, float]]:
+        """Most similar indexed question above the threshold"""
+        if self.threshold <= 0:
+            return None
+
+        terms = self._terms(normalized)
+        fixed = self._fixed(terms)
+        candidates = set().union(*(self._postings.get(t, set()) for t in terms)) if terms else set()
+        candidates.discard(normalized)
+
+        query = self._vector(terms)
+        best: Optional[Tuple[str, float]] = None
+        for candidate in candidates:
+            other = self._questions[candidate]
+            if self._fixed(other) != fixed:
+                continue
+            vector = self._vector(other)
+            score = sum(weight * vector.get(t, 0.0) for t, weight in query.items())
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (candidate, score)
+        return best
+
+
+class QuestionCache:
+    """
+    Question-level cache in front of the agent pipeline.
+
+    Two layers, both keyed on the normalised question:
+    - answer: the full response per store, tagged with the data namespace of
+      each domain it read so a sync that bumps any of them makes it a miss;
+    - plan: intent + ShopifyQL, shared across stores, also reachable from
+      near-duplicate phrasings through the local QuestionIndex.
+    """
+
+    def __init__(self, cache_service: CacheService, index: Optional[QuestionIndex] = None):
+        self.cache = cache_service
+        self.index = index or QuestionIndex()
+        self.flight = DistributedSingleFlight(
+            "question",
+            lambda: cache_service.redis_client,
+            lock_ttl=QUESTION_LOCK_TTL,
+            poll_interval=QUESTION_POLL_INTERVAL
+        )
+
+    normalize = staticmethod(normalize_question)
+
+    @staticmethod
+    def _answer_key(store_id: str, normalized: str) -> str:
+        return f"{ANSWER_PREFIX}:{store_id}:{_digest(normalized)}"
+
+    @staticmethod
+    def _plan_key(normalized: str) -> str:
+        return f"{PLAN_PREFIX}:{_digest(normalized)}"
+
+    async def get_answer(self, store_id: str, normalized: str) -> Optional[Dict[str, Any]]:
+        entry = await self.cache.get(self._answer_key(store_id, normalized))
+        if not entry or not entry.get("namespaces"):
+            ANSWER_CACHE.inc(result="miss")
+            return None
+
+        for domain, namespace in entry["namespaces"].items():
+            if namespace != await self.cache.namespace(store_id, domain):
+                ANSWER_CACHE.inc(result="stale")
+                return None
+
+        ANSWER_CACHE.inc(result="hit")
+        logger.info(f"Answer cache hit for {store_id}: {normalized!r}")
+        return entry["response"]
+
+    async def set_answer(self, store_id: str, normalized: str, domains: List[str], response: Dict[str, Any]) -> None:
+        entry = {
+            "namespaces": {domain: await self.cache.namespace(store_id, domain) for domain in domains},
+            "response": response
+        }
+        ttl = await self.cache.result_ttl(store_id, ANSWER_CACHE_TTL)
+        await self.cache.set(self._answer_key(store_id, normalized), entry, ttl=ttl)
+
+    async def single_flight(
+        self,
+        store_id: str,
+        normalized: str,
+        answer: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """Run `answer` once for concurrent duplicates, here and on other workers"""
+        async def load():
+            cached = await self.get_answer(store_id, normalized)
+            return MISSING if cached is None else cached
+
+        return await self.flight.do(self._answer_key(store_id, normalized), answer, load=load)
+
+    async def get_plan(self, normalized: str) -> Optional[Dict[str, Any]]:
+        """Cached intent + query for the question or its nearest indexed neighbour"""
+        plan = await self.cache.get(self._plan_key(normalized))
+        if plan:
+            return plan
+
+        nearest = self.index.nearest(normalized)
+        if nearest is None:
+            return None
+
+        neighbour, score = nearest
+        plan = await self.cache.get(self._plan_key(neighbour))
+        if plan:
+            logger.info(f"Reusing plan of {neighbour!r} for {normalized!r} (similarity {score:.2f})")
+        return plan
+
+    async def set_plan(self, normalized: str, intent: Dict[str, Any], query: str) -> None:
+        await self.cache.set(self._plan_key(normalized), {"intent": intent, "query": query}, ttl=PLAN_CACHE_TTL)
+        self.index.add(normalized)
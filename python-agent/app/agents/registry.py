@@ -0,0 +1,158 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import httpx
+import openai
+from langchain_openai import ChatOpenAI
+
+from app.agents.shopify_agent import ShopifyAnalyticsAgent, LLM_MODEL, LLM_TEMPERATURE
+from app.agents.question_cache import QuestionCache
+from app.agents.llm_metrics import LLM_METRICS
+from app.services.cache_service import CacheService
+from app.services.http_client import ShopifyClientPool
+from app.services.rate_limiter import ShopifyRateLimiter
+from app.services.local_store import LocalStoreManager
+
+logger = logging.getLogger(__name__)
+
+# Per-store agents (and their ShopifyService) kept warm between requests
+AGENT_CACHE_SIZE = int(os.getenv("AGENT_CACHE_SIZE", "256"))
+AGENT_IDLE_TTL = int(os.getenv("AGENT_IDLE_TTL", "900"))
+AGENT_SWEEP_INTERVAL = 60
+
+# Shared OpenAI transport
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "50"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+
+
+class AgentRegistry:
+    """
+    App-lifespan owner of the shared LLM client and per-store agents.
+
+    One ChatOpenAI (backed by a pooled keep-alive httpx client) serves every
+    request. Agents are cached per store with their ShopifyService, rebuilt
+    when the store's credentials change, and dropped (with the store's HTTP
+    pool) after AGENT_IDLE_TTL seconds without use or when the cache is full.
+    """
+
+    def __init__(
+        self,
+        http_pool: ShopifyClientPool,
+        rate_limiter: ShopifyRateLimiter,
+        cache_service: Optional[CacheService] = None,
+        local_stores: Optional[LocalStoreManager] = None,
+        max_agents: int = AGENT_CACHE_SIZE,
+        idle_ttl: int = AGENT_IDLE_TTL
+    ):
+        self.cache_service = cache_service
+        # Shared by all agents so the near-duplicate index sees every store's questions
+        self.question_cache = QuestionCache(cache_service) if cache_service else None
+        self.http_pool = http_pool
+        self.rate_limiter = rate_limiter
+        self.local_stores = local_stores
+        self.max_agents = max_agents
+        self.idle_ttl = idle_ttl
+
+        self._openai_http: Optional[httpx.AsyncClient] = None
+        self._llm: Optional[ChatOpenAI] = None
+
+        # store_id -> (agent, credentials, last used)
+        self._agents: "OrderedDict[str, Tuple[ShopifyAnalyticsAgent, Tuple[str, str], float]]" = OrderedDict()
+        self._sweeper: Optional[asyncio.Task] = None
+
+    @property
+    def llm(self) -> ChatOpenAI:
+        """The shared chat model, created on first use"""
+        if self._llm is None:
+            self._openai_http = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_CONNECTIONS
+                ),
+                timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=10)
+            )
+            self._llm = ChatOpenAI(
+                model=LLM_MODEL,
+                temperature=LLM_TEMPERATURE,
+                api_key=os.getenv("OPENAI_API_KEY"),
+                callbacks=[LLM_METRICS],
+                async_client=openai.AsyncOpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    http_client=self._openai_http,
+                    max_retries=OPENAI_MAX_RETRIES
+                ).chat.completions
+            )
+        return self._llm
+
+    async def get_agent(self, store_id: str, access_token: str, api_version: str = "2024-01") -> ShopifyAnalyticsAgent:
+        """Cached agent for a store, rebuilt if its credentials changed"""
+        credentials = (access_token, api_version)
+        entry = self._agents.get(store_id)
+
+        if entry is not None and entry[1] == credentials:
+            agent = entry[0]
+            self._agents.move_to_end(store_id)
+        else:
+            agent = ShopifyAnalyticsAgent(
+                store_id=store_id,
+                access_token=access_token,
+                api_version=api_version,
+                cache_service=self.cache_service,
+                http_pool=self.http_pool,
+                rate_limiter=self.rate_limiter,
+                local_stores=self.local_stores,
+                llm=self.llm,
+                question_cache=self.question_cache
+            )
+
+        self._agents[store_id] = (agent, credentials, time.monotonic())
+
+        while len(self._agents) > self.max_agents:
+            evicted, _ = self._agents.popitem(last=False)
+            await self._release(evicted)
+
+        return agent
+
+    async def _release(self, store_id: str) -> None:
+        """Close an evicted store's HTTP pool unless a background sync still uses it"""
+        if self.local_stores is not None and self.local_stores.syncing(store_id):
+            return
+        await self.http_pool.close_client(store_id)
+        logger.info(f"Released agent for {store_id}")
+
+    async def evict_idle(self) -> int:
+        """Drop agents unused for longer than the idle TTL"""
+        cutoff = time.monotonic() - self.idle_ttl
+        idle = [store_id for store_id, (_, _, last_used) in self._agents.items() if last_used < cutoff]
+        for store_id in idle:
+            del self._agents[store_id]
+            await self._release(store_id)
+        return len(idle)
+
+    def start(self) -> None:
+        """Begin the periodic idle sweep"""
+        if self._sweeper is not None:
+            return
+
+        async def sweep():
+            while True:
+                await asyncio.sleep(AGENT_SWEEP_INTERVAL)
+                await self.evict_idle()
+
+        self._sweeper = asyncio.create_task(sweep())
+
+    async def aclose(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+        self._agents.clear()
+        if self._openai_http is not None:
+            await self._openai_http.aclose()
+            self._openai_http = None
+            self._llm = None
@@ -1,5 +1,9 @@
 import os
-from typing import Dict, Any, Optional
+import re
+import json
+import time
+import asyncio
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple, Union
 import logging
 from openai import OpenAI
 from langchain.prompts import PromptTemplate
@@ -7,14 +11,107 @@ from langchain.chains import LLMChain
 from langchain_openai import ChatOpenAI
 from app.services.shopify_service import ShopifyService
 from app.services.cache_service import CacheService
-from app.prompts.agent_prompts import (
-    INTENT_CLASSIFICATION_PROMPT,
-    QUERY_GENERATION_PROMPT,
-    RESULT_EXPLANATION_PROMPT
-)
+from app.services.http_client import ShopifyClientPool
+from app.services.rate_limiter import ShopifyRateLimiter
+from app.services.local_store import LocalStore, LocalStoreManager, DOMAIN_RESOURCES
+from app.services.shopifyql import QueryPlan, ShopifyQLSyntaxError, plan_query
+from app.services.joins import VARIANT_BRIDGE_QUERY, MultiQuery, is_multi_query, join_results, parse_multi_query, validate_query
+from app.services.snapshot import SharedSnapshot, shares_scan
+from app.services.singleflight import SingleFlight
+from app.services.summarizer import summarize_results
+from app.services.metrics import observe_stage, stage, timed_stage
+from app.services.admission import Mode, OverloadedError
+from app.agents.intent_classifier import IntentClassifier, FastIntent, FAST_PATH_ENABLED
+from app.agents.planner import QueryPlanner
+from app.agents.question_cache import QuestionCache
+from app.agents.llm_metrics import LLM_METRICS
+from app.prompts.agent_prompts import RESULT_EXPLANATION_PROMPT
 
 logger = logging.getLogger(__name__)
 
+LLM_MODEL = "gpt-4-turbo-preview"
+LLM_TEMPERATURE = 0.1
+
+# Prompt templates are compiled once at import
+EXPLANATION_PROMPT = PromptTemplate(
+    template=RESULT_EXPLANATION_PROMPT,
+    input_variables=["question", "data", "query"]
+)
+
+# Rule/statistical classifier for formulaic questions, trained once at import
+INTENT_CLASSIFIER = IntentClassifier() if FAST_PATH_ENABLED else None
+
+# LLM calls in flight at once for one /api/analyze/batch request
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
+# Result rows included in the streamed data event
+STREAM_PREVIEW_ROWS = 10
+
+# Question-level coalescing when there is no QuestionCache (which coalesces across workers)
+QUESTION_FLIGHT = SingleFlight("question")
+
+class AnswerFieldStream:
+    """
+    Incrementally extracts the "answer" string from streamed explanation JSON,
+    so clients receive readable text rather than raw JSON fragments.
+    """
+    
+    ANSWER_START = re.compile(r'"answer"\s*:\s*"')
+    ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+    
+    def __init__(self):
+        self.buffer = ""
+        self.position = None  # index just past the opening quote once found
+        self.done = False
+        self.plain = False  # the model answered in prose rather than JSON
+    
+    def feed(self, chunk: str) -> str:
+        """Answer text contained in the chunk (empty until the field starts)"""
+        if self.done:
+            return ""
+        if self.plain:
+            return chunk
+        self.buffer += chunk
+        
+        head = self.buffer.lstrip()
+        if self.position is None and head and head[0] not in "{`":
+            self.plain = True
+            return self.buffer
+        
+        if self.position is None:
+            match = self.ANSWER_START.search(self.buffer)
+            if not match:
+                return ""
+            self.position = match.end()
+        
+        out = []
+        i = self.position
+        while i < len(self.buffer):
+            char = self.buffer[i]
+            if char == '"':
+                self.done = True
+                i += 1
+                break
+            if char == "\\":
+                if i + 1 >= len(self.buffer):
+                    break  # wait for the escaped character
+                escaped = self.buffer[i + 1]
+                if escaped == "u":
+                    if i + 6 > len(self.buffer):
+                        break
+                    out.append(chr(int(self.buffer[i + 2:i + 6], 16)))
+                    i += 6
+                    continue
+                out.append(self.ESCAPES.get(escaped, escaped))
+                i += 2
+                continue
+            out.append(char)
+            i += 1
+        
+        self.position = i
+        return "".join(out)
+
+
 class ShopifyAnalyticsAgent:
     """
     Agentic workflow for Shopify analytics:
@@ -29,131 +126,404 @@ class ShopifyAnalyticsAgent:
         self,
         store_id: str,
         access_token: str,
+        http_pool: ShopifyClientPool,
+        rate_limiter: ShopifyRateLimiter,
         api_version: str = "2024-01",
-        cache_service: Optional[CacheService] = None
+        cache_service: Optional[CacheService] = None,
+        local_stores: Optional[LocalStoreManager] = None,
+        llm: Optional[ChatOpenAI] = None,
+        question_cache: Optional[QuestionCache] = None
     ):
         self.store_id = store_id
         self.shopify_service = ShopifyService(
             store_id=store_id,
             access_token=access_token,
-            api_version=api_version
+            api_version=api_version,
+            http_pool=http_pool,
+            rate_limiter=rate_limiter
         )
         self.cache_service = cache_service
+        self.local_stores = local_stores
+        self.question_cache = question_cache
         
-        # Initialize LLM
-        self.llm = ChatOpenAI(
-            model="gpt-4-turbo-preview",
-            temperature=0.1,
-            api_key=os.getenv("OPENAI_API_KEY")
+        # Initialize LLM (the AgentRegistry passes in one shared client)
+        self.llm = llm or ChatOpenAI(
+            model=LLM_MODEL,
+            temperature=LLM_TEMPERATURE,
+            api_key=os.getenv("OPENAI_API_KEY"),
+            callbacks=[LLM_METRICS]
         )
+        self.planner = QueryPlanner(self.llm)
+        self.explanation_chain = LLMChain(llm=self.llm, prompt=EXPLANATION_PROMPT)
         
-    async def process_question(self, question: str) -> Dict[str, Any]:
-        """Main processing pipeline"""
+    async def process_question(self, question: str, mode: str = Mode.FULL) -> Dict[str, Any]:
+        """
+        Main processing pipeline. Under load (see AdmissionController) `mode`
+        may skip the LLM explanation or allow cached answers only.
+        """
         try:
-            # Step 1: Understand intent
-            intent = await self._classify_intent(question)
-            logger.info(f"Classified intent: {intent}")
-            
-            # Step 2: Generate ShopifyQL query
-            query = await self._generate_query(question, intent)
-            logger.info(f"Generated query: {query}")
-            
-            # Step 3: Execute query
-            data = await self._execute_query(query, intent)
-            logger.info(f"Retrieved {len(data) if isinstance(data, list) else 1} data points")
-            
-            # Step 4: Explain results
-            explanation = await self._explain_results(question, data, query)
-            
-            return {
-                "answer": explanation["answer"],
-                "confidence": explanation["confidence"],
-                "query_used": query,
-                "data_points": len(data) if isinstance(data, list) else 1,
-                "reasoning": explanation.get("reasoning")
-            }
+            with stage("total"):
+                # Concurrent duplicates of a question wait for one pipeline run
+                if self.question_cache:
+                    normalized = self.question_cache.normalize(question)
+                    with stage("answer_cache"):
+                        cached = await self.question_cache.get_answer(self.store_id, normalized)
+                    if cached is not None:
+                        return cached
+                    if mode != Mode.FULL:
+                        return await self._degraded_answer(question, normalized, mode)
+                    return await self.question_cache.single_flight(
+                        self.store_id, normalized, lambda: self._answer(question, normalized)
+                    )
+                
+                if mode != Mode.FULL:
+                    return await self._degraded_answer(question, None, mode)
+                return await QUESTION_FLIGHT.do(
+                    (self.store_id, " ".join(question.lower().split())),
+                    lambda: self._answer(question, None)
+                )
             
         except Exception as e:
             logger.error(f"Error in agent pipeline: {str(e)}")
             raise
     
-    async def _classify_intent(self, question: str) -> Dict[str, Any]:
-        """Classify user intent and extract key information"""
-        prompt = PromptTemplate(
-            template=INTENT_CLASSIFICATION_PROMPT,
-            input_variables=["question"]
+    async def _degraded_answer(self, question: str, normalized: Optional[str], mode: str) -> Dict[str, Any]:
+        """Answer without the explanation LLM call (not cached), or refuse when only cached answers are allowed"""
+        if mode == Mode.CACHED_ONLY:
+            raise OverloadedError("Service is overloaded and this question has no cached answer", retry_after=5)
+        
+        with stage("plan"):
+            intent, query = await self._plan(question, normalized)
+        with stage("execute"):
+            data = await self._execute_query(query, intent)
+        
+        response = await self._finish(None, intent, query, data, self._summary_explanation(data))
+        response["degraded"] = mode
+        return response
+    
+    @staticmethod
+    def _summary_explanation(data: Any) -> Dict[str, str]:
+        """Plain answer from the result rows, used when the explanation step is skipped"""
+        rows = data if isinstance(data, list) else [data]
+        preview = "; ".join(
+            ", ".join(f"{key}: {value}" for key, value in row.items() if not isinstance(value, (list, dict)))
+            if isinstance(row, dict) else str(row)
+            for row in rows[:3]
         )
+        answer = f"Found {len(rows)} result rows."
+        if preview:
+            answer += f" Top results: {preview}."
+        return {
+            "answer": answer,
+            "confidence": "medium",
+            "reasoning": "A detailed explanation was skipped because the service is under heavy load."
+        }
+    
+    async def _answer(self, question: str, normalized: Optional[str]) -> Dict[str, Any]:
+        with stage("plan"):
+            intent, query = await self._plan(question, normalized)
         
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        result = await chain.arun(question=question)
+        # Step 3: Execute query
+        with stage("execute"):
+            data = await self._execute_query(query, intent)
+        logger.info(f"Retrieved {len(data) if isinstance(data, list) else 1} data points")
         
-        # Parse LLM response
-        import json
-        try:
-            intent = json.loads(result)
-        except json.JSONDecodeError:
-            # Fallback parsing
-            intent = {
-                "domain": "orders",
-                "metrics": ["count"],
-                "time_period": "last_30_days",
-                "filters": {}
+        # Step 4: Explain results
+        with stage("explain"):
+            explanation = await self._explain_results(question, data, query)
+        
+        return await self._finish(normalized, intent, query, data, explanation)
+    
+    async def _finish(
+        self,
+        normalized: Optional[str],
+        intent: Dict[str, Any],
+        query: str,
+        data: Any,
+        explanation: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Assemble the response and store it in the answer cache"""
+        response = {
+            "answer": explanation["answer"],
+            "confidence": explanation["confidence"],
+            "query_used": query,
+            "data_points": len(data) if isinstance(data, list) else 1,
+            "reasoning": explanation.get("reasoning")
+        }
+        
+        if self.question_cache and normalized is not None:
+            # A joined answer is stale once any of its domains changes
+            domains = parse_multi_query(query).domains if is_multi_query(query) else [intent.get("domain", "orders")]
+            await self.question_cache.set_answer(self.store_id, normalized, domains, response)
+        
+        return response
+    
+    async def stream_question(self, question: str, mode: str = Mode.FULL) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Pipeline as a sequence of stage events: intent, query, data (count and
+        preview rows), explanation tokens as the LLM generates them, and the
+        final answer (the same dict process_question returns). Degraded modes
+        behave as in process_question.
+        """
+        normalized = None
+        if self.question_cache:
+            normalized = self.question_cache.normalize(question)
+            with stage("answer_cache"):
+                cached = await self.question_cache.get_answer(self.store_id, normalized)
+            if cached is not None:
+                yield {"event": "answer", "data": cached}
+                return
+        if mode == Mode.CACHED_ONLY:
+            raise OverloadedError("Service is overloaded and this question has no cached answer", retry_after=5)
+        
+        with stage("plan"):
+            intent, query = await self._plan(question, normalized)
+        yield {"event": "intent", "data": intent}
+        yield {"event": "query", "data": {"query": query}}
+        
+        with stage("execute"):
+            data = await self._execute_query(query, intent)
+        yield {
+            "event": "data",
+            "data": {
+                "data_points": len(data) if isinstance(data, list) else 1,
+                "rows": data[:STREAM_PREVIEW_ROWS] if isinstance(data, list) else data
             }
+        }
+        
+        if mode == Mode.SKIP_EXPLANATION:
+            response = await self._finish(None, intent, query, data, self._summary_explanation(data))
+            response["degraded"] = mode
+            yield {"event": "answer", "data": response}
+            return
+        
+        # Timed by hand: a stage block must not stay open across yields
+        started = time.perf_counter()
+        prompt = EXPLANATION_PROMPT.format(question=question, data=summarize_results(data), query=query)
+        answer_field = AnswerFieldStream()
+        chunks = []
+        async for chunk in self.llm.astream(prompt, config={"metadata": {"stage": "explain"}}):
+            chunks.append(chunk.content)
+            text = answer_field.feed(chunk.content)
+            if text:
+                yield {"event": "token", "data": {"text": text}}
+        observe_stage("explain", time.perf_counter() - started)
         
-        return intent
+        explanation = self._parse_explanation("".join(chunks))
+        response = await self._finish(normalized, intent, query, data, explanation)
+        yield {"event": "answer", "data": response}
     
-    async def _generate_query(self, question: str, intent: Dict[str, Any]) -> str:
-        """Generate ShopifyQL query based on intent"""
-        prompt = PromptTemplate(
-            template=QUERY_GENERATION_PROMPT,
-            input_variables=["question", "intent", "domain"]
-        )
+    async def _plan(self, question: str, normalized: Optional[str]) -> Tuple[Dict[str, Any], str]:
+        """Intent and ShopifyQL: local fast path, then cached plans, then the LLM"""
+        fast = self._fast_intent(question)
+        if fast is not None:
+            # Steps 1-2 without the LLM: local classifier + query template
+            logger.info(f"Fast-path intent {fast.label} ({fast.confidence}): {fast.query}")
+            return fast.intent, fast.query
         
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        query = await chain.arun(
-            question=question,
-            intent=str(intent),
-            domain=intent.get("domain", "orders")
-        )
+        if self.question_cache:
+            cached = await self.question_cache.get_plan(normalized)
+            if cached is not None:
+                logger.info(f"Cached plan: {cached['query']}")
+                return cached["intent"], cached["query"]
         
-        # Clean and validate query
-        query = query.strip().strip("```sql").strip("```").strip()
+        # Steps 1-2: intent and ShopifyQL from one structured LLM call
+        plan = await self.planner.plan(question)
+        logger.info(f"Classified intent: {plan.intent}")
+        logger.info(f"Generated query: {plan.query}")
         
-        if not self.validate_shopifyql(query):
-            raise ValueError(f"Generated invalid ShopifyQL: {query}")
+        if self.question_cache:
+            await self.question_cache.set_plan(normalized, plan.intent, plan.query)
         
-        return query
+        return plan.intent, plan.query
     
-    async def _execute_query(self, query: str, intent: Dict[str, Any]) -> Any:
+    def _fast_intent(self, question: str) -> Optional[FastIntent]:
+        """Locally classified intent and template query, or None when the LLM should decide"""
+        if INTENT_CLASSIFIER is None:
+            return None
+        
+        fast = INTENT_CLASSIFIER.classify(question)
+        if not INTENT_CLASSIFIER.confident(fast) or not fast.query:
+            logger.debug(f"Fast path declined ({fast.label}, {fast.confidence})")
+            return None
+        
+        if not self.validate_shopifyql(fast.query):
+            return None
+        
+        return fast
+    
+    async def _execute_query(
+        self,
+        query: str,
+        intent: Dict[str, Any],
+        shared: Optional[SharedSnapshot] = None
+    ) -> Any:
         """Execute query against Shopify API"""
+        if is_multi_query(query):
+            return await self._execute_multi(parse_multi_query(query))
+        
         domain = intent.get("domain", "orders")
         
-        # Check cache first
+        # Concurrent identical queries share one execution through the cache
         if self.cache_service:
-            cache_key = f"{self.store_id}:{domain}:{query}"
-            cached_result = self.cache_service.get(cache_key)
-            if cached_result:
-                logger.info("Returning cached result")
-                return cached_result
+            cache_key = await self.cache_service.make_key(self.store_id, domain, query)
+            return await self.cache_service.get_or_set(
+                cache_key,
+                lambda: self._run_query(query, domain, shared),
+                ttl=await self.cache_service.result_ttl(self.store_id)
+            )
+        
+        return await self._run_query(query, domain, shared)
+    
+    async def _execute_multi(self, multi: MultiQuery) -> List[Dict[str, Any]]:
+        """Fetch every step of a multi-domain query in one concurrent round, then join locally"""
+        fetches = [self._execute_query(step.query, {"domain": step.domain}) for step in multi.steps]
+        if multi.needs_bridge:
+            fetches.append(self._execute_query(VARIANT_BRIDGE_QUERY, {"domain": "products"}))
+        
+        fetched = await asyncio.gather(*fetches)
+        results = {step.name: data for step, data in zip(multi.steps, fetched)}
+        bridge = fetched[-1] if multi.needs_bridge else None
+        
+        joined = join_results(multi, results, bridge)
+        logger.info(f"Joined {', '.join(results)} into {len(joined)} rows")
+        return joined
+    
+    async def _local_source(self, domain: str, plan: QueryPlan) -> Optional[LocalStore]:
+        """
+        The store's local copy when fresh for the domain and holding every
+        field the plan reads (a stale copy schedules a refresh)
+        """
+        if not self.local_stores or domain not in DOMAIN_RESOURCES:
+            return None
+        
+        local_store = await self.local_stores.get(self.store_id)
+        if not await local_store.is_fresh(DOMAIN_RESOURCES[domain]):
+            self.local_stores.schedule_sync(self.shopify_service)
+            return None
+        
+        if not local_store.covers(plan):
+            logger.info(f"Query reads fields the local store does not hold: {', '.join(plan.fields)}")
+            return None
+        return local_store
+    
+    async def _run_query(self, query: str, domain: str, shared: Optional[SharedSnapshot] = None) -> Any:
+        """Run a query against the local store, its rollups, a shared batch snapshot or the Shopify API"""
+        # Answer from the local store when it is fresh, otherwise refresh it
+        plan = plan_query(query)
+        source = await self._local_source(domain, plan)
+        if source is not None:
+            logger.info("Answering from local store")
+        
+        # Aggregates the rollups cover are answered in O(days) rather than O(orders)
+        data = None
+        if source is not None:
+            data = await source.query_rollups(plan)
+        elif shared is not None:
+            source = shared
         
         # Execute based on domain
-        if domain == "orders":
-            data = await self.shopify_service.query_orders(query)
+        if data is not None:
+            logger.info("Answered from rollups")
+        elif domain == "orders":
+            data = await self.shopify_service.query_orders(query, source=source)
         elif domain == "products":
-            data = await self.shopify_service.query_products(query)
+            data = await self.shopify_service.query_products(query, source=source)
         elif domain == "inventory":
-            data = await self.shopify_service.query_inventory(query)
+            data = await self.shopify_service.query_inventory(query, source=source)
         elif domain == "customers":
-            data = await self.shopify_service.query_customers(query)
+            data = await self.shopify_service.query_customers(query, source=source)
         else:
             raise ValueError(f"Unknown domain: {domain}")
         
-        # Cache result
-        if self.cache_service:
-            self.cache_service.set(cache_key, data, ttl=300)  # 5 minutes
-        
         return data
     
+    async def process_batch(
+        self,
+        questions: List[str],
+        concurrency: int = BATCH_LLM_CONCURRENCY,
+        modes: Optional[List[str]] = None
+    ) -> List[Union[Dict[str, Any], Exception]]:
+        """
+        Answer many questions together. Plans and explanations run concurrently
+        (at most `concurrency` LLM calls at once); queries that scan the same
+        domain read one shared snapshot fetched for all of them. `modes` gives
+        each question's admission mode, as for process_question. Each entry is
+        the process_question result or the exception that question raised.
+        """
+        modes = modes or [Mode.FULL] * len(questions)
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def limited(fn):
+            async with semaphore:
+                return await fn()
+        
+        normalized = [self.question_cache.normalize(q) if self.question_cache else None for q in questions]
+        results: List[Any] = [None] * len(questions)
+        
+        if self.question_cache:
+            cached = await asyncio.gather(*(
+                self.question_cache.get_answer(self.store_id, n) for n in normalized
+            ))
+            results = list(cached)
+        for i, result in enumerate(results):
+            if result is None and modes[i] == Mode.CACHED_ONLY:
+                results[i] = OverloadedError("Service is overloaded and this question has no cached answer", retry_after=5)
+        pending = [i for i, result in enumerate(results) if result is None]
+        
+        # Plan every question
+        planned = await asyncio.gather(
+            *(limited(lambda i=i: timed_stage("plan", self._plan(questions[i], normalized[i]))) for i in pending),
+            return_exceptions=True
+        )
+        plans: Dict[int, Tuple[Dict[str, Any], str]] = {}
+        for i, plan in zip(pending, planned):
+            if isinstance(plan, Exception):
+                results[i] = plan
+            else:
+                plans[i] = plan
+        
+        # One fetch per domain for the queries that would each scan it (and
+        # that the local store cannot answer)
+        scans: Dict[str, Dict[str, QueryPlan]] = {}
+        for intent, query in plans.values():
+            if is_multi_query(query):
+                continue
+            domain = intent.get("domain", "orders")
+            plan = plan_query(query)
+            if plan.domain == domain and shares_scan(plan) and await self._local_source(domain, plan) is None:
+                scans.setdefault(domain, {})[query] = plan
+        shared_domains = [domain for domain, queries in scans.items() if len(queries) > 1]
+        fetched = await asyncio.gather(
+            *(SharedSnapshot.fetch(self.shopify_service, d, list(scans[d].values())) for d in shared_domains),
+            return_exceptions=True
+        )
+        snapshots = {}
+        for domain, snapshot in zip(shared_domains, fetched):
+            if isinstance(snapshot, Exception):
+                logger.warning(f"Shared {domain} fetch failed, querying individually: {str(snapshot)}")
+            elif snapshot is not None:
+                snapshots[domain] = snapshot
+        
+        async def answer(i: int) -> Dict[str, Any]:
+            intent, query = plans[i]
+            domain = intent.get("domain", "orders")
+            shared = snapshots.get(domain) if query in scans.get(domain, {}) else None
+            with stage("execute"):
+                data = await self._execute_query(query, intent, shared)
+            if modes[i] == Mode.SKIP_EXPLANATION:
+                response = await self._finish(None, intent, query, data, self._summary_explanation(data))
+                response["degraded"] = modes[i]
+                return response
+            explanation = await limited(lambda: timed_stage("explain", self._explain_results(questions[i], data, query)))
+            return await self._finish(normalized[i], intent, query, data, explanation)
+        
+        answered = await asyncio.gather(*(answer(i) for i in plans), return_exceptions=True)
+        for i, result in zip(plans, answered):
+            results[i] = result
+        
+        return results
+    
     async def _explain_results(
         self,
         question: str,
@@ -161,20 +531,16 @@ class ShopifyAnalyticsAgent:
         query: str
     ) -> Dict[str, str]:
         """Convert technical results to business-friendly explanation"""
-        prompt = PromptTemplate(
-            template=RESULT_EXPLANATION_PROMPT,
-            input_variables=["question", "data", "query"]
-        )
-        
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        explanation = await chain.arun(
+        explanation = await self.explanation_chain.arun(
             question=question,
-            data=str(data)[:2000],  # Limit data size
+            data=summarize_results(data),
             query=query
         )
         
-        # Parse explanation
-        import json
+        return self._parse_explanation(explanation)
+    
+    @staticmethod
+    def _parse_explanation(explanation: str) -> Dict[str, Any]:
         try:
             result = json.loads(explanation)
         except json.JSONDecodeError:
@@ -187,23 +553,11 @@ class ShopifyAnalyticsAgent:
     
     @staticmethod
     def validate_shopifyql(query: str) -> bool:
-        """Basic ShopifyQL validation"""
-        query_lower = query.lower()
-        
-        # Must contain FROM clause
-        if "from" not in query_lower:
-            return False
-        
-        # Check for valid tables
-        valid_tables = ["orders", "products", "inventory", "customers", "line_items"]
-        has_valid_table = any(table in query_lower for table in valid_tables)
-        
-        if not has_valid_table:
-            return False
-        
-        # No dangerous operations
-        dangerous = ["drop", "delete", "update", "insert", "alter"]
-        if any(op in query_lower for op in dangerous):
+        """Validate ShopifyQL by parsing and planning it (read-only, known tables)"""
+        try:
+            validate_query(query)
+        except ShopifyQLSyntaxError as e:
+            logger.warning(f"Invalid ShopifyQL: {str(e)}")
             return False
         
-        return True
\ No newline at end of file
+        return True
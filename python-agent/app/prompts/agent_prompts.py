@@ -1,34 +1,18 @@
-INTENT_CLASSIFICATION_PROMPT = """
-You are an expert at understanding business questions about e-commerce data.
-
-Analyze this question and extract:
-1. Domain (orders, products, inventory, customers)
-2. Metrics needed (count, sum, average, etc.)
-3. Time period (if mentioned)
-4. Any filters or conditions
+PLANNING_PROMPT = """
+You are an expert at understanding business questions about e-commerce data
+and at writing ShopifyQL queries to answer them.
 
 Question: {question}
 
-Return a JSON object with this structure:
-{{
-    "domain": "orders|products|inventory|customers",
-    "metrics": ["count", "sum", "average"],
-    "time_period": "last_7_days|last_30_days|last_week|next_month|etc",
-    "filters": {{"product_name": "X", "status": "active"}},
-    "intent_summary": "brief description"
-}}
-
-Be precise and only include information explicitly mentioned or clearly implied.
-"""
-
-QUERY_GENERATION_PROMPT = """
-You are an expert at writing ShopifyQL queries.
-
-Generate a ShopifyQL query to answer this question:
-Question: {question}
+Analyze the question and call the analysis_plan function with:
+1. Domain (orders, products, inventory, customers)
+2. Metrics needed (count, sum, average, etc.)
+3. Time period (if mentioned), e.g. last_7_days, last_30_days, last_week, this_month
+4. Any filters or conditions, e.g. {{"product_name": "X", "status": "active"}}
+5. A brief intent summary
+6. The ShopifyQL query that answers the question
 
-Intent Analysis: {intent}
-Domain: {domain}
+Only include information explicitly mentioned or clearly implied.
 
 ShopifyQL Guidelines:
 - Use FROM clause with valid tables: orders, products, inventory, customers, line_items
@@ -38,6 +22,10 @@ ShopifyQL Guidelines:
 - Use LIMIT to restrict results
 - Date format: 'YYYY-MM-DD'
 - Use proper SQL syntax
+- Questions spanning domains (e.g. sales and stock) use one query per domain joined locally:
+  WITH name AS (query), name AS (query) SELECT * FROM name [LEFT] JOIN name [ORDER BY column] [LIMIT n]
+  Rows join on shared ids (product_id, inventory_item_id, variant_id, customer_id, order_id);
+  order sales to inventory are linked through product variants automatically
 
 Example queries:
 1. "Top 5 products last week":
@@ -52,7 +40,18 @@ Example queries:
    WHERE quantity < 10
    ORDER BY quantity ASC
 
-Generate ONLY the ShopifyQL query, no explanations:
+3. "Which low-stock products sold best last month":
+   WITH sales AS (FROM orders DURING last_month GROUP BY product_id),
+        stock AS (FROM inventory WHERE quantity < 10)
+   SELECT * FROM sales JOIN stock
+   ORDER BY total_quantity DESC
+   LIMIT 10
+{feedback}"""
+
+PLANNING_RETRY_FEEDBACK = """
+Your previous answer was rejected: {error}
+Previous answer: {previous}
+Call analysis_plan again with corrected arguments.
 """
 
 RESULT_EXPLANATION_PROMPT = """
@@ -60,7 +59,7 @@ You are a business analyst explaining data insights to store owners.
 
 Question: {question}
 Query Used: {query}
-Data Retrieved: {data}
+Data Retrieved (JSON digest: row count, totals, column statistics, trend and top rows in query order): {data}
 
 Convert this technical data into a clear, actionable business insight.
 
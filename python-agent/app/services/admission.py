@@ -0,0 +1,300 @@
+import os
+import math
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+from contextvars import ContextVar
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Union
+
+from app.services.metrics import ADMISSION_EVENTS, ADMISSION_REQUESTS, ADMISSION_WAIT_SECONDS, record_timing
+
+logger = logging.getLogger(__name__)
+
+# Questions answered at once per worker; the rest wait in the fair queue
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "32"))
+# Queued questions per worker, and per store, before new ones are turned away
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "256"))
+ADMISSION_STORE_MAX_QUEUE = int(os.getenv("ADMISSION_STORE_MAX_QUEUE", "16"))
+
+# Caller's deadline when the request does not send X-Request-Timeout (Rails waits 30s)
+ADMISSION_REQUEST_TIMEOUT = float(os.getenv("ADMISSION_REQUEST_TIMEOUT", "30"))
+
+# Queue depths at which new questions skip the LLM explanation, then are answered from cache only
+ADMISSION_SKIP_EXPLANATION_DEPTH = int(os.getenv("ADMISSION_SKIP_EXPLANATION_DEPTH", "32"))
+ADMISSION_CACHED_ONLY_DEPTH = int(os.getenv("ADMISSION_CACHED_ONLY_DEPTH", "128"))
+
+# Service time assumed for a store before any of its questions finished, and the EWMA weight
+ADMISSION_INITIAL_SERVICE_TIME = float(os.getenv("ADMISSION_INITIAL_SERVICE_TIME", "5"))
+SERVICE_TIME_ALPHA = 0.2
+
+# Monotonic deadline of the admitted question this task is answering (None off the request path)
+_DEADLINE: ContextVar[Optional[float]] = ContextVar("admission_deadline", default=None)
+
+
+def request_deadline() -> Optional[float]:
+    """time.monotonic() by which the caller needs its answer, if a request is waiting on this task"""
+    return _DEADLINE.get()
+
+
+def bind_deadline(ticket: "Ticket") -> None:
+    """Apply a ticket's deadline to the current task (for tasks that outlive `admit`)"""
+    _DEADLINE.set(ticket.deadline)
+
+
+class Mode:
+    """How much of the pipeline an admitted question gets"""
+    FULL = "full"
+    SKIP_EXPLANATION = "skip_explanation"
+    CACHED_ONLY = "cached_only"
+
+
+class OverloadedError(Exception):
+    """Raised when a question is shed; `status` is 429 (this store) or 503 (the worker)"""
+
+    def __init__(self, message: str, retry_after: float, status: int = 503):
+        self.retry_after = retry_after
+        self.status = status
+        super().__init__(message)
+
+
+class Ticket:
+    """An admitted question: its mode, deadline, and whether it holds a concurrency slot"""
+
+    def __init__(self, store_id: str, mode: str, slot: bool, deadline: Optional[float] = None):
+        self.store_id = store_id
+        self.mode = mode
+        self.slot = slot
+        self.deadline = deadline
+        self.started_at = time.monotonic()
+
+
+class _Waiter:
+    __slots__ = ("store_id", "future", "queued_at", "cancelled")
+
+    def __init__(self, store_id: str, future: asyncio.Future):
+        self.store_id = store_id
+        self.future = future
+        self.queued_at = time.monotonic()
+        self.cancelled = False
+
+
+class AdmissionController:
+    """
+    Bounded concurrency for /api/analyze with weighted fair queuing by store.
+
+    Each queued question gets a start-time fair queuing tag: the later of the
+    current virtual time and its store's previous finish tag, with the store
+    charged its own average service time divided by its weight. Slots go to
+    the lowest tag, so a store firing many heavy questions queues behind
+    itself instead of in front of everyone else.
+
+    Questions are shed up front (503, or 429 when only their store's queue is
+    full) with a Retry-After estimate, including when the expected wait plus
+    service time would overrun the caller's deadline, and dropped from the
+    queue once they can no longer finish in time. As the queue deepens new
+    questions are degraded: first without the LLM explanation, then answered
+    from cache only (these skip the queue).
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = ADMISSION_MAX_CONCURRENCY,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        store_max_queue: int = ADMISSION_STORE_MAX_QUEUE
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.store_max_queue = store_max_queue
+        self.active = 0
+        self.queued = 0
+        self._virtual_time = 0.0
+        self._heap: List[tuple] = []
+        self._counter = itertools.count()
+        self._store_queued: Dict[str, int] = {}
+        self._finish_tags: Dict[str, float] = {}
+        self._service_times: Dict[str, float] = {}
+        self._average_service = ADMISSION_INITIAL_SERVICE_TIME
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "average_service_s": round(self._average_service, 3),
+        }
+
+    def _update_gauges(self) -> None:
+        ADMISSION_REQUESTS.set(self.active, state="active")
+        ADMISSION_REQUESTS.set(self.queued, state="queued")
+
+    def mode(self) -> str:
+        """Degradation mode for a question arriving now"""
+        if self.queued >= ADMISSION_CACHED_ONLY_DEPTH:
+            return Mode.CACHED_ONLY
+        if self.queued >= ADMISSION_SKIP_EXPLANATION_DEPTH:
+            return Mode.SKIP_EXPLANATION
+        return Mode.FULL
+
+    def service_time(self, store_id: str) -> float:
+        return self._service_times.get(store_id, self._average_service)
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue should have drained"""
+        return max(1, math.ceil(self.queued * self._average_service / self.max_concurrency))
+
+    def _expected_wait(self, tag: float) -> float:
+        ahead = sum(1 for entry in self._heap if entry[0] <= tag and not entry[2].cancelled)
+        return ahead * self._average_service / self.max_concurrency
+
+    def _shed(self, result: str, message: str, status: int = 503, retry_after: Optional[float] = None) -> OverloadedError:
+        ADMISSION_EVENTS.inc(result=result)
+        logger.warning(f"Shedding request: {message}")
+        return OverloadedError(message, retry_after or self.retry_after(), status)
+
+    async def acquire(self, store_id: str, timeout: Optional[float] = None, weight: float = 1.0) -> Ticket:
+        """Admit a question (waiting for a slot if needed) or raise OverloadedError"""
+        now = time.monotonic()
+        deadline = now + (timeout or ADMISSION_REQUEST_TIMEOUT)
+        mode = self.mode()
+
+        # Cache lookups are cheap: no slot, no queue
+        if mode == Mode.CACHED_ONLY:
+            ADMISSION_EVENTS.inc(result="cached_only")
+            return Ticket(store_id, mode, slot=False, deadline=deadline)
+
+        if self.active < self.max_concurrency and not self.queued:
+            self.active += 1
+            self._update_gauges()
+            ADMISSION_EVENTS.inc(result="admitted")
+            return Ticket(store_id, mode, slot=True, deadline=deadline)
+
+        if self.queued >= self.max_queue:
+            raise self._shed("queue_full", f"admission queue full ({self.queued})")
+        if self._store_queued.get(store_id, 0) >= self.store_max_queue:
+            raise self._shed("store_queue_full", f"{store_id} has {self.store_max_queue} questions queued", status=429)
+
+        service = self.service_time(store_id)
+        start = max(self._virtual_time, self._finish_tags.get(store_id, 0.0))
+        latest_start = deadline - service
+        if now + self._expected_wait(start) > latest_start:
+            raise self._shed("deadline", f"{store_id} cannot be answered within {timeout or ADMISSION_REQUEST_TIMEOUT:g}s")
+
+        self._finish_tags[store_id] = start + service / max(weight, 0.01)
+        waiter = _Waiter(store_id, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._heap, (start, next(self._counter), waiter))
+        self.queued += 1
+        self._store_queued[store_id] = self._store_queued.get(store_id, 0) + 1
+        self._update_gauges()
+
+        try:
+            mode = await asyncio.wait_for(asyncio.shield(waiter.future), max(0.0, latest_start - time.monotonic()))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted a slot just as we gave up on it
+                self._release_slot()
+            else:
+                self._dequeue(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise self._shed("expired", f"{store_id} waited past its deadline", retry_after=self.retry_after())
+
+        waited = time.monotonic() - waiter.queued_at
+        ADMISSION_WAIT_SECONDS.observe(waited)
+        record_timing("admission_wait", waited)
+        ADMISSION_EVENTS.inc(result="admitted" if mode == Mode.FULL else mode)
+        return Ticket(store_id, mode, slot=True, deadline=deadline)
+
+    def _unqueue(self, store_id: str) -> None:
+        self.queued -= 1
+        self._store_queued[store_id] -= 1
+        if not self._store_queued[store_id]:
+            del self._store_queued[store_id]
+
+    def _dequeue(self, waiter: _Waiter) -> None:
+        """Forget a waiter that gave up; its heap entry is skipped lazily"""
+        waiter.cancelled = True
+        self._unqueue(waiter.store_id)
+        self._update_gauges()
+
+    def _dispatch(self) -> None:
+        """Hand free slots to the lowest-tagged waiters"""
+        while self.active < self.max_concurrency and self._heap:
+            start, _, waiter = heapq.heappop(self._heap)
+            if waiter.cancelled:
+                continue
+            self._unqueue(waiter.store_id)
+            self._virtual_time = max(self._virtual_time, start)
+            self.active += 1
+            waiter.future.set_result(self.mode())
+
+        # Finish tags at or behind virtual time no longer affect anyone's order
+        for store_id in [s for s, tag in self._finish_tags.items() if tag <= self._virtual_time]:
+            if store_id not in self._store_queued:
+                del self._finish_tags[store_id]
+        self._update_gauges()
+
+    def _release_slot(self) -> None:
+        self.active -= 1
+        self._dispatch()
+
+    def release(self, ticket: Ticket) -> None:
+        """Return a ticket's slot and fold its run time into the service estimates"""
+        if not ticket.slot:
+            return
+        ticket.slot = False
+
+        if ticket.mode == Mode.FULL:
+            elapsed = time.monotonic() - ticket.started_at
+            previous = self._service_times.get(ticket.store_id, self._average_service)
+            self._service_times[ticket.store_id] = previous + SERVICE_TIME_ALPHA * (elapsed - previous)
+            self._average_service += SERVICE_TIME_ALPHA * (elapsed - self._average_service)
+
+        self._release_slot()
+
+    @asynccontextmanager
+    async def admit(
+        self, store_id: str, timeout: Optional[float] = None, weight: float = 1.0, interactive: bool = True
+    ) -> AsyncIterator[Ticket]:
+        """
+        `async with controller.admit(store) as ticket:` run the question in
+        `ticket.mode`. For `interactive` questions (a caller is waiting) the
+        block also sees the deadline through request_deadline().
+        """
+        ticket = await self.acquire(store_id, timeout, weight)
+        token = _DEADLINE.set(ticket.deadline if interactive else None)
+        try:
+            yield ticket
+        finally:
+            _DEADLINE.reset(token)
+            self.release(ticket)
+
+    @asynccontextmanager
+    async def admit_all(
+        self, store_id: str, count: int, timeout: Optional[float] = None, weight: float = 1.0
+    ) -> AsyncIterator[List[Union[Ticket, OverloadedError]]]:
+        """
+        Admit `count` questions of one batch, each queued as its own question.
+        Yields a Ticket or the OverloadedError that shed it per question; the
+        block runs by the earliest ticket's deadline and releases them all.
+        Keep `count` within max_concurrency: the batch holds its slots until
+        the block exits, so extra questions would only wait on the batch itself.
+        """
+        results = await asyncio.gather(
+            *(self.acquire(store_id, timeout, weight) for _ in range(count)), return_exceptions=True
+        )
+        tickets = [result for result in results if isinstance(result, Ticket)]
+        for result in results:
+            if isinstance(result, BaseException) and not isinstance(result, OverloadedError):
+                for ticket in tickets:
+                    self.release(ticket)
+                raise result
+
+        token = _DEADLINE.set(min((ticket.deadline for ticket in tickets), default=None))
+        try:
+            yield results
+        finally:
+            _DEADLINE.reset(token)
+            for ticket in tickets:
+                self.release(ticket)
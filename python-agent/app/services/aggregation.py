@@ -0,0 +1,648 @@
+import logging
+from dataclasses import dataclass, replace
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.shopifyql import (
+    COLUMN_ALIASES,
+    BinaryOp,
+    BoolOp,
+    Column,
+    Comparison,
+    Expr,
+    FuncCall,
+    Literal,
+    Not,
+    QueryPlan,
+    ShopifyQLSyntaxError,
+    Star,
+    aggregate_calls,
+    columns_in,
+    has_aggregate,
+    matches,
+    utc_now,
+)
+from app.services.metrics import ROWS_PROCESSED
+
+logger = logging.getLogger(__name__)
+
+# Rows buffered from consecutive pages before they are flattened together
+CHUNK_ROWS = 20000
+
+# Merge partial aggregates once this many chunks have accumulated
+COMPACT_EVERY = 16
+
+# Query column names mapped onto frame columns
+LINE_ITEM_ALIASES = {
+    "id": "line_item_id",
+    "product": "product_id",
+    "line_items.product_id": "product_id",
+    "title": "product_name",
+    "name": "product_name",
+    "product_title": "product_name",
+    "line_items.title": "product_name",
+    "line_items.name": "product_name",
+    "line_items.quantity": "quantity",
+    "line_items.price": "price",
+    "sales": "revenue",
+    "total_sales": "revenue",
+    "net_sales": "revenue",
+    "gross_sales": "revenue",
+}
+
+ORDER_ALIASES = {
+    "id": "order_id",
+    "sales": "total_price",
+    "total_sales": "total_price",
+    "order_total": "total_price",
+    "customer.id": "customer_id",
+}
+
+# Columns that only exist per line item; referencing one switches to the line item frame
+LINE_ITEM_COLUMNS = {
+    "product_id", "product", "product_title", "product_name", "title", "name", "sku",
+    "variant_id", "quantity", "price", "revenue", "line_items.product_id", "line_items.title",
+    "line_items.name", "line_items.quantity", "line_items.price",
+}
+
+DATE_BUCKETS = {"hour": "h", "day": "D", "date": "D", "week": "W", "month": "M", "quarter": "Q", "year": "Y"}
+
+AGGREGATE_FUNCS = {"sum": "sum", "count": "count", "avg": "mean", "average": "mean", "min": "min", "max": "max"}
+
+# Per-page partial aggregates for each function, and how partials merge
+PARTIALS = {
+    "sum": ("sum",),
+    "count": ("count",),
+    "mean": ("sum", "count"),
+    "min": ("min",),
+    "max": ("max",),
+    "first": ("first",),
+}
+COMBINE = {"sum": "sum", "count": "sum", "min": "min", "max": "max", "first": "first"}
+
+
+@dataclass
+class GroupKey:
+    name: str
+    expr: Expr
+
+
+@dataclass
+class Aggregate:
+    name: str
+    func: str  # sum | count | size | mean | min | max | first
+    expr: Optional[Expr] = None
+    hidden: bool = False
+
+
+# Frame column -> (0 = order, 1 = line item, source key)
+LINE_ITEM_SOURCES = {
+    "order_id": (0, "id"),
+    "created_at": (0, "created_at"),
+    "financial_status": (0, "financial_status"),
+    "line_item_id": (1, "id"),
+    "product_id": (1, "product_id"),
+    "variant_id": (1, "variant_id"),
+    "product_name": (1, "name"),
+    "sku": (1, "sku"),
+    "quantity": (1, "quantity"),
+    "price": (1, "price"),
+}
+
+ORDER_SOURCES = {
+    "order_id": "id",
+    "created_at": "created_at",
+    "financial_status": "financial_status",
+    "total_price": "total_price",
+}
+
+NUMERIC_COLUMNS = {
+    "order_id", "customer_id", "line_item_id", "product_id", "variant_id",
+    "quantity", "price", "total_price", "item_count",
+}
+
+
+def _customer_id(order: Dict[str, Any]) -> Any:
+    return (order.get("customer") or {}).get("id", order.get("customer_id"))
+
+
+def _numeric(values: List[Any]) -> np.ndarray:
+    """float64 array from JSON numbers or numeric strings (None -> NaN)"""
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(np.float64)
+
+
+def _build_frame(data: Dict[str, List[Any]], length: int) -> pd.DataFrame:
+    columns = {}
+    for name, values in data.items():
+        if name in NUMERIC_COLUMNS:
+            columns[name] = _numeric(values)
+        elif name in ("created_at", "updated_at"):
+            columns[name] = _to_timestamps(pd.Series(values, dtype=object))
+        else:
+            columns[name] = pd.Series(values, dtype=object)
+    # Keep the row count even when no columns are needed (COUNT(*))
+    return pd.DataFrame(columns, index=pd.RangeIndex(length))
+
+
+def _line_items_frame(
+    orders: List[Dict[str, Any]],
+    needed: Set[str],
+    keep: Optional[Callable[[Dict], bool]] = None
+) -> pd.DataFrame:
+    """One row per line item (those `keep` accepts), carrying only the columns the plan reads"""
+    nested = [order.get("line_items") or () for order in orders]
+    if keep is not None:
+        nested = [[item for item in order_items if keep(item)] for order_items in nested]
+    items = [item for order_items in nested for item in order_items]
+    counts = np.fromiter((len(order_items) for order_items in nested), dtype=np.int64, count=len(nested))
+
+    def order_column(values: List[Any]) -> List[Any]:
+        # Repeat each order-level value once per line item
+        return np.repeat(np.array(values, dtype=object), counts).tolist()
+
+    data: Dict[str, List[Any]] = {}
+    for name in needed | {"quantity", "price"} if "revenue" in needed else needed:
+        if name == "customer_id":
+            data[name] = order_column([_customer_id(order) for order in orders])
+        elif name in LINE_ITEM_SOURCES:
+            source, key = LINE_ITEM_SOURCES[name]
+            if source == 0:
+                data[name] = order_column([order.get(key) for order in orders])
+            else:
+                data[name] = [item.get(key) for item in items]
+
+    frame = _build_frame(data, len(items))
+    if "revenue" in needed:
+        frame["revenue"] = np.nan_to_num(frame["price"].to_numpy()) * np.nan_to_num(frame["quantity"].to_numpy())
+    return frame
+
+
+def _orders_frame(orders: List[Dict[str, Any]], needed: Set[str]) -> pd.DataFrame:
+    data: Dict[str, List[Any]] = {}
+    for name in needed:
+        if name == "customer_id":
+            data[name] = [_customer_id(order) for order in orders]
+        elif name == "item_count":
+            data[name] = [len(order.get("line_items") or ()) for order in orders]
+        else:
+            key = ORDER_SOURCES.get(name, name)
+            data[name] = [order.get(key) for order in orders]
+    return _build_frame(data, len(orders))
+
+
+def _records_frame(rows: List[Dict[str, Any]], needed: Set[str]) -> pd.DataFrame:
+    data = {name: [row.get(name) for row in rows] for name in needed}
+    frame = pd.DataFrame(
+        {name: pd.Series(values, dtype=object) for name, values in data.items()},
+        index=pd.RangeIndex(len(rows))
+    )
+    for name in ("created_at", "updated_at"):
+        if name in frame:
+            frame[name] = _to_timestamps(frame[name])
+    return frame
+
+
+def _to_timestamps(values: pd.Series) -> pd.Series:
+    """Parse ISO timestamps (mixed offsets allowed) into naive UTC"""
+    return pd.to_datetime(values, utc=True, errors="coerce", format="ISO8601").dt.tz_convert(None)
+
+
+class AggregationEngine:
+    """
+    Vectorised GROUP BY / aggregate / ORDER BY / LIMIT over streamed pages.
+
+    Each page is flattened once into a typed frame and reduced to partial
+    aggregates (sum, count, min, max, first) per group, so memory is bounded
+    by the number of groups rather than the number of rows. Partials are
+    merged at the end, where AVG is derived from sum and count. HAVING is
+    evaluated on the merged groups, before ORDER BY and LIMIT.
+    """
+
+    def __init__(self, plan: QueryPlan):
+        self.plan = plan
+        self.level = self._level()
+        self.aliases = self._aliases()
+        self.keys = self._group_keys()
+        self.aggregates = self._aggregates()
+        self.needed = self._needed_columns()
+        self.having = self._having(self.plan.query.having)
+        self._partials: List[pd.DataFrame] = []
+        self._buffer: List[Dict[str, Any]] = []
+
+    # Planning
+
+    def _level(self) -> str:
+        if self.plan.domain != "orders":
+            return "records"
+        query = self.plan.query
+        referenced = set(
+            columns_in(query.select) + columns_in(query.group_by)
+            + columns_in(aggregate_calls(query.having)) + columns_in(query.order_by)
+        )
+        if query.table == "line_items" or referenced & LINE_ITEM_COLUMNS:
+            return "line_items"
+        return "orders"
+
+    def _aliases(self) -> Dict[str, str]:
+        if self.level == "line_items":
+            return LINE_ITEM_ALIASES
+        if self.level == "orders":
+            return ORDER_ALIASES
+        return COLUMN_ALIASES.get(self.plan.domain, {})
+
+    def _canonical(self, name: str) -> str:
+        return self.aliases.get(name, name)
+
+    def _group_keys(self) -> List[GroupKey]:
+        select = [item for item in self.plan.query.select if item.alias]
+        aliased = {item.alias: item.expr for item in select}
+
+        keys = []
+        for expr in self.plan.query.group_by:
+            # GROUP BY may name a SELECT alias
+            if isinstance(expr, Column) and expr.name in aliased:
+                expr = aliased[expr.name]
+            alias = next((item.alias for item in select if item.expr == expr), None)
+            keys.append(GroupKey(alias or self._key_name(expr), expr))
+        return keys
+
+    def _key_name(self, expr: Expr) -> str:
+        if isinstance(expr, Column):
+            return expr.name if expr.name in DATE_BUCKETS else self._canonical(expr.name)
+        if isinstance(expr, FuncCall):
+            unit = self._bucket_unit(expr)
+            if unit:
+                return unit
+            return f"{expr.name}_{'_'.join(columns_in(expr)) or 'value'}"
+        return "_".join(columns_in(expr)) or "value"
+
+    def _aggregate_name(self, func: str, expr: Optional[Expr]) -> str:
+        if expr is None:
+            return "count"
+        names = "_".join(self._canonical(name) for name in columns_in(expr)) or "value"
+        if self.level == "line_items" and names in ("price_quantity", "quantity_price", "revenue"):
+            names = "revenue"
+        prefix = {"sum": "total", "mean": "avg", "size": "count"}.get(func, func)
+        return f"{prefix}_{names}"
+
+    def _aggregates(self) -> List[Aggregate]:
+        query = self.plan.query
+        aggregates: List[Aggregate] = []
+
+        key_exprs = [key.expr for key in self.keys]
+        for item in query.select:
+            if has_aggregate(item.expr) and isinstance(item.expr, FuncCall):
+                aggregates.append(self._aggregate(item.expr, item.alias))
+            elif self.keys and isinstance(item.expr, Column) and item.expr not in key_exprs:
+                # ShopifyQL "SHOW total_sales BY product_title" sums bare metrics
+                aggregates.append(self._aggregate(FuncCall("sum", [item.expr]), item.alias or item.expr.name))
+
+        if not aggregates:
+            # Default metrics when the query only says what to group by
+            if self.level == "line_items":
+                aggregates = [
+                    Aggregate("total_quantity", "sum", Column("quantity")),
+                    Aggregate("total_revenue", "sum", Column("revenue")),
+                ]
+            elif self.level == "orders":
+                aggregates = [
+                    Aggregate("order_count", "size"),
+                    Aggregate("total_sales", "sum", Column("total_price")),
+                ]
+            else:
+                aggregates = [Aggregate("count", "size")]
+
+        # Product groups carry a display name alongside the id
+        key_names = {key.name for key in self.keys}
+        if self.level == "line_items" and "product_id" in key_names and "product_name" not in key_names:
+            aggregates.insert(0, Aggregate("product_name", "first", Column("product_name")))
+
+        # Aggregates only HAVING or ORDER BY use are computed but not returned
+        calls = aggregate_calls(query.having)
+        calls += [item.expr for item in query.order_by if isinstance(item.expr, FuncCall) and has_aggregate(item.expr)]
+        for call in calls:
+            if self._find_aggregate(call, aggregates) is None:
+                aggregate = self._aggregate(call, None)
+                aggregate.hidden = True
+                aggregates.append(aggregate)
+
+        return aggregates
+
+    def _aggregate(self, call: FuncCall, alias: Optional[str]) -> Aggregate:
+        func = AGGREGATE_FUNCS.get(call.name, "sum")
+        arg = call.args[0] if call.args else None
+        if isinstance(arg, Star) or arg is None:
+            return Aggregate(alias or "count", "size")
+        if self.level == "line_items" and self._is_revenue(arg):
+            arg = Column("revenue")
+        return Aggregate(alias or self._aggregate_name(func, arg), func, arg)
+
+    def _is_revenue(self, expr: Expr) -> bool:
+        """price * quantity and sales aliases all mean line revenue"""
+        if isinstance(expr, BinaryOp) and expr.op == "*":
+            return {self._canonical(n) for n in columns_in(expr)} == {"price", "quantity"}
+        return isinstance(expr, Column) and self._canonical(expr.name) == "revenue"
+
+    def _find_aggregate(self, call: FuncCall, aggregates: List[Aggregate]) -> Optional[Aggregate]:
+        candidate = self._aggregate(call, None)
+        for aggregate in aggregates:
+            if aggregate.func == candidate.func and aggregate.expr == candidate.expr:
+                return aggregate
+        return None
+
+    def _having(self, node: Any) -> Any:
+        """HAVING with aggregates, group keys and aliases rewritten as output columns"""
+        if node is None or isinstance(node, (Literal, Star)):
+            return node
+        if isinstance(node, (list, tuple)):
+            return type(node)(self._having(item) for item in node)
+        if isinstance(node, Comparison):
+            return replace(node, left=self._having(node.left), right=self._having(node.right))
+        if isinstance(node, BoolOp):
+            return replace(node, conditions=[self._having(c) for c in node.conditions])
+        if isinstance(node, Not):
+            return replace(node, condition=self._having(node.condition))
+
+        if isinstance(node, FuncCall) and node.name in AGGREGATE_FUNCS:
+            aggregate = self._find_aggregate(node, self.aggregates)
+            if aggregate is not None:
+                return Column(aggregate.name)
+        for key in self.keys:
+            if key.expr == node:
+                return Column(key.name)
+        if isinstance(node, Column):
+            names = {key.name for key in self.keys} | {a.name for a in self.aggregates}
+            for name in (node.name, self._canonical(node.name), f"total_{self._canonical(node.name)}"):
+                if name in names:
+                    return Column(name)
+            raise ShopifyQLSyntaxError(f"HAVING column {node.name} is neither grouped nor aggregated")
+        if isinstance(node, BinaryOp):
+            return replace(node, left=self._having(node.left), right=self._having(node.right))
+        return node
+
+    def _needed_columns(self) -> Set[str]:
+        """Frame columns referenced by group keys and aggregates"""
+        exprs = [key.expr for key in self.keys] + [a.expr for a in self.aggregates if a.expr is not None]
+        needed = {self._canonical(name) for name in columns_in(exprs)}
+        if any(key.name in DATE_BUCKETS or self._key_name(key.expr) in DATE_BUCKETS for key in self.keys):
+            needed.add("created_at")
+        return needed - set(DATE_BUCKETS)
+
+    # Evaluation
+
+    @staticmethod
+    def _bucket_unit(expr: FuncCall) -> Optional[str]:
+        if expr.name == "date_trunc" and expr.args and isinstance(expr.args[0], Literal):
+            unit = str(expr.args[0].value).lower()
+            return unit if unit in DATE_BUCKETS else None
+        return expr.name if expr.name in DATE_BUCKETS else None
+
+    def _series(self, expr: Expr, frame: pd.DataFrame) -> Any:
+        if isinstance(expr, Literal):
+            return expr.value
+        if isinstance(expr, Column):
+            if expr.name in DATE_BUCKETS and expr.name not in frame:
+                return self._bucket(frame.get("created_at"), expr.name, frame)
+            name = self._canonical(expr.name)
+            if name in frame:
+                return frame[name]
+            return pd.Series(np.nan, index=frame.index)
+        if isinstance(expr, BinaryOp):
+            left, right = self._series(expr.left, frame), self._series(expr.right, frame)
+            left = pd.to_numeric(left, errors="coerce") if isinstance(left, pd.Series) else left
+            right = pd.to_numeric(right, errors="coerce") if isinstance(right, pd.Series) else right
+            if expr.op == "+":
+                return left + right
+            if expr.op == "-":
+                return left - right
+            if expr.op == "*":
+                return left * right
+            return left / right
+        if isinstance(expr, FuncCall):
+            unit = self._bucket_unit(expr)
+            if unit:
+                source = expr.args[-1] if expr.args else Column("created_at")
+                return self._bucket(self._series(source, frame), unit, frame)
+            if expr.name in ("lower", "upper") and expr.args:
+                return getattr(self._series(expr.args[0], frame).astype(str).str, expr.name)()
+        raise ValueError(f"Unsupported expression in aggregation: {expr}")
+
+    @staticmethod
+    def _bucket(values: Optional[pd.Series], unit: str, frame: pd.DataFrame) -> pd.Series:
+        if values is None:
+            return pd.Series(pd.NaT, index=frame.index)
+        if not pd.api.types.is_datetime64_any_dtype(values):
+            values = _to_timestamps(values)
+        freq = DATE_BUCKETS[unit]
+        if freq in ("h", "D"):
+            return values.dt.floor(freq)
+        return values.dt.to_period(freq).dt.start_time
+
+    def _frame(self, rows: List[Dict[str, Any]]) -> pd.DataFrame:
+        if self.level == "line_items":
+            # WHERE conditions on line item columns filter the exploded items, not just their orders
+            keep = self.plan.matches_line_item if self.plan.line_item_conjuncts else None
+            return _line_items_frame(rows, self.needed, keep)
+        if self.level == "orders":
+            return _orders_frame(rows, self.needed)
+        return _records_frame(rows, self.needed)
+
+    def _partial(self, frame: pd.DataFrame, weights: Optional[pd.Series] = None) -> Optional[pd.DataFrame]:
+        """
+        Reduce one page to partial aggregates per group.
+
+        With `weights`, each frame row is itself a pre-aggregated rollup row
+        standing for that many source rows: metric columns hold sums and
+        counts come from the weights.
+        """
+        if not len(frame.index):
+            return None
+
+        work = pd.DataFrame(index=frame.index)
+        key_columns = []
+        for i, key in enumerate(self.keys):
+            work[f"k{i}"] = self._series(key.expr, frame)
+            key_columns.append(f"k{i}")
+        if not key_columns:
+            work["k_all"] = 0
+            key_columns = ["k_all"]
+
+        specs: Dict[str, Tuple[str, str]] = {}
+        for i, aggregate in enumerate(self.aggregates):
+            if aggregate.func == "size" or (weights is not None and aggregate.func == "count"):
+                work[f"v{i}"] = 1 if weights is None else weights
+                specs[f"{'sum' if aggregate.func == 'size' else 'count'}_{i}"] = (f"v{i}", "sum")
+                continue
+
+            values = self._series(aggregate.expr, frame)
+            if not isinstance(values, pd.Series):
+                values = pd.Series(values, index=frame.index)
+            if aggregate.func in ("sum", "mean"):
+                values = pd.to_numeric(values, errors="coerce")
+            work[f"v{i}"] = values
+
+            if weights is not None and aggregate.func == "mean":
+                work[f"w{i}"] = weights
+                specs[f"sum_{i}"] = (f"v{i}", "sum")
+                specs[f"count_{i}"] = (f"w{i}", "sum")
+                continue
+
+            for part in PARTIALS[aggregate.func]:
+                specs[f"{part}_{i}"] = (f"v{i}", part)
+
+        return work.groupby(key_columns, dropna=False, sort=False).agg(**specs)
+
+    @staticmethod
+    def _combine(partials: List[pd.DataFrame]) -> pd.DataFrame:
+        merged = pd.concat(partials)
+        how = {column: COMBINE[column.split("_")[0]] for column in merged.columns}
+        return merged.groupby(level=list(range(merged.index.nlevels)), dropna=False, sort=False).agg(how)
+
+    def _flush(self) -> None:
+        if self._buffer:
+            partial = self._partial(self._frame(self._buffer))
+            self._buffer = []
+            if partial is not None:
+                self._partials.append(partial)
+        if len(self._partials) >= COMPACT_EVERY:
+            self._partials = [self._combine(self._partials)]
+
+    def rollup_compatible(self, columns: Set[str], dimensions: Set[str] = frozenset()) -> bool:
+        """
+        Whether pre-aggregated rows with these columns can answer the plan.
+        `dimensions` are the rollup's bucket keys: they can be grouped, filtered
+        and counted, but one row stands for many records, so summing or
+        averaging them needs the raw rows.
+        """
+        if any(aggregate.func in ("min", "max") for aggregate in self.aggregates):
+            return False
+        for aggregate in self.aggregates:
+            if aggregate.expr is None or aggregate.func in ("count", "size"):
+                continue
+            if {self._canonical(name) for name in columns_in(aggregate.expr)} & dimensions:
+                return False
+        for key in self.keys:
+            # Rollups are daily, so finer buckets need the raw rows
+            if key.name == "hour" or self._key_name(key.expr) == "hour":
+                return False
+        return self.needed <= columns
+
+    def add_rollup(self, frame: pd.DataFrame, weights: pd.Series) -> None:
+        """Fold pre-aggregated rows (see `_partial`) into the running aggregates"""
+        partial = self._partial(frame, weights)
+        if partial is not None:
+            self._partials.append(partial)
+        if len(self._partials) >= COMPACT_EVERY:
+            self._partials = [self._combine(self._partials)]
+
+    def add_page(self, rows: List[Dict[str, Any]]) -> None:
+        """Fold a page of REST-shaped rows into the running aggregates"""
+        self._buffer.extend(rows)
+        if len(self._buffer) >= CHUNK_ROWS:
+            self._flush()
+
+    def result(self) -> List[Dict[str, Any]]:
+        """Final aggregates with ORDER BY and LIMIT applied"""
+        self._flush()
+        if not self._partials:
+            return []
+
+        combined = self._combine(self._partials)
+        output = pd.DataFrame(index=combined.index)
+
+        for i, aggregate in enumerate(self.aggregates):
+            if aggregate.func == "mean":
+                output[aggregate.name] = combined[f"sum_{i}"] / combined[f"count_{i}"].replace(0, np.nan)
+            elif aggregate.func == "size":
+                output[aggregate.name] = combined[f"sum_{i}"]
+            else:
+                output[aggregate.name] = combined[f"{aggregate.func}_{i}"]
+
+        output = output.reset_index()
+        if self.keys:
+            output = output.rename(columns={f"k{i}": key.name for i, key in enumerate(self.keys)})
+            output = output[[key.name for key in self.keys] + [a.name for a in self.aggregates]]
+        else:
+            output = output.drop(columns=["k_all"])
+
+        if self.having is not None and not output.empty:
+            now = utc_now()
+            keep = [matches(self.having, row, now) for row in output.to_dict("records")]
+            output = output[pd.Series(keep, index=output.index, dtype=bool)]
+
+        output = self._order(output)
+        if self.plan.limit:
+            output = output.head(self.plan.limit)
+
+        hidden = [a.name for a in self.aggregates if a.hidden]
+        return _records(output.drop(columns=hidden))
+
+    def _order(self, output: pd.DataFrame) -> pd.DataFrame:
+        by, ascending = [], []
+        for item in self.plan.query.order_by:
+            column = self._order_column(item.expr, output)
+            if column is not None:
+                by.append(column)
+                ascending.append(not item.descending)
+
+        if not by and self.plan.query.order_by:
+            # Fall back to the quantity/revenue heuristic for unrecognised sort keys
+            metric, descending = self.plan.sort_metric
+            if metric in output:
+                by, ascending = [metric], [not descending]
+
+        if not by:
+            return output
+        return output.sort_values(by=by, ascending=ascending, kind="mergesort", na_position="last")
+
+    def _order_column(self, expr: Expr, output: pd.DataFrame) -> Optional[str]:
+        if isinstance(expr, FuncCall) and has_aggregate(expr):
+            aggregate = self._find_aggregate(expr, self.aggregates)
+            return aggregate.name if aggregate else None
+        for key in self.keys:
+            if key.expr == expr:
+                return key.name
+        if isinstance(expr, Column):
+            for name in (expr.name, self._canonical(expr.name), f"total_{self._canonical(expr.name)}"):
+                if name in output:
+                    return name
+        return None
+
+
+def _records(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    """DataFrame -> JSON-friendly list of dicts"""
+    for column in frame.columns:
+        if column.endswith("id") and pd.api.types.is_float_dtype(frame[column]):
+            frame[column] = frame[column].astype("Int64")
+        elif pd.api.types.is_datetime64_any_dtype(frame[column]):
+            frame[column] = frame[column].dt.strftime("%Y-%m-%dT%H:%M:%S").where(frame[column].notna(), None)
+        elif pd.api.types.is_float_dtype(frame[column]):
+            frame[column] = frame[column].round(2)
+    frame = frame.astype(object).where(frame.notna(), None)
+    return frame.to_dict("records")
+
+
+async def aggregate_pages(
+    pages: AsyncIterator[List[Dict[str, Any]]],
+    plan: QueryPlan,
+    predicate: Optional[Callable[[Dict], bool]] = None
+) -> List[Dict[str, Any]]:
+    """Run a plan's aggregation over a page stream"""
+    engine = AggregationEngine(plan)
+
+    try:
+        async for page in pages:
+            ROWS_PROCESSED.inc(len(page), operation="aggregate")
+            if predicate is not None:
+                page = [row for row in page if predicate(row)]
+            if page:
+                engine.add_page(page)
+    finally:
+        await pages.aclose()
+
+    return engine.result()
@@ -0,0 +1,271 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, IO, List, Optional, TYPE_CHECKING
+from urllib.parse import urlparse
+
+if TYPE_CHECKING:
+    from app.services.shopify_service import ShopifyService
+
+logger = logging.getLogger(__name__)
+
+# Rows per page handed to the aggregators
+BULK_PAGE_SIZE = int(os.getenv("SHOPIFY_BULK_PAGE_SIZE", "1000"))
+BULK_POLL_INTERVAL = float(os.getenv("SHOPIFY_BULK_POLL_INTERVAL", "2"))
+BULK_POLL_TIMEOUT = float(os.getenv("SHOPIFY_BULK_POLL_TIMEOUT", "600"))
+# Time kept back from a waiting request's deadline to download, aggregate and explain the result
+BULK_DEADLINE_HEADROOM = float(os.getenv("SHOPIFY_BULK_DEADLINE_HEADROOM", "5"))
+
+BULK_ORDERS_QUERY = """
+{
+  orders(query: "%(search)s") {
+    edges {
+      node {
+        id
+        name
+        createdAt
+        displayFinancialStatus
+        totalPriceSet { shopMoney { amount } }
+        lineItems {
+          edges {
+            node {
+              id
+              name
+              quantity
+              product { id }
+              originalUnitPriceSet { shopMoney { amount } }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+RUN_MUTATION = """
+mutation bulkOperationRunQuery($query: String!) {
+  bulkOperationRunQuery(query: $query) {
+    bulkOperation { id status }
+    userErrors { field message }
+  }
+}
+"""
+
+CANCEL_MUTATION = """
+mutation bulkOperationCancel($id: ID!) {
+  bulkOperationCancel(id: $id) {
+    bulkOperation { id status }
+    userErrors { field message }
+  }
+}
+"""
+
+CURRENT_OPERATION_QUERY = """
+{
+  currentBulkOperation {
+    id
+    status
+    errorCode
+    objectCount
+    url
+  }
+}
+"""
+
+
+class BulkOperationError(Exception):
+    """Raised when a bulk operation cannot be started or does not complete"""
+
+
+class BulkOperationTimeout(Exception):
+    """Raised when a bulk export cannot finish before the waiting request's deadline"""
+
+
+def _legacy_id(gid: Optional[str]) -> Optional[int]:
+    """gid://shopify/Order/123 -> 123"""
+    if not gid:
+        return None
+    try:
+        return int(gid.rsplit("/", 1)[-1])
+    except ValueError:
+        return None
+
+
+def _money(value: Optional[Dict]) -> str:
+    return ((value or {}).get("shopMoney") or {}).get("amount", "0")
+
+
+def _to_rest_order(node: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a GraphQL order row onto the REST order shape used by the processors"""
+    return {
+        "id": _legacy_id(node.get("id")),
+        "name": node.get("name"),
+        "created_at": node.get("createdAt"),
+        "financial_status": (node.get("displayFinancialStatus") or "").lower() or None,
+        "total_price": _money(node.get("totalPriceSet")),
+        "line_items": []
+    }
+
+
+def _to_rest_line_item(node: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a GraphQL line item row onto the REST line item shape"""
+    return {
+        "id": _legacy_id(node.get("id")),
+        "product_id": _legacy_id((node.get("product") or {}).get("id")),
+        "name": node.get("name"),
+        "quantity": node.get("quantity", 0),
+        "price": _money(node.get("originalUnitPriceSet"))
+    }
+
+
+async def _iter_file_lines(path: str) -> AsyncIterator[str]:
+    """Read a local JSONL file line by line without blocking the event loop"""
+    fh: IO[str] = await asyncio.to_thread(open, path, "r", encoding="utf-8")
+    try:
+        while True:
+            lines = await asyncio.to_thread(fh.readlines, 1 << 16)
+            if not lines:
+                break
+            for line in lines:
+                yield line
+    finally:
+        await asyncio.to_thread(fh.close)
+
+
+async def iter_bulk_orders(
+    source: str,
+    service: Optional["ShopifyService"] = None,
+    page_size: int = BULK_PAGE_SIZE
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Stream a bulk operation JSONL result as pages of REST-shaped orders.
+
+    `source` is the signed result URL or a local path / file:// URL. Bulk
+    output lists each child row (`__parentId`) after its parent, so an order
+    is complete as soon as the next top-level row starts and only one order
+    is held in memory at a time.
+    """
+    parsed = urlparse(source)
+    if parsed.scheme in ("http", "https"):
+        if service is None:
+            raise ValueError("A ShopifyService is required to download bulk results over HTTP")
+        lines = service.stream_lines(source)
+    else:
+        lines = _iter_file_lines(parsed.path if parsed.scheme == "file" else source)
+
+    page: List[Dict[str, Any]] = []
+    current: Optional[Dict[str, Any]] = None
+    current_gid: Optional[str] = None
+
+    async for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        row = json.loads(line)
+        parent_gid = row.get("__parentId")
+
+        if parent_gid is None:
+            if current is not None:
+                page.append(current)
+                if len(page) >= page_size:
+                    yield page
+                    page = []
+            current = _to_rest_order(row)
+            current_gid = row.get("id")
+        elif parent_gid == current_gid:
+            current["line_items"].append(_to_rest_line_item(row))
+        else:
+            logger.warning(f"Skipping bulk row with unknown parent {parent_gid}")
+
+    if current is not None:
+        page.append(current)
+    if page:
+        yield page
+
+
+class BulkOperationRunner:
+    """Submits a Shopify GraphQL bulk query and waits for its result file"""
+
+    def __init__(self, service: "ShopifyService"):
+        self.service = service
+
+    @staticmethod
+    def build_orders_query(params: Dict[str, Any]) -> str:
+        """Translate REST order filters into a bulk orders query"""
+        terms = []
+        if params.get("created_at_min"):
+            terms.append(f"created_at:>='{params['created_at_min']}'")
+        if params.get("created_at_max"):
+            terms.append(f"created_at:<='{params['created_at_max']}'")
+        if params.get("status") and params["status"] != "any":
+            terms.append(f"status:{params['status']}")
+
+        return BULK_ORDERS_QUERY % {"search": " AND ".join(terms).replace('"', '\\"')}
+
+    async def submit(self, bulk_query: str) -> str:
+        """Start a bulk operation and return its id"""
+        data = await self.service.graphql(RUN_MUTATION, {"query": bulk_query})
+        payload = data.get("bulkOperationRunQuery") or {}
+
+        errors = payload.get("userErrors") or []
+        if errors:
+            raise BulkOperationError("; ".join(e.get("message", "") for e in errors))
+
+        operation = payload.get("bulkOperation") or {}
+        logger.info(f"Started bulk operation {operation.get('id')} for {self.service.store_id}")
+        return operation.get("id")
+
+    async def cancel(self, operation_id: str) -> None:
+        """Best-effort cancel, so the shop's single bulk slot is not held by an abandoned export"""
+        try:
+            data = await self.service.graphql(CANCEL_MUTATION, {"id": operation_id})
+            errors = (data.get("bulkOperationCancel") or {}).get("userErrors") or []
+            if errors:
+                logger.warning(f"Could not cancel bulk operation {operation_id}: {errors[0].get('message')}")
+        except Exception as e:
+            logger.warning(f"Could not cancel bulk operation {operation_id}: {str(e)}")
+
+    async def wait(self, operation_id: str, deadline: Optional[float] = None) -> Optional[str]:
+        """
+        Poll until the operation finishes; returns the result URL (None if empty).
+
+        `deadline` (time.monotonic()) is when a waiting request needs its
+        answer. Polling stops BULK_DEADLINE_HEADROOM before it, cancels the
+        operation and raises BulkOperationTimeout, instead of holding the
+        request for up to BULK_POLL_TIMEOUT; without one (jobs, sync) the
+        full timeout applies.
+        """
+        limit = time.monotonic() + BULK_POLL_TIMEOUT
+        capped = deadline is not None and deadline - BULK_DEADLINE_HEADROOM < limit
+        if capped:
+            limit = deadline - BULK_DEADLINE_HEADROOM
+
+        while time.monotonic() < limit:
+            data = await self.service.graphql(CURRENT_OPERATION_QUERY)
+            operation = data.get("currentBulkOperation") or {}
+
+            if operation.get("id") != operation_id:
+                raise BulkOperationError(f"Bulk operation {operation_id} is no longer current")
+
+            status = operation.get("status")
+            if status == "COMPLETED":
+                logger.info(f"Bulk operation {operation_id} completed with {operation.get('objectCount')} objects")
+                return operation.get("url")
+            if status in ("FAILED", "CANCELED", "EXPIRED"):
+                raise BulkOperationError(
+                    f"Bulk operation {operation_id} {status.lower()}: {operation.get('errorCode')}"
+                )
+
+            await asyncio.sleep(max(0.0, min(BULK_POLL_INTERVAL, limit - time.monotonic())))
+
+        if capped:
+            await self.cancel(operation_id)
+            raise BulkOperationTimeout(
+                "This question scans too many orders to answer within the request timeout; "
+                "submit it to /api/jobs instead"
+            )
+        raise BulkOperationError(f"Bulk operation {operation_id} timed out")
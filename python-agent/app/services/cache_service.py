@@ -1,71 +1,484 @@
-import redis
+import os
 import json
+import time
+import zlib
+import hashlib
+import fnmatch
+import asyncio
 import logging
-from typing import Any, Optional
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import redis.asyncio as redis
+
+from app.services.singleflight import DistributedSingleFlight, MISSING
+from app.services.shopifyql import utc_now
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:  # pragma: no cover - json fallback
+    msgpack = None
+    MSGPACK_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+
+# In-process L1 tier, bounded by encoded size
+CACHE_L1_MAX_BYTES = int(os.getenv("CACHE_L1_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_L1_MAX_ENTRIES = int(os.getenv("CACHE_L1_MAX_ENTRIES", "10000"))
+# L1 entries expire sooner than Redis so workers converge on fresh values
+CACHE_L1_TTL = int(os.getenv("CACHE_L1_TTL", "60"))
+
+# Payloads at least this large are zlib-compressed before storing
+CACHE_COMPRESS_MIN_BYTES = int(os.getenv("CACHE_COMPRESS_MIN_BYTES", "1024"))
+
+# Cross-worker recompute lock, and how long other workers wait on it
+CACHE_LOCK_TTL = float(os.getenv("CACHE_LOCK_TTL", "30"))
+CACHE_LOCK_POLL_INTERVAL = 0.05
+
+# Result keys are q:<store>:<domain>:<namespace>:<digest>; the namespace
+# embeds per-store and per-store-domain generation counters, so bumping a
+# counter orphans every older key at once
+KEY_PREFIX = "q"
+NAMESPACE_PREFIX = "ns"
+# How long a worker trusts its copy of a generation counter
+CACHE_NAMESPACE_TTL = float(os.getenv("CACHE_NAMESPACE_TTL", "1"))
+# Result lifetime, and the longer one for stores whose changes arrive by
+# webhook (each webhook bumps the affected namespace, so nothing goes stale)
+CACHE_RESULT_TTL = int(os.getenv("CACHE_RESULT_TTL", "300"))
+CACHE_WEBHOOK_RESULT_TTL = int(os.getenv("CACHE_WEBHOOK_RESULT_TTL", "3600"))
+# Shortest result lifetime, for results written just before midnight
+CACHE_MIN_RESULT_TTL = int(os.getenv("CACHE_MIN_RESULT_TTL", "5"))
+# A store counts as webhook-backed for this long after its last verified webhook
+WEBHOOK_COVERAGE_TTL = int(os.getenv("WEBHOOK_COVERAGE_TTL", str(7 * 86400)))
+WEBHOOK_PREFIX = "wh"
+# Background sweep for keys orphaned by invalidation (0 disables)
+CACHE_GC_INTERVAL = int(os.getenv("CACHE_GC_INTERVAL", "600"))
+CACHE_SCAN_COUNT = 500
+
+# First byte of every stored payload: encoding, plus a compression flag
+FORMAT_JSON = 0x01
+FORMAT_MSGPACK = 0x02
+FLAG_COMPRESSED = 0x80
+
+_MISSING = MISSING
+
+
+def _default(value: Any) -> Any:
+    """Fallback encoder for dates, decimals and other non-native values"""
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def encode(value: Any) -> bytes:
+    """Serialise a value (msgpack when available), compressing large payloads"""
+    if MSGPACK_AVAILABLE:
+        fmt, body = FORMAT_MSGPACK, msgpack.packb(value, default=_default, use_bin_type=True)
+    else:
+        fmt, body = FORMAT_JSON, json.dumps(value, default=_default, separators=(",", ":")).encode()
+
+    if len(body) >= CACHE_COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(body, 1)
+        if len(compressed) < len(body):
+            fmt, body = fmt | FLAG_COMPRESSED, compressed
+
+    return bytes([fmt]) + body
+
+
+def decode(payload: bytes) -> Any:
+    fmt, body = payload[0], payload[1:]
+    if fmt & FLAG_COMPRESSED:
+        body = zlib.decompress(body)
+        fmt &= ~FLAG_COMPRESSED
+
+    if fmt == FORMAT_MSGPACK:
+        if not MSGPACK_AVAILABLE:
+            raise ValueError("Cached payload needs msgpack, which is not installed")
+        return msgpack.unpackb(body, raw=False)
+    if fmt == FORMAT_JSON:
+        return json.loads(body)
+    raise ValueError(f"Unknown cache payload format {fmt:#x}")
+
+
+class LRUCache:
+    """
+    In-process LRU of encoded payloads with per-entry expiry.
+
+    Values are kept encoded so hits hand out fresh copies and the byte bound
+    reflects what is actually held.
+    """
+
+    def __init__(self, max_bytes: int = CACHE_L1_MAX_BYTES, max_entries: int = CACHE_L1_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.size = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, payload = entry
+        if expires_at <= time.monotonic():
+            self.delete(key)
+            return None
+        self._entries.move_to_end(key)
+        return payload
+
+    def set(self, key: str, payload: bytes, ttl: float) -> None:
+        if len(payload) > self.max_bytes:
+            return
+        self.delete(key)
+        self._entries[key] = (time.monotonic() + ttl, payload)
+        self.size += len(payload)
+
+        while self.size > self.max_bytes or len(self._entries) > self.max_entries:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def delete_matching(self, pattern: str) -> int:
+        """Drop entries whose key matches a Redis-style glob"""
+        keys = [key for key in self._entries if fnmatch.fnmatchcase(key, pattern)]
+        for key in keys:
+            self.delete(key)
+        return len(keys)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size = 0
+
+
 class CacheService:
-    """Redis-based caching service for Shopify API responses"""
-    
-    def __init__(self, redis_url: str = "redis://localhost:6379/0"):
+    """
+    Two-tier cache for Shopify results: an in-process LRU (L1) in front of
+    Redis (L2).
+
+    `get_or_set` adds stampede protection: concurrent callers in this process
+    share one computation, and across workers a short Redis lock lets one
+    worker recompute while the others wait for its result.
+
+    Result keys from `make_key` are versioned by store and domain, so
+    `invalidate` is a single INCR; the orphaned keys expire on their own or
+    are swept by `collect_garbage`.
+    """
+
+    def __init__(self, redis_url: str = REDIS_URL, l1: Optional[LRUCache] = None):
+        self.redis_url = redis_url
+        self.redis_client: Optional[redis.Redis] = None
+        self.l1 = l1 or LRUCache()
+        # Coalesces misses per key, in-process and across workers via a Redis lock
+        self._flight = DistributedSingleFlight(
+            "cache",
+            lambda: self.redis_client,
+            lock_ttl=CACHE_LOCK_TTL,
+            poll_interval=CACHE_LOCK_POLL_INTERVAL
+        )
+        # Generation counters: name -> (trusted until, value)
+        self._generations: Dict[str, Tuple[float, int]] = {}
+        # Webhook coverage per store: store_id -> (trusted until, covered until)
+        self._coverage: Dict[str, Tuple[float, float]] = {}
+        self._gc_task: Optional[asyncio.Task] = None
+        self._counters = {
+            "l1_hits": 0,
+            "l2_hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "invalidations": 0,
+            "gc_deleted": 0,
+            "errors": 0,
+        }
+
+    async def connect(self) -> None:
+        """Open the Redis pool; without Redis only the L1 tier is used"""
+        client = redis.from_url(self.redis_url, max_connections=REDIS_MAX_CONNECTIONS)
         try:
-            self.redis_client = redis.from_url(redis_url, decode_responses=True)
-            self.redis_client.ping()
+            await client.ping()
+            self.redis_client = client
             logger.info("Redis connection established")
-        except redis.ConnectionError:
-            logger.warning("Redis not available, caching disabled")
+        except (redis.ConnectionError, OSError):
+            logger.warning("Redis not available, using in-process cache only")
+            await client.aclose()
+
+    async def aclose(self) -> None:
+        if self._gc_task is not None:
+            self._gc_task.cancel()
+            await asyncio.gather(self._gc_task, return_exceptions=True)
+            self._gc_task = None
+        if self.redis_client is not None:
+            await self.redis_client.aclose()
             self.redis_client = None
-    
-    def get(self, key: str) -> Optional[Any]:
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters and L1 occupancy"""
+        lookups = self._counters["l1_hits"] + self._counters["l2_hits"] + self._counters["misses"]
+        hits = self._counters["l1_hits"] + self._counters["l2_hits"]
+        return {
+            **self._counters,
+            "coalesced": self._flight.counters["coalesced"],
+            "lock_waits": self._flight.counters["lock_waits"],
+            "hit_ratio": round(hits / lookups, 4) if lookups else None,
+            "l1_evictions": self.l1.evictions,
+            "l1_entries": len(self.l1),
+            "l1_bytes": self.l1.size,
+            "redis": self.redis_client is not None,
+            "serializer": "msgpack" if MSGPACK_AVAILABLE else "json",
+        }
+
+    async def _get(self, key: str) -> Any:
+        payload = self.l1.get(key)
+        if payload is not None:
+            self._counters["l1_hits"] += 1
+            return decode(payload)
+
+        if self.redis_client is not None:
+            try:
+                async with self.redis_client.pipeline(transaction=False) as pipe:
+                    pipe.get(key)
+                    pipe.pttl(key)
+                    payload, pttl = await pipe.execute()
+            except Exception as e:
+                self._counters["errors"] += 1
+                logger.error(f"Cache get error: {str(e)}")
+                payload = None
+
+            if payload is not None:
+                self._counters["l2_hits"] += 1
+                # Never keep an L1 copy past the Redis expiry
+                ttl = pttl / 1000 if pttl and pttl > 0 else CACHE_L1_TTL
+                self.l1.set(key, payload, min(CACHE_L1_TTL, ttl))
+                return decode(payload)
+
+        self._counters["misses"] += 1
+        return _MISSING
+
+    async def get(self, key: str) -> Optional[Any]:
         """Get cached value"""
-        if not self.redis_client:
-            return None
-        
+        value = await self._get(key)
+        return None if value is _MISSING else value
+
+    async def set(self, key: str, value: Any, ttl: int = 300) -> bool:
+        """Set cached value with TTL (default 5 minutes)"""
         try:
-            value = self.redis_client.get(key)
-            if value:
-                return json.loads(value)
+            payload = encode(value)
         except Exception as e:
-            logger.error(f"Cache get error: {str(e)}")
-        
-        return None
-    
-    def set(self, key: str, value: Any, ttl: int = 300) -> bool:
-        """Set cached value with TTL (default 5 minutes)"""
-        if not self.redis_client:
+            self._counters["errors"] += 1
+            logger.error(f"Cache set error: {str(e)}")
             return False
-        
+
+        self._counters["sets"] += 1
+        self.l1.set(key, payload, min(CACHE_L1_TTL, ttl))
+
+        if self.redis_client is None:
+            return True
+
         try:
-            serialized = json.dumps(value)
-            self.redis_client.setex(key, ttl, serialized)
+            await self.redis_client.set(key, payload, ex=ttl)
             return True
         except Exception as e:
+            self._counters["errors"] += 1
             logger.error(f"Cache set error: {str(e)}")
             return False
-    
-    def delete(self, key: str) -> bool:
+
+    async def delete(self, key: str) -> bool:
         """Delete cached value"""
-        if not self.redis_client:
+        self.l1.delete(key)
+        if self.redis_client is None:
             return False
-        
+
         try:
-            self.redis_client.delete(key)
+            await self.redis_client.delete(key)
             return True
         except Exception as e:
+            self._counters["errors"] += 1
             logger.error(f"Cache delete error: {str(e)}")
             return False
-    
-    def clear_pattern(self, pattern: str) -> int:
-        """Clear all keys matching pattern"""
-        if not self.redis_client:
-            return 0
-        
+
+    async def clear_pattern(self, pattern: str) -> int:
+        """Clear all keys matching pattern (incremental SCAN + UNLINK)"""
+        cleared = self.l1.delete_matching(pattern)
+        if self.redis_client is None:
+            return cleared
+
+        cleared = 0
         try:
-            keys = self.redis_client.keys(pattern)
-            if keys:
-                return self.redis_client.delete(*keys)
+            batch: List[bytes] = []
+            async for key in self.redis_client.scan_iter(match=pattern, count=CACHE_SCAN_COUNT):
+                batch.append(key)
+                if len(batch) >= CACHE_SCAN_COUNT:
+                    cleared += await self.redis_client.unlink(*batch)
+                    batch = []
+            if batch:
+                cleared += await self.redis_client.unlink(*batch)
         except Exception as e:
+            self._counters["errors"] += 1
             logger.error(f"Cache clear error: {str(e)}")
-        
-        return 0
\ No newline at end of file
+
+        return cleared
+
+    # Namespaces
+
+    @staticmethod
+    def _generation_names(store_id: str, domain: str) -> Tuple[str, str]:
+        return f"{NAMESPACE_PREFIX}:{store_id}", f"{NAMESPACE_PREFIX}:{store_id}:{domain}"
+
+    async def namespace(self, store_id: str, domain: str) -> str:
+        """Current namespace for a store/domain, e.g. 'g3.7'"""
+        names = self._generation_names(store_id, domain)
+        now = time.monotonic()
+        cached = [self._generations.get(name) for name in names]
+
+        if self.redis_client is not None and any(entry is None or entry[0] <= now for entry in cached):
+            try:
+                values = await self.redis_client.mget(names)
+                for name, value in zip(names, values):
+                    self._generations[name] = (now + CACHE_NAMESPACE_TTL, int(value or 0))
+            except Exception as e:
+                self._counters["errors"] += 1
+                logger.error(f"Cache namespace error: {str(e)}")
+
+        store_gen, domain_gen = (self._generations.get(name, (0, 0))[1] for name in names)
+        return f"g{store_gen}.{domain_gen}"
+
+    async def make_key(self, store_id: str, domain: str, text: str) -> str:
+        """Versioned cache key for a store/domain result"""
+        digest = hashlib.sha1(text.encode()).hexdigest()
+        return f"{KEY_PREFIX}:{store_id}:{domain}:{await self.namespace(store_id, domain)}:{digest}"
+
+    async def invalidate(self, store_id: str, domain: Optional[str] = None) -> None:
+        """Orphan every cached result for a store, or one of its domains, in O(1)"""
+        name = f"{NAMESPACE_PREFIX}:{store_id}" if domain is None else f"{NAMESPACE_PREFIX}:{store_id}:{domain}"
+        self._counters["invalidations"] += 1
+
+        if self.redis_client is None:
+            generation = self._generations.get(name, (0, 0))[1] + 1
+            self._generations[name] = (float("inf"), generation)
+            return
+
+        try:
+            generation = await self.redis_client.incr(name)
+            self._generations[name] = (time.monotonic() + CACHE_NAMESPACE_TTL, generation)
+        except Exception as e:
+            self._counters["errors"] += 1
+            logger.error(f"Cache invalidate error: {str(e)}")
+
+    async def mark_webhook_backed(self, store_id: str) -> None:
+        """Record that a store's changes are arriving by webhook"""
+        covered_until = time.time() + WEBHOOK_COVERAGE_TTL
+        self._coverage[store_id] = (float("inf"), covered_until)
+
+        if self.redis_client is None:
+            return
+        try:
+            await self.redis_client.set(f"{WEBHOOK_PREFIX}:{store_id}", covered_until, ex=WEBHOOK_COVERAGE_TTL)
+            self._coverage[store_id] = (time.monotonic() + CACHE_NAMESPACE_TTL, covered_until)
+        except Exception as e:
+            self._counters["errors"] += 1
+            logger.error(f"Cache webhook coverage error: {str(e)}")
+
+    async def result_ttl(self, store_id: str, default: int = CACHE_RESULT_TTL) -> int:
+        """
+        TTL for a store's results: the long webhook TTL while webhooks cover
+        the store, otherwise `default`. Never past UTC midnight (the planner's
+        day boundary), when relative windows (today, last_7_days) move on,
+        but at least CACHE_MIN_RESULT_TTL.
+        """
+        now = time.monotonic()
+        entry = self._coverage.get(store_id)
+
+        if self.redis_client is not None and (entry is None or entry[0] <= now):
+            try:
+                value = await self.redis_client.get(f"{WEBHOOK_PREFIX}:{store_id}")
+                entry = self._coverage[store_id] = (now + CACHE_NAMESPACE_TTL, float(value or 0))
+            except Exception as e:
+                self._counters["errors"] += 1
+                logger.error(f"Cache webhook coverage error: {str(e)}")
+
+        ttl = default if entry is None or entry[1] <= time.time() else CACHE_WEBHOOK_RESULT_TTL
+
+        now = utc_now()
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        return max(CACHE_MIN_RESULT_TTL, min(ttl, int((midnight - now).total_seconds())))
+
+    async def collect_garbage(self) -> int:
+        """Unlink result keys whose namespace is no longer current"""
+        if self.redis_client is None:
+            return 0
+
+        deleted = 0
+        stale: List[bytes] = []
+        try:
+            async for key in self.redis_client.scan_iter(match=f"{KEY_PREFIX}:*", count=CACHE_SCAN_COUNT):
+                parts = key.decode().split(":")
+                if len(parts) != 5:
+                    continue
+                _, store_id, domain, namespace, _ = parts
+                if namespace != await self.namespace(store_id, domain):
+                    stale.append(key)
+                if len(stale) >= CACHE_SCAN_COUNT:
+                    deleted += await self.redis_client.unlink(*stale)
+                    stale = []
+            if stale:
+                deleted += await self.redis_client.unlink(*stale)
+        except Exception as e:
+            self._counters["errors"] += 1
+            logger.error(f"Cache garbage collection error: {str(e)}")
+
+        self._counters["gc_deleted"] += deleted
+        if deleted:
+            logger.info(f"Cache garbage collection unlinked {deleted} stale keys")
+        return deleted
+
+    def start_gc(self, interval: int = CACHE_GC_INTERVAL) -> None:
+        """Run collect_garbage periodically until aclose()"""
+        if interval <= 0 or self.redis_client is None or self._gc_task is not None:
+            return
+
+        async def sweep():
+            while True:
+                await asyncio.sleep(interval)
+                await self.collect_garbage()
+
+        self._gc_task = asyncio.create_task(sweep())
+
+    async def get_or_set(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: int = 300
+    ) -> Any:
+        """Return the cached value, computing and storing it once on a miss"""
+        value = await self._get(key)
+        if value is not _MISSING:
+            return value
+
+        return await self._flight.do(
+            key,
+            lambda: self._compute(key, compute, ttl),
+            load=lambda: self._load(key)
+        )
+
+    async def _compute(self, key: str, compute: Callable[[], Awaitable[Any]], ttl: int) -> Any:
+        value = await compute()
+        await self.set(key, value, ttl=ttl)
+        return value
+
+    async def _load(self, key: str) -> Any:
+        """Read a value another worker published to Redis"""
+        payload = await self.redis_client.get(key)
+        if payload is None:
+            return _MISSING
+        self.l1.set(key, payload, CACHE_L1_TTL)
+        return decode(payload)
@@ -0,0 +1,99 @@
+import os
+import asyncio
+import logging
+from typing import Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class ShopifyClientPool:
+    """
+    Shared async HTTP transport for Shopify Admin API calls.
+
+    Keeps one keep-alive httpx.AsyncClient per shop so repeated requests
+    against the same store reuse TCP/TLS connections. The pool is owned by
+    the FastAPI app and closed on shutdown.
+    """
+
+    def __init__(
+        self,
+        max_connections: Optional[int] = None,
+        max_keepalive_connections: Optional[int] = None,
+        keepalive_expiry: Optional[float] = None,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        pool_timeout: Optional[float] = None,
+        http2: Optional[bool] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections or int(os.getenv("SHOPIFY_HTTP_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=max_keepalive_connections or int(
+                os.getenv("SHOPIFY_HTTP_MAX_KEEPALIVE", "10")
+            ),
+            keepalive_expiry=keepalive_expiry or float(os.getenv("SHOPIFY_HTTP_KEEPALIVE_EXPIRY", "30")),
+        )
+        self.timeout = httpx.Timeout(
+            connect=connect_timeout or float(os.getenv("SHOPIFY_HTTP_CONNECT_TIMEOUT", "5")),
+            read=read_timeout or float(os.getenv("SHOPIFY_HTTP_READ_TIMEOUT", "10")),
+            write=read_timeout or float(os.getenv("SHOPIFY_HTTP_READ_TIMEOUT", "10")),
+            pool=pool_timeout or float(os.getenv("SHOPIFY_HTTP_POOL_TIMEOUT", "5")),
+        )
+
+        if http2 is None:
+            http2 = os.getenv("SHOPIFY_HTTP2", "true").lower() == "true"
+        if http2 and not HTTP2_AVAILABLE:
+            logger.warning("HTTP/2 requested but 'h2' is not installed, falling back to HTTP/1.1")
+        self.http2 = http2 and HTTP2_AVAILABLE
+        # Custom transport (e.g. the benchmark suite's fake Admin API)
+        self.transport = transport
+
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._lock = asyncio.Lock()
+
+    def _build_client(self, store_id: str) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=f"https://{store_id}",
+            limits=self.limits,
+            timeout=self.timeout,
+            http2=self.http2,
+            transport=self.transport,
+        )
+
+    async def get_client(self, store_id: str) -> httpx.AsyncClient:
+        """Get (or lazily create) the pooled client for a shop"""
+        client = self._clients.get(store_id)
+        if client is not None and not client.is_closed:
+            return client
+
+        async with self._lock:
+            client = self._clients.get(store_id)
+            if client is None or client.is_closed:
+                client = self._build_client(store_id)
+                self._clients[store_id] = client
+                logger.info(f"Opened HTTP connection pool for {store_id} (http2={self.http2})")
+            return client
+
+    async def close_client(self, store_id: str) -> None:
+        """Close and drop the pooled client for a single shop"""
+        async with self._lock:
+            client = self._clients.pop(store_id, None)
+        if client is not None:
+            await client.aclose()
+
+    async def aclose(self) -> None:
+        """Close every pooled client"""
+        async with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+
+        await asyncio.gather(*(client.aclose() for client in clients), return_exceptions=True)
+        logger.info(f"Closed {len(clients)} Shopify HTTP connection pools")
@@ -0,0 +1,298 @@
+import os
+import json
+import time
+import uuid
+import heapq
+import asyncio
+import logging
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import redis.asyncio as redis
+
+logger = logging.getLogger(__name__)
+
+# Concurrent jobs per worker process, and per store across all workers
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "8"))
+JOB_STORE_CONCURRENCY = int(os.getenv("JOB_STORE_CONCURRENCY", "2"))
+
+# A job running longer than this fails with a timeout
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "600"))
+# Finished jobs (and their results) are kept this long
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.2"))
+
+# Queued jobs examined per claim when the oldest ones belong to capped stores
+JOB_CLAIM_SCAN = 50
+
+QUEUE_KEY = "jobs:queue"
+JOB_PREFIX = "job:"
+RUNNING_PREFIX = "jobs:running:"
+
+# Atomically claim the first queued job whose store is under its concurrency cap
+CLAIM_SCRIPT = """
+local ids = redis.call('ZRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+for _, id in ipairs(ids) do
+  local store = redis.call('HGET', ARGV[3] .. id, 'store_id')
+  if not store then
+    redis.call('ZREM', KEYS[1], id)
+  else
+    local running = tonumber(redis.call('GET', ARGV[4] .. store) or '0')
+    if running < tonumber(ARGV[2]) then
+      redis.call('ZREM', KEYS[1], id)
+      redis.call('INCR', ARGV[4] .. store)
+      redis.call('EXPIRE', ARGV[4] .. store, ARGV[5])
+      redis.call('HSET', ARGV[3] .. id, 'status', 'running', 'started_at', ARGV[6])
+      return id
+    end
+  end
+end
+return false
+"""
+
+
+class JobPriority(IntEnum):
+    """Queue priority (lower runs first, FIFO within a priority)"""
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+
+class JobStatus:
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+def _score(priority: JobPriority, enqueued_at: float) -> float:
+    # Priority dominates; enqueue time (ms) orders jobs within it
+    return priority * 1e13 + enqueued_at * 1000
+
+
+class JobQueue:
+    """
+    Priority job queue with per-store concurrency caps.
+
+    Jobs live in Redis (a sorted set for the queue, a hash per job) so any
+    worker can claim them and any worker can answer status polls. Claims
+    skip jobs whose store already has JOB_STORE_CONCURRENCY jobs running.
+    Without Redis the same semantics are kept in-process.
+    """
+
+    def __init__(self, client: Callable[[], Optional[redis.Redis]], store_concurrency: int = JOB_STORE_CONCURRENCY):
+        self.client = client
+        self.store_concurrency = store_concurrency
+
+        # In-process fallback
+        self._heap: List[Tuple[float, str]] = []
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._running: Dict[str, int] = {}
+
+    async def submit(
+        self,
+        store_id: str,
+        payload: Dict[str, Any],
+        priority: JobPriority = JobPriority.NORMAL
+    ) -> str:
+        """Queue a job and return its id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        job = {
+            "id": job_id,
+            "store_id": store_id,
+            "status": JobStatus.QUEUED,
+            "priority": priority.name.lower(),
+            "created_at": now,
+            "payload": json.dumps(payload),
+        }
+
+        client = self.client()
+        if client is not None:
+            async with client.pipeline(transaction=True) as pipe:
+                pipe.hset(f"{JOB_PREFIX}{job_id}", mapping=job)
+                pipe.expire(f"{JOB_PREFIX}{job_id}", int(JOB_TIMEOUT) + JOB_RESULT_TTL)
+                pipe.zadd(QUEUE_KEY, {job_id: _score(priority, now)})
+                await pipe.execute()
+        else:
+            self._jobs[job_id] = job
+            heapq.heappush(self._heap, (_score(priority, now), job_id))
+
+        logger.info(f"Queued job {job_id} for {store_id} ({priority.name.lower()})")
+        return job_id
+
+    async def claim(self) -> Optional[Dict[str, Any]]:
+        """Next runnable job (marked running), or None"""
+        now = time.time()
+        client = self.client()
+        if client is not None:
+            job_id = await client.eval(
+                CLAIM_SCRIPT, 1, QUEUE_KEY,
+                JOB_CLAIM_SCAN, self.store_concurrency, JOB_PREFIX, RUNNING_PREFIX,
+                int(JOB_TIMEOUT * 2), now
+            )
+            if not job_id:
+                return None
+            return await self.get(job_id.decode() if isinstance(job_id, bytes) else job_id, include_payload=True)
+
+        skipped = []
+        claimed = None
+        while self._heap and len(skipped) < JOB_CLAIM_SCAN:
+            score, job_id = heapq.heappop(self._heap)
+            job = self._jobs.get(job_id)
+            if job is None:
+                continue
+            if self._running.get(job["store_id"], 0) >= self.store_concurrency:
+                skipped.append((score, job_id))
+                continue
+            self._running[job["store_id"]] = self._running.get(job["store_id"], 0) + 1
+            job.update(status=JobStatus.RUNNING, started_at=now)
+            claimed = dict(job)
+            break
+        for item in skipped:
+            heapq.heappush(self._heap, item)
+
+        if claimed is not None:
+            claimed["payload"] = json.loads(claimed["payload"])
+        return claimed
+
+    async def finish(
+        self,
+        job: Dict[str, Any],
+        result: Optional[Dict[str, Any]] = None,
+        error: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Record a job's result or error and release its store slot"""
+        update = {
+            "status": JobStatus.FAILED if error else JobStatus.COMPLETED,
+            "finished_at": time.time(),
+            "result": json.dumps(result) if result is not None else "",
+            "error": json.dumps(error) if error else "",
+            # Credentials are only needed while the job waits to run
+            "payload": "",
+        }
+
+        client = self.client()
+        if client is not None:
+            key = f"{JOB_PREFIX}{job['id']}"
+            async with client.pipeline(transaction=True) as pipe:
+                pipe.hset(key, mapping=update)
+                pipe.expire(key, JOB_RESULT_TTL)
+                pipe.decr(f"{RUNNING_PREFIX}{job['store_id']}")
+                await pipe.execute()
+            return
+
+        stored = self._jobs.get(job["id"])
+        if stored is not None:
+            stored.update(update)
+        self._running[job["store_id"]] = max(0, self._running.get(job["store_id"], 0) - 1)
+        self._expire_local()
+
+    def _expire_local(self) -> None:
+        cutoff = time.time() - JOB_RESULT_TTL
+        for job_id in [i for i, j in self._jobs.items() if j.get("finished_at") and j["finished_at"] < cutoff]:
+            del self._jobs[job_id]
+
+    async def get(self, job_id: str, include_payload: bool = False) -> Optional[Dict[str, Any]]:
+        """Job status; `result`/`error` are decoded once the job has finished"""
+        client = self.client()
+        if client is not None:
+            raw = await client.hgetall(f"{JOB_PREFIX}{job_id}")
+            if not raw:
+                return None
+            job = {k.decode(): v.decode() for k, v in raw.items()}
+        else:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+
+        for field in ("created_at", "started_at", "finished_at"):
+            if job.get(field):
+                job[field] = float(job[field])
+        for field in ("result", "error"):
+            job[field] = json.loads(job[field]) if job.get(field) else None
+
+        payload = job.pop("payload", "")
+        if include_payload:
+            job["payload"] = json.loads(payload) if payload else {}
+        return job
+
+    async def depth(self) -> int:
+        client = self.client()
+        if client is not None:
+            return await client.zcard(QUEUE_KEY)
+        return len(self._heap)
+
+
+class JobWorkerPool:
+    """
+    Bounded pool of asyncio workers draining a JobQueue.
+
+    Each worker claims a job, runs `handler(job)` under JOB_TIMEOUT and
+    records the returned result. Exceptions are turned into a job error by
+    `on_error` (status code + detail), so a failing question never kills
+    the worker.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        on_error: Callable[[Exception], Dict[str, Any]],
+        workers: int = JOB_WORKERS
+    ):
+        self.queue = queue
+        self.handler = handler
+        self.on_error = on_error
+        self.workers = workers
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+
+    def notify(self) -> None:
+        """Wake idle workers (a job was just submitted in this process)"""
+        self._wakeup.set()
+
+    def start(self) -> None:
+        if self._tasks or self.workers <= 0:
+            return
+        self._tasks = [asyncio.create_task(self._work(i)) for i in range(self.workers)]
+
+    async def aclose(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _idle(self) -> None:
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _work(self, index: int) -> None:
+        while True:
+            try:
+                job = await self.queue.claim()
+            except Exception as e:
+                logger.error(f"Job worker {index} claim error: {str(e)}")
+                job = None
+
+            if job is None:
+                await self._idle()
+                continue
+
+            try:
+                result = await asyncio.wait_for(self.handler(job), JOB_TIMEOUT)
+            except asyncio.CancelledError:
+                await self.queue.finish(job, error={"status": 503, "detail": "Worker shut down while running the job"})
+                raise
+            except asyncio.TimeoutError:
+                logger.warning(f"Job {job['id']} timed out after {JOB_TIMEOUT}s")
+                await self.queue.finish(job, error={"status": 504, "detail": "Job timed out"})
+            except Exception as e:
+                await self.queue.finish(job, error=self.on_error(e))
+            else:
+                await self.queue.finish(job, result=result)
+                logger.info(f"Job {job['id']} completed")
@@ -0,0 +1,250 @@
+import re
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from app.services.records import flatten_row
+from app.services.shopifyql import PLAN_CACHE_SIZE, QueryPlan, ShopifyQLSyntaxError, plan_query
+
+logger = logging.getLogger(__name__)
+
+# Catalogue fetched alongside the steps when line items (product_id) must be
+# joined to inventory (inventory_item_id) without a products step to bridge them
+VARIANT_BRIDGE_QUERY = "SELECT id, title, variants FROM products LIMIT 100000"
+
+# Shared keys, most specific first; two steps join on the first key both carry
+JOIN_KEYS = ("inventory_item_id", "variant_id", "order_id", "customer_id", "product_id")
+
+# Row id column of each domain once keyed
+ID_COLUMNS = {"orders": "order_id", "products": "product_id", "customers": "customer_id"}
+
+CTE_RE = re.compile(r"\s*([a-z_][a-z0-9_]*)\s+as\s*\(", re.IGNORECASE)
+SELECT_RE = re.compile(
+    r"^\s*select\s+\*\s+from\s+([a-z_][a-z0-9_]*)"
+    r"(?P<joins>(?:\s+(?:(?:inner|left)\s+)?join\s+[a-z_][a-z0-9_]*)+)"
+    r"(?:\s+order\s+by\s+(?P<order>[a-z_][a-z0-9_.]*)(?:\s+(?P<direction>asc|desc))?)?"
+    r"(?:\s+limit\s+(?P<limit>\d+))?\s*;?\s*$",
+    re.IGNORECASE
+)
+JOIN_RE = re.compile(r"(?:(inner|left)\s+)?join\s+([a-z_][a-z0-9_]*)", re.IGNORECASE)
+
+
+@dataclass
+class JoinStep:
+    name: str
+    query: str
+    plan: QueryPlan
+    how: str = "inner"  # how it joins onto the steps before it
+
+    @property
+    def domain(self) -> str:
+        return self.plan.domain
+
+
+@dataclass
+class MultiQuery:
+    """
+    Several single-domain queries joined locally:
+
+        WITH sales AS (FROM orders DURING last_month GROUP BY product_id),
+             stock AS (FROM inventory WHERE quantity < 10)
+        SELECT * FROM sales JOIN stock ORDER BY total_quantity DESC LIMIT 10
+
+    Join keys are inferred from the columns the steps share (JOIN_KEYS).
+    """
+    steps: List[JoinStep]
+    order_by: Optional[str] = None
+    descending: bool = False
+    limit: Optional[int] = None
+
+    @property
+    def domains(self) -> List[str]:
+        return list(dict.fromkeys(step.domain for step in self.steps))
+
+    @property
+    def needs_bridge(self) -> bool:
+        domains = set(self.domains)
+        return "inventory" in domains and "products" not in domains and bool(domains & {"orders", "line_items"})
+
+
+def is_multi_query(query: str) -> bool:
+    return query.lstrip()[:5].lower() == "with "
+
+
+def _closing_paren(query: str, start: int) -> int:
+    """Index of the parenthesis closing the one before `start` (quotes respected)"""
+    depth, quote, i = 1, None, start
+    while i < len(query):
+        char = query[i]
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    raise ShopifyQLSyntaxError("Unbalanced parentheses in WITH clause")
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def parse_multi_query(query: str) -> MultiQuery:
+    """Parse and plan a WITH ... SELECT * FROM a JOIN b query (treat the result as read-only)"""
+    if not is_multi_query(query):
+        raise ShopifyQLSyntaxError("Multi-domain queries start with WITH")
+
+    ctes: Dict[str, str] = {}
+    position = query.lower().index("with") + 4
+    while True:
+        match = CTE_RE.match(query, position)
+        if not match:
+            break
+        end = _closing_paren(query, match.end())
+        name = match.group(1).lower()
+        if name in ctes:
+            raise ShopifyQLSyntaxError(f"Duplicate step name {name!r}")
+        ctes[name] = query[match.end():end].strip()
+        position = end + 1
+        comma = re.match(r"\s*,", query[position:])
+        if not comma:
+            break
+        position += comma.end()
+
+    select = SELECT_RE.match(query[position:])
+    if not ctes or not select:
+        raise ShopifyQLSyntaxError("Expected WITH name AS (query), ... SELECT * FROM name JOIN name")
+
+    order = [(select.group(1).lower(), "inner")]
+    order += [(name.lower(), (how or "inner").lower()) for how, name in JOIN_RE.findall(select.group("joins"))]
+    names = [name for name, _ in order]
+    if sorted(names) != sorted(ctes):
+        raise ShopifyQLSyntaxError(f"SELECT must join each step exactly once: {', '.join(ctes)}")
+
+    steps = []
+    for name, how in order:
+        plan = plan_query(ctes[name])
+        steps.append(JoinStep(name, ctes[name], plan, how))
+
+    return MultiQuery(
+        steps=steps,
+        order_by=select.group("order"),
+        descending=(select.group("direction") or "").lower() == "desc",
+        limit=int(select.group("limit")) if select.group("limit") else None
+    )
+
+
+def validate_query(query: str) -> None:
+    """Parse and plan a single- or multi-domain query; raises ShopifyQLSyntaxError"""
+    if is_multi_query(query):
+        parse_multi_query(query)
+    else:
+        plan_query(query)
+
+
+def _explode_variants(rows: List[Dict[str, Any]]) -> pd.DataFrame:
+    """One row per product variant, keyed by product, variant and inventory item"""
+    records = []
+    for product in rows:
+        base = {k: v for k, v in flatten_row(product).items() if k != "variants_count"}
+        for variant in product.get("variants") or [{}]:
+            record = dict(base)
+            record.update({
+                "variant_id": variant.get("id"),
+                "inventory_item_id": variant.get("inventory_item_id"),
+                "sku": variant.get("sku"),
+                "variant_title": variant.get("title"),
+                "inventory_quantity": variant.get("inventory_quantity"),
+            })
+            records.append(record)
+    frame = pd.DataFrame.from_records(records)
+    return frame.rename(columns={"id": "product_id", "title": "product_title"})
+
+
+def _keyed_frame(domain: str, rows: Any) -> pd.DataFrame:
+    """A step's result as a frame whose join key columns use JOIN_KEYS names"""
+    if isinstance(rows, dict):
+        rows = [rows]
+    if not rows:
+        return pd.DataFrame()
+
+    if domain == "products" and any("variants" in row for row in rows):
+        frame = _explode_variants(rows)
+    else:
+        frame = pd.DataFrame.from_records([flatten_row(row) for row in rows])
+        renames = {"customer.id": "customer_id"}
+        if domain in ID_COLUMNS and ID_COLUMNS[domain] not in frame.columns:
+            renames["id"] = ID_COLUMNS[domain]
+        frame = frame.rename(columns=renames)
+
+    # Ids arrive as ints, floats (aggregates) or strings; align them for the merge
+    for key in JOIN_KEYS:
+        if key in frame.columns:
+            frame[key] = pd.to_numeric(frame[key], errors="coerce").astype("Int64")
+    return frame
+
+
+def _join_key(left: pd.DataFrame, right: pd.DataFrame) -> Optional[str]:
+    for key in JOIN_KEYS:
+        if key in left.columns and key in right.columns:
+            return key
+    return None
+
+
+def _records(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    for column in frame.columns:
+        if pd.api.types.is_datetime64_any_dtype(frame[column]):
+            frame[column] = frame[column].map(lambda value: value.isoformat() if pd.notna(value) else None)
+    frame = frame.astype(object).where(frame.notna(), None)
+    return frame.to_dict("records")
+
+
+def join_results(
+    multi: MultiQuery,
+    results: Dict[str, Any],
+    bridge: Optional[List[Dict[str, Any]]] = None
+) -> List[Dict[str, Any]]:
+    """Hash-join step results in SELECT order, then apply ORDER BY / LIMIT"""
+    first = multi.steps[0]
+    frame = _keyed_frame(first.domain, results[first.name])
+    bridge_frame = _keyed_frame("products", bridge) if bridge else None
+
+    for step in multi.steps[1:]:
+        right = _keyed_frame(step.domain, results[step.name])
+        if frame.empty or right.empty:
+            if step.how == "inner" or frame.empty:
+                return []
+            continue
+
+        key = _join_key(frame, right)
+        if key is None and bridge_frame is not None:
+            # Line items -> variants (product_id) -> inventory levels (inventory_item_id)
+            columns = ["product_id", "inventory_item_id", "product_title", "variant_id", "sku"]
+            variants = bridge_frame[[c for c in columns if c in bridge_frame.columns]]
+            if "product_id" in frame.columns and "inventory_item_id" in right.columns:
+                frame = frame.merge(variants, on="product_id", how=step.how, suffixes=("", "_bridge"))
+            elif "inventory_item_id" in frame.columns and "product_id" in right.columns:
+                right = right.merge(variants, on="product_id", how="inner", suffixes=("", "_bridge"))
+            key = _join_key(frame, right)
+        if key is None:
+            raise ValueError(
+                f"Cannot join {step.name} ({step.domain}): no shared key among {', '.join(JOIN_KEYS)}"
+            )
+
+        frame = frame.merge(right, on=key, how=step.how, suffixes=("", f"_{step.name}"))
+        logger.debug(f"Joined {step.name} on {key}: {len(frame.index)} rows")
+
+    if multi.order_by:
+        if multi.order_by not in frame.columns:
+            raise ValueError(f"Cannot order joined rows by unknown column {multi.order_by!r}")
+        frame = frame.sort_values(multi.order_by, ascending=not multi.descending, kind="stable", na_position="last")
+    if multi.limit is not None:
+        frame = frame.head(multi.limit)
+
+    return _records(frame)
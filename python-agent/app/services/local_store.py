@@ -0,0 +1,592 @@
+import os
+import re
+import time
+import asyncio
+import sqlite3
+import logging
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, TYPE_CHECKING
+
+from app.services import rollups
+from app.services.aggregation import DATE_BUCKETS, LINE_ITEM_ALIASES, LINE_ITEM_COLUMNS, ORDER_ALIASES
+from app.services.rate_limiter import Priority
+from app.services.records import DOMAIN_RESOURCES, RECORD_FIELDS
+from app.services.shopifyql import utc_iso
+
+if TYPE_CHECKING:
+    from app.services.shopify_service import ShopifyService
+    from app.services.shopifyql import QueryPlan
+
+logger = logging.getLogger(__name__)
+
+LOCAL_STORE_ENABLED = os.getenv("LOCAL_STORE_ENABLED", "true").lower() == "true"
+LOCAL_STORE_DIR = os.getenv("LOCAL_STORE_DIR", "data/stores")
+# A store is answered locally if its last delta sync finished this recently
+LOCAL_STORE_MAX_STALENESS = int(os.getenv("LOCAL_STORE_MAX_STALENESS", "300"))
+
+LOCAL_PAGE_SIZE = 500
+
+# Stored columns of an order's customer -> the nested `customer` field
+CUSTOMER_COLUMNS = {
+    "customer_id": "id",
+    "customer_email": "email",
+    "customer_first_name": "first_name",
+    "customer_last_name": "last_name",
+}
+
+# Query names the aggregation engine computes from stored fields rather than
+# reading a REST field of the same name (date buckets, line item aliases)
+DERIVED_COLUMNS = {
+    "orders": (
+        set(DATE_BUCKETS) | set(LINE_ITEM_ALIASES) | set(ORDER_ALIASES) | LINE_ITEM_COLUMNS
+        | {"item_count", "customer_id"}
+    ),
+}
+
+# Columns are only ever appended: stores created before a column existed get
+# it added by `_setup` (and are resynced to fill it)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    created_at TEXT,
+    updated_at TEXT,
+    financial_status TEXT,
+    total_price REAL,
+    customer_id INTEGER,
+    processed_at TEXT,
+    cancelled_at TEXT,
+    fulfillment_status TEXT,
+    currency TEXT,
+    subtotal_price REAL,
+    total_discounts REAL,
+    customer_email TEXT,
+    customer_first_name TEXT,
+    customer_last_name TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders (created_at);
+
+CREATE TABLE IF NOT EXISTS line_items (
+    id INTEGER PRIMARY KEY,
+    order_id INTEGER NOT NULL,
+    product_id INTEGER,
+    variant_id INTEGER,
+    name TEXT,
+    quantity INTEGER,
+    price REAL,
+    title TEXT,
+    sku TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_line_items_order_id ON line_items (order_id);
+
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    title TEXT,
+    product_type TEXT,
+    vendor TEXT,
+    status TEXT,
+    created_at TEXT,
+    updated_at TEXT,
+    handle TEXT
+);
+
+CREATE TABLE IF NOT EXISTS variants (
+    id INTEGER PRIMARY KEY,
+    product_id INTEGER NOT NULL,
+    title TEXT,
+    sku TEXT,
+    price REAL,
+    inventory_item_id INTEGER,
+    inventory_quantity INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_variants_product_id ON variants (product_id);
+
+CREATE TABLE IF NOT EXISTS customers (
+    id INTEGER PRIMARY KEY,
+    email TEXT,
+    first_name TEXT,
+    last_name TEXT,
+    orders_count INTEGER,
+    total_spent REAL,
+    state TEXT,
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_customers_created_at ON customers (created_at);
+
+CREATE TABLE IF NOT EXISTS inventory_levels (
+    inventory_item_id INTEGER NOT NULL,
+    location_id INTEGER NOT NULL,
+    available INTEGER,
+    updated_at TEXT,
+    PRIMARY KEY (inventory_item_id, location_id)
+);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    resource TEXT PRIMARY KEY,
+    high_water_mark TEXT,
+    synced_at REAL
+);
+"""
+
+
+def _float(value: Any) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _insert(conn: sqlite3.Connection, table: str, columns: List[str], rows: List[tuple]) -> None:
+    """INSERT OR REPLACE by column name (added columns sit at the end of older tables)"""
+    conn.executemany(
+        f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+        rows
+    )
+
+
+def _add_missing_columns(conn: sqlite3.Connection) -> bool:
+    """Add the SCHEMA columns an existing store lacks; True if any were added"""
+    declared = sqlite3.connect(":memory:")
+    try:
+        declared.executescript(SCHEMA)
+        added = False
+        for (table,) in declared.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            for _, name, column_type, *_ in declared.execute(f"PRAGMA table_info({table})").fetchall():
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+                    added = True
+        return added
+    finally:
+        declared.close()
+
+
+class LocalStore:
+    """
+    Per-shop SQLite copy of Shopify orders, line items, products, customers
+    and inventory levels.
+
+    Rows are upserted by incremental `updated_at_min` syncs and read back in
+    the same shapes the REST API returns for `RECORD_FIELDS`, so the
+    ShopifyService processors can run against either source; `covers` tells
+    whether a plan reads only those fields. Each write also adjusts the daily sales,
+    inventory and customer rollups (see rollups.py) in the same transaction.
+    Every database call runs in a worker thread; `open` must be awaited
+    before first use.
+    """
+
+    def __init__(self, store_id: str, data_dir: str = LOCAL_STORE_DIR):
+        self.store_id = store_id
+        self.data_dir = data_dir
+        safe_name = re.sub(r"[^A-Za-z0-9._-]", "_", store_id)
+        self.path = os.path.join(data_dir, f"{safe_name}.sqlite3")
+        self._opening: Optional[asyncio.Future] = None
+
+    def _setup(self) -> None:
+        os.makedirs(self.data_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            if _add_missing_columns(conn):
+                # Rows synced before the new columns existed lack them: resync everything
+                conn.execute("DELETE FROM sync_state")
+                logger.info(f"Added columns to the local store for {self.store_id}; it will be fully resynced")
+            conn.executescript(rollups.ROLLUP_SCHEMA)
+            if conn.execute("PRAGMA user_version").fetchone()[0] < rollups.ROLLUP_VERSION:
+                rollups.rebuild(conn)
+                conn.execute(f"PRAGMA user_version = {rollups.ROLLUP_VERSION}")
+
+    async def open(self) -> None:
+        """Create the schema and rebuild outdated rollups (once; concurrent callers share it)"""
+        if self._opening is None or (self._opening.done() and self._opening.exception() is not None):
+            self._opening = asyncio.ensure_future(self._run(self._setup))
+        await asyncio.shield(self._opening)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection for one transaction"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    async def _run(self, fn: Callable, *args) -> Any:
+        """Run a blocking database call off the event loop"""
+        return await asyncio.to_thread(fn, *args)
+
+    # Sync state
+
+    def _sync_state(self, resource: str) -> Optional[sqlite3.Row]:
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT high_water_mark, synced_at FROM sync_state WHERE resource = ?",
+                (resource,)
+            ).fetchone()
+
+    async def high_water_mark(self, resource: str) -> Optional[str]:
+        """Largest updated_at seen for a resource"""
+        state = await self._run(self._sync_state, resource)
+        return state["high_water_mark"] if state else None
+
+    async def is_fresh(self, resource: str, max_age: int = LOCAL_STORE_MAX_STALENESS) -> bool:
+        """Whether a resource was synced recently enough to answer from"""
+        state = await self._run(self._sync_state, resource)
+        return bool(state and state["synced_at"] and time.time() - state["synced_at"] <= max_age)
+
+    async def mark_synced(self, resource: str, high_water_mark: Optional[str]) -> None:
+        await self._run(self._mark_synced, resource, high_water_mark)
+
+    def _mark_synced(self, resource: str, high_water_mark: Optional[str]) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO sync_state (resource, high_water_mark, synced_at) VALUES (?, ?, ?)
+                ON CONFLICT (resource) DO UPDATE SET
+                    high_water_mark = COALESCE(excluded.high_water_mark, sync_state.high_water_mark),
+                    synced_at = excluded.synced_at
+                """,
+                (resource, high_water_mark, time.time())
+            )
+
+    # Writes
+
+    def _upsert_orders(self, conn: sqlite3.Connection, orders: List[Dict]) -> None:
+        order_ids = [o["id"] for o in orders]
+        rollups.apply_orders(conn, order_ids, -1)
+
+        _insert(
+            conn, "orders",
+            [
+                "id", "name", "created_at", "updated_at", "processed_at", "cancelled_at", "financial_status",
+                "fulfillment_status", "currency", "total_price", "subtotal_price", "total_discounts",
+                *CUSTOMER_COLUMNS,
+            ],
+            [
+                (
+                    o["id"], o.get("name"), utc_iso(o.get("created_at")), utc_iso(o.get("updated_at")),
+                    utc_iso(o.get("processed_at")), utc_iso(o.get("cancelled_at")), o.get("financial_status"),
+                    o.get("fulfillment_status"), o.get("currency"), _float(o.get("total_price")),
+                    _float(o.get("subtotal_price")), _float(o.get("total_discounts")),
+                    *((o.get("customer") or {}).get(field) for field in CUSTOMER_COLUMNS.values())
+                )
+                for o in orders
+            ]
+        )
+        # Line items are replaced wholesale when an order changes
+        conn.executemany("DELETE FROM line_items WHERE order_id = ?", [(o["id"],) for o in orders])
+        _insert(
+            conn, "line_items",
+            ["id", "order_id", "product_id", "variant_id", "name", "title", "sku", "quantity", "price"],
+            [
+                (
+                    item["id"], o["id"], item.get("product_id"), item.get("variant_id"), item.get("name"),
+                    item.get("title"), item.get("sku"), item.get("quantity", 0), _float(item.get("price"))
+                )
+                for o in orders
+                for item in o.get("line_items", [])
+            ]
+        )
+
+        rollups.apply_orders(conn, order_ids, 1)
+
+    def _upsert_products(self, conn: sqlite3.Connection, products: List[Dict]) -> None:
+        _insert(
+            conn, "products",
+            ["id", "title", "handle", "product_type", "vendor", "status", "created_at", "updated_at"],
+            [
+                (
+                    p["id"], p.get("title"), p.get("handle"), p.get("product_type"), p.get("vendor"),
+                    p.get("status"), utc_iso(p.get("created_at")), utc_iso(p.get("updated_at"))
+                )
+                for p in products
+            ]
+        )
+        conn.executemany("DELETE FROM variants WHERE product_id = ?", [(p["id"],) for p in products])
+        _insert(
+            conn, "variants",
+            ["id", "product_id", "title", "sku", "price", "inventory_item_id", "inventory_quantity"],
+            [
+                (
+                    v["id"], p["id"], v.get("title"), v.get("sku"), _float(v.get("price")),
+                    v.get("inventory_item_id"), v.get("inventory_quantity")
+                )
+                for p in products
+                for v in p.get("variants", [])
+            ]
+        )
+
+    def _upsert_customers(self, conn: sqlite3.Connection, customers: List[Dict]) -> None:
+        customer_ids = [c["id"] for c in customers]
+        rollups.apply_customers(conn, customer_ids, -1)
+
+        _insert(
+            conn, "customers",
+            [
+                "id", "email", "first_name", "last_name", "orders_count", "total_spent", "state",
+                "created_at", "updated_at",
+            ],
+            [
+                (
+                    c["id"], c.get("email"), c.get("first_name"), c.get("last_name"),
+                    c.get("orders_count", 0), _float(c.get("total_spent")), c.get("state"),
+                    utc_iso(c.get("created_at")), utc_iso(c.get("updated_at"))
+                )
+                for c in customers
+            ]
+        )
+
+        rollups.apply_customers(conn, customer_ids, 1)
+
+    def _upsert_inventory_levels(self, conn: sqlite3.Connection, levels: List[Dict]) -> None:
+        _insert(
+            conn, "inventory_levels",
+            ["inventory_item_id", "location_id", "available", "updated_at"],
+            [
+                (l["inventory_item_id"], l["location_id"], l.get("available"), utc_iso(l.get("updated_at")))
+                for l in levels
+            ]
+        )
+
+        rollups.refresh_inventory_items(conn, [l["inventory_item_id"] for l in levels])
+
+    def _upsert(self, resource: str, rows: List[Dict]) -> None:
+        writer = getattr(self, f"_upsert_{resource}")
+        with self._connect() as conn:
+            writer(conn, rows)
+
+    async def upsert(self, resource: str, rows: List[Dict]) -> None:
+        """Insert or replace a batch of REST-shaped rows"""
+        if rows:
+            await self._run(self._upsert, resource, rows)
+
+    def _apply_changes(self, resource: str, rows: List[Dict]) -> int:
+        writer = getattr(self, f"_upsert_{resource}")
+        key = "inventory_item_id = ? AND location_id = ?" if resource == "inventory_levels" else "id = ?"
+        with self._connect() as conn:
+            newer = []
+            for row in rows:
+                params = (
+                    (row["inventory_item_id"], row["location_id"]) if resource == "inventory_levels" else (row["id"],)
+                )
+                current = conn.execute(f"SELECT updated_at FROM {resource} WHERE {key}", params).fetchone()
+                updated_at = utc_iso(row.get("updated_at"))
+                if current is None or not current["updated_at"] or not updated_at or updated_at >= current["updated_at"]:
+                    newer.append(row)
+            if newer:
+                writer(conn, newer)
+        return len(newer)
+
+    async def apply_changes(self, resource: str, rows: List[Dict]) -> int:
+        """
+        Upsert pushed changes (webhooks), skipping rows older than the stored
+        copy since deliveries can arrive out of order. Returns rows applied.
+        """
+        if not rows:
+            return 0
+        return await self._run(self._apply_changes, resource, rows)
+
+    # Reads
+
+    @staticmethod
+    def covers(plan: "QueryPlan") -> bool:
+        """
+        Whether the store holds every field the plan reads. Others (say an
+        order's `tags`) exist only in the API, as do API-only filters such
+        as an order's `status`.
+        """
+        if plan.api_only:
+            return False
+        if not plan.fields:
+            return True
+        stored = set(RECORD_FIELDS[DOMAIN_RESOURCES[plan.domain]])
+        derived = DERIVED_COLUMNS.get(plan.domain, set(DATE_BUCKETS))
+        return set(plan.fields) <= stored | derived
+
+    async def query_rollups(self, plan: "QueryPlan") -> Optional[List[Dict[str, Any]]]:
+        """Answer an aggregate plan from the rollup tables, or None if it does not fit"""
+        return await rollups.query_rollups(self, plan)
+
+    @staticmethod
+    def _where(params: Dict[str, Any], columns: List[str]) -> tuple:
+        clauses, args = [], []
+        if "created_at" in columns:
+            if params.get("created_at_min"):
+                clauses.append("created_at >= ?")
+                args.append(utc_iso(params["created_at_min"]))
+            if params.get("created_at_max"):
+                clauses.append("created_at <= ?")
+                args.append(utc_iso(params["created_at_max"]))
+        return clauses, args
+
+    def _read_page(
+        self,
+        resource: str,
+        params: Dict[str, Any],
+        after: Any,
+        size: int
+    ) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            key = "rowid"
+            columns = [row["name"] for row in conn.execute(f"PRAGMA table_info({resource})")]
+
+            clauses, args = self._where(params, columns)
+            if after is not None:
+                clauses.append(f"{key} > ?")
+                args.append(after)
+            where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+            rows = [
+                dict(row) for row in conn.execute(
+                    f"SELECT *, {key} AS _key FROM {resource} {where} ORDER BY {key} LIMIT ?",
+                    (*args, size)
+                )
+            ]
+            if not rows:
+                return rows
+
+            ids = [row["id"] for row in rows] if "id" in columns else []
+            placeholders = ",".join("?" * len(ids))
+
+            if resource == "orders":
+                items: Dict[int, List[Dict]] = {}
+                for item in conn.execute(
+                    f"SELECT * FROM line_items WHERE order_id IN ({placeholders})", ids
+                ):
+                    item = dict(item)
+                    items.setdefault(item.pop("order_id"), []).append(item)
+                for row in rows:
+                    row["line_items"] = items.get(row["id"], [])
+                    customer = {field: row.pop(column) for column, field in CUSTOMER_COLUMNS.items()}
+                    row["customer"] = customer if customer["id"] is not None else None
+            elif resource == "products":
+                variants: Dict[int, List[Dict]] = {}
+                for variant in conn.execute(
+                    f"SELECT * FROM variants WHERE product_id IN ({placeholders})", ids
+                ):
+                    variant = dict(variant)
+                    variants.setdefault(variant.pop("product_id"), []).append(variant)
+                for row in rows:
+                    row["variants"] = variants.get(row["id"], [])
+
+            return rows
+
+    async def iter_pages(
+        self,
+        resource: str,
+        params: Dict[str, Any],
+        max_rows: Optional[int] = None
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield REST-shaped pages, keyset-paginated by primary key"""
+        after, fetched = None, 0
+
+        while max_rows is None or fetched < max_rows:
+            size = LOCAL_PAGE_SIZE if max_rows is None else min(LOCAL_PAGE_SIZE, max_rows - fetched)
+            rows = await self._run(self._read_page, resource, params, after, size)
+            if not rows:
+                break
+
+            after = rows[-1].pop("_key")
+            for row in rows:
+                row.pop("_key", None)
+            fetched += len(rows)
+            yield rows
+
+            if len(rows) < size:
+                break
+
+
+class LocalStoreManager:
+    """Owns one LocalStore per shop and the background delta syncs that feed them"""
+
+    def __init__(
+        self,
+        data_dir: str = LOCAL_STORE_DIR,
+        on_change: Optional[Callable[[str, str], Awaitable[None]]] = None
+    ):
+        self.data_dir = data_dir
+        # Called with (store_id, domain) after a sync changed that domain
+        self.on_change = on_change
+        self._stores: Dict[str, LocalStore] = {}
+        self._syncs: Dict[str, asyncio.Task] = {}
+
+    async def get(self, store_id: str) -> LocalStore:
+        """A shop's store, opened"""
+        store = self._stores.get(store_id)
+        if store is None:
+            store = self._stores[store_id] = LocalStore(store_id, self.data_dir)
+        await store.open()
+        return store
+
+    async def sync(self, service: "ShopifyService") -> None:
+        """Pull every resource changed since its high-water mark"""
+        store = await self.get(service.store_id)
+
+        for domain, resource in DOMAIN_RESOURCES.items():
+            high_water_mark = await store.high_water_mark(resource)
+            params: Dict[str, Any] = {"fields": ",".join(RECORD_FIELDS[resource])}
+            if resource == "orders":
+                params["status"] = "any"
+            if high_water_mark:
+                params["updated_at_min"] = high_water_mark
+
+            latest = high_water_mark
+            count = 0
+            try:
+                async for page in service._iter_pages(resource, resource, params):
+                    await store.upsert(resource, page)
+                    count += len(page)
+                    for row in page:
+                        updated_at = row.get("updated_at")
+                        if updated_at and (latest is None or utc_iso(updated_at) > utc_iso(latest)):
+                            latest = updated_at
+
+                await store.mark_synced(resource, latest)
+                logger.info(f"Synced {count} {resource} for {service.store_id} (high-water mark {latest})")
+            except Exception as e:
+                # Left stale (not marked synced) so it is retried; other resources still sync
+                logger.error(f"Syncing {resource} for {service.store_id} failed after {count} rows: {str(e)}")
+
+            if count and self.on_change is not None:
+                await self.on_change(service.store_id, domain)
+
+    def syncing(self, store_id: str) -> bool:
+        """Whether a background sync is running for a shop"""
+        task = self._syncs.get(store_id)
+        return task is not None and not task.done()
+
+    def schedule_sync(self, service: "ShopifyService") -> Optional[asyncio.Task]:
+        """Start a background delta sync for a shop unless one is running"""
+        if self.syncing(service.store_id):
+            return self._syncs[service.store_id]
+
+        background = type(service)(
+            store_id=service.store_id,
+            access_token=service.access_token,
+            api_version=service.api_version,
+            http_pool=service.http_pool,
+            rate_limiter=service.rate_limiter,
+            priority=Priority.BACKGROUND
+        )
+
+        task = asyncio.create_task(self._run_sync(background))
+        self._syncs[service.store_id] = task
+        return task
+
+    async def _run_sync(self, service: "ShopifyService") -> None:
+        try:
+            await self.sync(service)
+        except Exception as e:
+            logger.error(f"Local store sync failed for {service.store_id}: {str(e)}")
+        finally:
+            self._syncs.pop(service.store_id, None)
+
+    async def aclose(self) -> None:
+        """Cancel in-flight syncs"""
+        tasks = list(self._syncs.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
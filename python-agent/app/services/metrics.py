@@ -0,0 +1,253 @@
+import os
+import re
+import time
+import bisect
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Seconds; covers cache hits (ms) through bulk exports and slow LLM calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        if METRICS_ENABLED:
+            key = self._key(labels)
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self) -> Dict[LabelValues, float]:
+        """Current value per label set"""
+        return dict(self._values)
+
+    def samples(self) -> Iterator[str]:
+        for key, value in self._values.items():
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts..., +Inf count], sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    def totals(self) -> Dict[LabelValues, Tuple[int, float]]:
+        """Observation count and sum per label set"""
+        return {key: (sum(counts), total[0]) for key, (counts, total) in self._values.items()}
+
+    def samples(self) -> Iterator[str]:
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_number(round(total[0], 6))}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}"
+
+
+class MetricsRegistry:
+    """
+    Minimal in-process metrics in the Prometheus text exposition format.
+
+    Updates are plain dict operations on the event loop thread (a timed
+    stage costs a few microseconds). Collectors registered with `on_collect`
+    refresh gauges from other components (e.g. cache stats) at scrape time.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def _register(self, metric: Metric) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"Duplicate metric {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def on_collect(self, collector: Callable[[], None]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.error(f"Metrics collector error: {str(e)}")
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+PIPELINE_STAGE_SECONDS = REGISTRY.histogram(
+    "agent_stage_duration_seconds", "Time spent in each agent pipeline stage", ["stage"]
+)
+SHOPIFY_REQUEST_SECONDS = REGISTRY.histogram(
+    "shopify_request_duration_seconds", "Shopify Admin API call latency per attempt", ["endpoint", "status"]
+)
+SHOPIFY_PAGES = REGISTRY.counter("shopify_pages_fetched_total", "Listing pages fetched from Shopify", ["resource"])
+SHOPIFY_ROWS = REGISTRY.counter("shopify_rows_fetched_total", "Rows fetched from Shopify listings", ["resource"])
+RATE_LIMIT_WAIT_SECONDS = REGISTRY.histogram(
+    "shopify_rate_limit_wait_seconds", "Time calls waited for the client-side Shopify rate limiter"
+)
+ROWS_PROCESSED = REGISTRY.counter(
+    "agent_rows_processed_total", "Rows filtered or aggregated locally (API, local store or snapshot)", ["operation"]
+)
+LLM_REQUEST_SECONDS = REGISTRY.histogram("llm_request_duration_seconds", "LLM call latency", ["stage", "model"])
+LLM_TOKENS = REGISTRY.counter("llm_tokens_total", "LLM tokens used", ["stage", "model", "kind"])
+ANSWER_CACHE = REGISTRY.counter("agent_answer_cache_total", "Answer cache lookups", ["result"])
+CACHE_EVENTS = REGISTRY.gauge("cache_events", "CacheService counters for this worker", ["event"])
+CACHE_HIT_RATIO = REGISTRY.gauge("cache_hit_ratio", "CacheService L1+L2 hit ratio for this worker")
+ADMISSION_EVENTS = REGISTRY.counter("admission_decisions_total", "Admission control outcomes for analyze requests", ["result"])
+ADMISSION_WAIT_SECONDS = REGISTRY.histogram("admission_queue_wait_seconds", "Time admitted requests waited for a slot")
+ADMISSION_REQUESTS = REGISTRY.gauge("admission_requests", "Analyze requests running or queued on this worker", ["state"])
+WEBHOOK_EVENTS = REGISTRY.counter("shopify_webhooks_total", "Shopify webhooks received", ["topic", "result"])
+
+# Stage the current task is in (labels LLM calls) and its per-request breakdown
+_STAGE: ContextVar[str] = ContextVar("agent_stage", default="other")
+_TIMINGS: ContextVar[Optional[Dict[str, float]]] = ContextVar("agent_timings", default=None)
+
+
+def current_stage() -> str:
+    return _STAGE.get()
+
+
+def collect_timings() -> Dict[str, float]:
+    """Start collecting a per-request breakdown (milliseconds) in the current context"""
+    timings: Dict[str, float] = {}
+    _TIMINGS.set(timings)
+    return timings
+
+
+def record_timing(name: str, seconds: float) -> None:
+    """Add time to the current request's breakdown, if one is being collected"""
+    timings = _TIMINGS.get()
+    if timings is not None:
+        timings[name] = round(timings.get(name, 0.0) + seconds * 1000, 2)
+
+
+def observe_stage(name: str, seconds: float) -> None:
+    PIPELINE_STAGE_SECONDS.observe(seconds, stage=name)
+    record_timing(name, seconds)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a pipeline stage into the stage histogram and the request breakdown"""
+    token = _STAGE.set(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _STAGE.reset(token)
+        observe_stage(name, time.perf_counter() - started)
+
+
+async def timed_stage(name: str, awaitable: Awaitable[Any]) -> Any:
+    with stage(name):
+        return await awaitable
+
+
+def endpoint_label(endpoint: str) -> str:
+    """Endpoint with resource ids collapsed, to keep label cardinality bounded"""
+    return re.sub(r"/\d+", "/:id", endpoint)
+
+
+def export_cache_stats(stats: Dict[str, Any]) -> None:
+    for event, value in stats.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and event != "hit_ratio":
+            CACHE_EVENTS.set(value, event=event)
+    if stats.get("hit_ratio") is not None:
+        CACHE_HIT_RATIO.set(stats["hit_ratio"])
+
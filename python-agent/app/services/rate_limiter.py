@@ -0,0 +1,178 @@
+import os
+import math
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+from enum import IntEnum
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Mapping, Optional
+
+from app.services.metrics import RATE_LIMIT_WAIT_SECONDS, record_timing
+
+logger = logging.getLogger(__name__)
+
+# Shopify's standard REST bucket; Plus stores report a larger size in headers
+DEFAULT_BUCKET_SIZE = 40
+DEFAULT_LEAK_RATE = 2.0  # requests per second
+
+# Calls kept free below the bucket size for interactive requests
+INTERACTIVE_HEADROOM = int(os.getenv("SHOPIFY_RATE_LIMIT_HEADROOM", "2"))
+# Background work may only use this fraction of the bucket
+BACKGROUND_SHARE = float(os.getenv("SHOPIFY_RATE_LIMIT_BACKGROUND_SHARE", "0.5"))
+
+
+class Priority(IntEnum):
+    """Scheduling priority for Shopify calls (lower runs first)"""
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delay-seconds or HTTP-date); None if absent or unparseable"""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        pass
+    else:
+        return max(0.0, seconds) if math.isfinite(seconds) else None
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        logger.warning(f"Ignoring unparseable Retry-After: {value!r}")
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class ShopifyRateLimitError(Exception):
+    """Raised when Shopify keeps throttling a store after all retries"""
+
+    def __init__(self, store_id: str, retry_after: Optional[float] = None):
+        self.store_id = store_id
+        self.retry_after = retry_after
+        super().__init__(f"Shopify rate limit exceeded for {store_id}")
+
+
+class StoreBucket:
+    """
+    Client-side mirror of Shopify's leaky bucket for a single store.
+
+    The local estimate drains at the store's leak rate and is corrected from
+    the X-Shopify-Shop-Api-Call-Limit header after every response. Waiting
+    callers are served in priority order, then FIFO.
+    """
+
+    def __init__(self, store_id: str):
+        self.store_id = store_id
+        self.capacity = DEFAULT_BUCKET_SIZE
+        self.leak_rate = DEFAULT_LEAK_RATE
+        self.level = 0.0
+        self.blocked_until = 0.0
+        self.total_wait = 0.0
+        self._updated_at = time.monotonic()
+        self._waiters: List[List] = []
+        self._counter = itertools.count()
+        self._cond = asyncio.Condition()
+
+    def _leak(self) -> None:
+        now = time.monotonic()
+        self.level = max(0.0, self.level - (now - self._updated_at) * self.leak_rate)
+        self._updated_at = now
+
+    def _delay(self, priority: Priority) -> float:
+        """Seconds until a call at this priority fits under its threshold"""
+        self._leak()
+
+        if priority == Priority.INTERACTIVE:
+            threshold = self.capacity - INTERACTIVE_HEADROOM
+        else:
+            threshold = self.capacity * BACKGROUND_SHARE
+
+        delay = max(0.0, (self.level + 1 - threshold) / self.leak_rate)
+        return max(delay, self.blocked_until - time.monotonic())
+
+    async def acquire(self, priority: Priority = Priority.INTERACTIVE) -> None:
+        """Wait for a slot in the bucket"""
+        entry = [priority, next(self._counter)]
+        started = time.monotonic()
+
+        async with self._cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    if self._waiters[0] is not entry:
+                        await self._cond.wait()
+                        continue
+
+                    delay = self._delay(priority)
+                    if delay <= 0:
+                        heapq.heappop(self._waiters)
+                        self.level += 1
+                        self._cond.notify_all()
+                        break
+
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    self._cond.notify_all()
+                raise
+
+        waited = time.monotonic() - started
+        RATE_LIMIT_WAIT_SECONDS.observe(waited)
+        record_timing("rate_limit_wait", waited)
+        if waited > 0.05:
+            self.total_wait += waited
+            logger.debug(f"Waited {waited:.2f}s for Shopify rate limit on {self.store_id}")
+
+    def observe(self, headers: Mapping[str, str]) -> None:
+        """Sync the local estimate with Shopify's reported bucket state"""
+        call_limit = headers.get("X-Shopify-Shop-Api-Call-Limit")
+        if call_limit:
+            try:
+                used, size = (int(part) for part in call_limit.split("/"))
+            except ValueError:
+                used, size = None, None
+
+            if size:
+                self._leak()
+                self.capacity = size
+                # Shopify leaks a bucket in 20 seconds (40 → 2/s, 400 → 20/s)
+                self.leak_rate = size / 20.0
+                self.level = float(used)
+
+        retry_after = parse_retry_after(headers.get("Retry-After"))
+        if retry_after is not None:
+            self.throttle(retry_after)
+
+    def throttle(self, retry_after: Optional[float] = None) -> None:
+        """Back off after a 429: treat the bucket as full until Retry-After"""
+        self._leak()
+        self.level = float(self.capacity)
+        self.blocked_until = max(
+            self.blocked_until,
+            time.monotonic() + (retry_after if retry_after is not None else 1.0)
+        )
+
+
+class ShopifyRateLimiter:
+    """Registry of per-store buckets shared by every ShopifyService"""
+
+    def __init__(self):
+        self._buckets: Dict[str, StoreBucket] = {}
+
+    def bucket(self, store_id: str) -> StoreBucket:
+        bucket = self._buckets.get(store_id)
+        if bucket is None:
+            bucket = self._buckets[store_id] = StoreBucket(store_id)
+        return bucket
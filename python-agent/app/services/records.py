@@ -0,0 +1,102 @@
+"""
+Compact record shapes for Shopify REST resources.
+
+Listings that ask for whole records (`SELECT *`, bare `FROM` listings, the
+local store's delta sync) request `RECORD_FIELDS` instead of Shopify's full
+JSON, which carries addresses, tax lines, fulfillments and so on that no
+query, join or aggregation reads. `compact_rows` then trims nested objects
+and types money strings as soon as a page is parsed, so the rows that get
+cached, joined and summarized have the same shape as the local store's.
+"""
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional
+
+# Planner domain -> REST resource
+DOMAIN_RESOURCES = {
+    "orders": "orders",
+    "products": "products",
+    "inventory": "inventory_levels",
+    "customers": "customers",
+}
+
+# Top-level fields fetched when a query wants whole records. Covers the
+# local store's columns, the join keys and what answers usually cite.
+RECORD_FIELDS: Dict[str, List[str]] = {
+    "orders": [
+        "id", "name", "created_at", "updated_at", "processed_at", "cancelled_at",
+        "financial_status", "fulfillment_status", "currency", "total_price",
+        "subtotal_price", "total_discounts", "customer", "line_items",
+    ],
+    "products": [
+        "id", "title", "handle", "product_type", "vendor", "status",
+        "created_at", "updated_at", "variants",
+    ],
+    "customers": [
+        "id", "email", "first_name", "last_name", "orders_count", "total_spent",
+        "state", "created_at", "updated_at",
+    ],
+    "inventory_levels": ["inventory_item_id", "location_id", "available", "updated_at"],
+}
+
+# Sub-fields kept on nested objects
+NESTED_FIELDS: Dict[str, FrozenSet[str]] = {
+    "line_items": frozenset({"id", "product_id", "variant_id", "name", "title", "sku", "quantity", "price"}),
+    "customer": frozenset({"id", "email", "first_name", "last_name"}),
+    "variants": frozenset({"id", "title", "sku", "price", "inventory_item_id", "inventory_quantity"}),
+}
+
+# Decimal strings in the REST payload, stored as floats (as the local store does)
+MONEY_FIELDS = frozenset({"total_price", "subtotal_price", "total_discounts", "total_spent", "price"})
+
+
+def _money(value: Any) -> Any:
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _compact(row: Dict[str, Any], keep: Optional[FrozenSet[str]]) -> Dict[str, Any]:
+    record = {}
+    for key, value in row.items():
+        if keep is not None and key not in keep:
+            continue
+        if key in MONEY_FIELDS:
+            value = _money(value)
+        elif key in NESTED_FIELDS:
+            nested = NESTED_FIELDS[key]
+            if isinstance(value, list):
+                value = [_compact(item, nested) for item in value if isinstance(item, dict)]
+            elif isinstance(value, dict):
+                value = _compact(value, nested)
+        record[key] = value
+    return record
+
+
+def compact_rows(resource: str, rows: List[Dict[str, Any]], fields: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Trim freshly parsed rows to `fields` (or the resource's record fields),
+    keeping only the known sub-fields of nested objects and parsing money
+    strings into floats.
+    """
+    keep = frozenset(fields) if fields else frozenset(RECORD_FIELDS.get(resource, ())) or None
+    return [_compact(row, keep) for row in rows]
+
+
+def flatten_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    One level of columns for a frame: nested objects become `key.field`
+    (scalar fields only) and lists become a `key_count`.
+    """
+    flat = {}
+    for key, value in row.items():
+        if isinstance(value, dict):
+            for inner, inner_value in value.items():
+                if not isinstance(inner_value, (dict, list)):
+                    flat[f"{key}.{inner}"] = inner_value
+        elif isinstance(value, list):
+            flat[f"{key}_count"] = len(value)
+        else:
+            flat[key] = value
+    return flat
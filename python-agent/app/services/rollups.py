@@ -0,0 +1,361 @@
+import logging
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple, TYPE_CHECKING
+
+import pandas as pd
+
+from app.services.aggregation import AggregationEngine
+from app.services.shopifyql import COLUMN_ALIASES, QueryPlan, columns_in, utc_iso
+
+if TYPE_CHECKING:
+    from app.services.local_store import LocalStore
+
+logger = logging.getLogger(__name__)
+
+# Bump when the rollup tables change so existing stores are rebuilt
+ROLLUP_VERSION = 1
+
+# SQLite caps bound parameters per statement
+ID_CHUNK = 500
+
+# Shopify ids are never 0, so 0 stands in for line items without a product
+NO_PRODUCT = 0
+
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollup_daily_products (
+    day TEXT NOT NULL,
+    product_key INTEGER NOT NULL,
+    product_name TEXT,
+    quantity INTEGER NOT NULL DEFAULT 0,
+    revenue REAL NOT NULL DEFAULT 0,
+    line_items INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, product_key)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_daily_sales (
+    day TEXT PRIMARY KEY,
+    orders INTEGER NOT NULL DEFAULT 0,
+    total_sales REAL NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS rollup_inventory_items (
+    inventory_item_id INTEGER PRIMARY KEY,
+    available INTEGER,
+    locations INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS rollup_customer_buckets (
+    orders_count INTEGER PRIMARY KEY,
+    customers INTEGER NOT NULL DEFAULT 0,
+    total_spent REAL NOT NULL DEFAULT 0
+);
+"""
+
+# Rollup read for each aggregation level: SQL, frame columns it provides,
+# and whether it is bounded by order dates
+ROLLUPS = {
+    "line_items": (
+        """
+        SELECT day AS created_at, NULLIF(product_key, 0) AS product_id, product_name,
+               quantity, revenue, line_items AS _rows
+        FROM rollup_daily_products
+        WHERE line_items > 0 {where}
+        """,
+        {"created_at", "product_id", "product_name", "quantity", "revenue"},
+        True,
+    ),
+    "orders": (
+        """
+        SELECT day AS created_at, total_sales AS total_price, orders AS _rows
+        FROM rollup_daily_sales
+        WHERE orders > 0 {where}
+        """,
+        {"created_at", "total_price"},
+        True,
+    ),
+    "customers": (
+        """
+        SELECT orders_count, total_spent, customers AS _rows
+        FROM rollup_customer_buckets
+        WHERE customers > 0 {where}
+        """,
+        {"orders_count", "total_spent"},
+        False,
+    ),
+    "inventory": (
+        """
+        SELECT inventory_item_id, available, locations AS _rows
+        FROM rollup_inventory_items
+        WHERE locations > 0 {where}
+        """,
+        {"inventory_item_id", "available"},
+        False,
+    ),
+}
+
+DATE_PARAMS = {"created_at_min", "created_at_max"}
+
+# Columns undated rollups are keyed by, so WHERE can filter whole buckets
+# (aggregates over them still need raw rows, see rollup_compatible)
+DIMENSIONS = {
+    "customers": {"orders_count"},
+    "inventory": {"inventory_item_id"},
+}
+
+
+def _chunks(ids: List[Any]) -> List[List[Any]]:
+    return [ids[i:i + ID_CHUNK] for i in range(0, len(ids), ID_CHUNK)]
+
+
+# Maintenance (runs inside LocalStore's write transaction)
+
+def apply_orders(conn: sqlite3.Connection, order_ids: List[int], sign: int) -> None:
+    """
+    Add (sign=1) or retract (sign=-1) the stored orders' contribution to the
+    daily rollups. Callers retract before replacing an order and apply after,
+    so an edited order moves its totals instead of double counting.
+    """
+    for chunk in _chunks(order_ids):
+        placeholders = ",".join("?" * len(chunk))
+
+        products = conn.execute(
+            f"""
+            SELECT substr(o.created_at, 1, 10) AS day,
+                   COALESCE(li.product_id, {NO_PRODUCT}) AS product_key,
+                   MAX(li.name) AS product_name,
+                   SUM(COALESCE(li.quantity, 0)) AS quantity,
+                   SUM(COALESCE(li.quantity, 0) * COALESCE(li.price, 0)) AS revenue,
+                   COUNT(*) AS line_items
+            FROM orders o JOIN line_items li ON li.order_id = o.id
+            WHERE o.id IN ({placeholders}) AND o.created_at IS NOT NULL
+            GROUP BY day, product_key
+            """,
+            chunk
+        ).fetchall()
+        conn.executemany(
+            """
+            INSERT INTO rollup_daily_products (day, product_key, product_name, quantity, revenue, line_items)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (day, product_key) DO UPDATE SET
+                product_name = COALESCE(excluded.product_name, product_name),
+                quantity = quantity + excluded.quantity,
+                revenue = revenue + excluded.revenue,
+                line_items = line_items + excluded.line_items
+            """,
+            [
+                (
+                    row["day"], row["product_key"], row["product_name"] if sign > 0 else None,
+                    sign * row["quantity"], sign * row["revenue"], sign * row["line_items"]
+                )
+                for row in products
+            ]
+        )
+
+        totals = conn.execute(
+            f"""
+            SELECT substr(created_at, 1, 10) AS day, COUNT(*) AS orders,
+                   SUM(COALESCE(total_price, 0)) AS total_sales
+            FROM orders
+            WHERE id IN ({placeholders}) AND created_at IS NOT NULL
+            GROUP BY day
+            """,
+            chunk
+        ).fetchall()
+        conn.executemany(
+            """
+            INSERT INTO rollup_daily_sales (day, orders, total_sales) VALUES (?, ?, ?)
+            ON CONFLICT (day) DO UPDATE SET
+                orders = orders + excluded.orders,
+                total_sales = total_sales + excluded.total_sales
+            """,
+            [(row["day"], sign * row["orders"], sign * row["total_sales"]) for row in totals]
+        )
+
+    if sign < 0:
+        conn.execute("DELETE FROM rollup_daily_products WHERE line_items <= 0")
+        conn.execute("DELETE FROM rollup_daily_sales WHERE orders <= 0")
+
+
+def apply_customers(conn: sqlite3.Connection, customer_ids: List[int], sign: int) -> None:
+    """Add or retract the stored customers from their order-count buckets"""
+    for chunk in _chunks(customer_ids):
+        placeholders = ",".join("?" * len(chunk))
+        buckets = conn.execute(
+            f"""
+            SELECT COALESCE(orders_count, 0) AS orders_count, COUNT(*) AS customers,
+                   SUM(COALESCE(total_spent, 0)) AS total_spent
+            FROM customers WHERE id IN ({placeholders})
+            GROUP BY 1
+            """,
+            chunk
+        ).fetchall()
+        conn.executemany(
+            """
+            INSERT INTO rollup_customer_buckets (orders_count, customers, total_spent) VALUES (?, ?, ?)
+            ON CONFLICT (orders_count) DO UPDATE SET
+                customers = customers + excluded.customers,
+                total_spent = total_spent + excluded.total_spent
+            """,
+            [(row["orders_count"], sign * row["customers"], sign * row["total_spent"]) for row in buckets]
+        )
+
+    if sign < 0:
+        conn.execute("DELETE FROM rollup_customer_buckets WHERE customers <= 0")
+
+
+def refresh_inventory_items(conn: sqlite3.Connection, item_ids: List[int]) -> None:
+    """Recompute per-item totals across locations for the touched items"""
+    for chunk in _chunks(sorted(set(item_ids))):
+        placeholders = ",".join("?" * len(chunk))
+        conn.execute(f"DELETE FROM rollup_inventory_items WHERE inventory_item_id IN ({placeholders})", chunk)
+        conn.execute(
+            f"""
+            INSERT INTO rollup_inventory_items (inventory_item_id, available, locations)
+            SELECT inventory_item_id, SUM(available), COUNT(*)
+            FROM inventory_levels WHERE inventory_item_id IN ({placeholders})
+            GROUP BY inventory_item_id
+            """,
+            chunk
+        )
+
+
+def rebuild(conn: sqlite3.Connection) -> None:
+    """Recompute every rollup from the base tables"""
+    for table in ("rollup_daily_products", "rollup_daily_sales", "rollup_inventory_items", "rollup_customer_buckets"):
+        conn.execute(f"DELETE FROM {table}")
+
+    apply_orders(conn, [row[0] for row in conn.execute("SELECT id FROM orders")], 1)
+    apply_customers(conn, [row[0] for row in conn.execute("SELECT id FROM customers")], 1)
+    refresh_inventory_items(conn, [row[0] for row in conn.execute("SELECT DISTINCT inventory_item_id FROM inventory_levels")])
+
+
+# Reads
+
+def _iso(value: datetime) -> str:
+    return value.isoformat(timespec="seconds")
+
+
+def _day_window(params: Dict[str, Any]) -> Tuple[Optional[Tuple[Optional[str], Optional[str]]], List[Tuple[str, str]]]:
+    """
+    Split a created_at window into whole days answered from the rollups and
+    the partial edge ranges that still need raw orders.
+
+    Returns ((first day, last day) or None if no whole day fits,
+    [(edge min, edge max)]); either day is None for an open end.
+    """
+    low = params.get("created_at_min")
+    high = params.get("created_at_max")
+    low = datetime.fromisoformat(utc_iso(low)) if low else None
+    high = datetime.fromisoformat(utc_iso(high)) if high else None
+
+    day = timedelta(days=1)
+    second = timedelta(seconds=1)
+
+    # Whole days are [start, end): start rounds low up, end rounds high + 1s down
+    start = end = None
+    if low is not None:
+        start = low.replace(hour=0, minute=0, second=0, microsecond=0)
+        if start < low:
+            start += day
+    if high is not None:
+        end = (high + second).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    if start is not None and end is not None and start >= end:
+        # No whole day inside the window: read it all from raw orders
+        return None, [(_iso(low), _iso(high))] if low <= high else []
+
+    edges: List[Tuple[str, str]] = []
+    if low is not None and low < start:
+        edges.append((_iso(low), _iso(start - second)))
+    if high is not None and end <= high:
+        edges.append((_iso(end), _iso(high)))
+
+    first_day = start.date().isoformat() if start is not None else None
+    last_day = (end - day).date().isoformat() if end is not None else None
+    return (first_day, last_day), edges
+
+
+def _where_columns(plan: QueryPlan) -> Set[str]:
+    aliases = COLUMN_ALIASES.get(plan.domain, {})
+    return {aliases.get(name, name) for name in columns_in(plan.query.where)}
+
+
+def _read(store: "LocalStore", sql: str, args: List[Any]) -> pd.DataFrame:
+    with store._connect() as conn:
+        return pd.read_sql_query(sql, conn, params=args)
+
+
+async def query_rollups(store: "LocalStore", plan: QueryPlan) -> Optional[List[Dict[str, Any]]]:
+    """
+    Answer an aggregate plan from the store's rollups, or None if the plan
+    needs columns, filters or functions the rollups do not carry.
+    """
+    if not plan.aggregates:
+        return None
+
+    engine = AggregationEngine(plan)
+    level = engine.level if plan.domain == "orders" else plan.domain
+    if level not in ROLLUPS:
+        return None
+
+    sql, columns, dated = ROLLUPS[level]
+    if not engine.rollup_compatible(columns, DIMENSIONS.get(level, set())):
+        return None
+
+    clauses: List[str] = []
+    args: List[Any] = []
+    edges: List[Tuple[str, str]] = []
+    predicate = None
+    read_rollup = True
+
+    if dated:
+        # Only a created_at window can be served: other filters need raw rows
+        params = plan.api_params()
+        params.pop("fields", None)
+        if plan.residual is not None or set(params) - DATE_PARAMS:
+            return None
+        days, edges = _day_window(params)
+        if days is None:
+            read_rollup = False
+        else:
+            first_day, last_day = days
+            if first_day is not None:
+                clauses.append("day >= ?")
+                args.append(first_day)
+            if last_day is not None:
+                clauses.append("day <= ?")
+                args.append(last_day)
+    else:
+        # Filters on the rollup's own dimensions are evaluated per bucket
+        query = plan.query
+        if query.since is not None or query.until is not None or query.during:
+            return None
+        if not _where_columns(plan) <= DIMENSIONS[level]:
+            return None
+        if query.where is not None:
+            predicate = plan.matches_all
+
+    frame = pd.DataFrame()
+    if read_rollup:
+        frame = await store._run(_read, store, sql.format(where="".join(f" AND {c}" for c in clauses)), args)
+
+    if not frame.empty:
+        if predicate is not None:
+            keep = [predicate(row) for row in frame.drop(columns=["_rows"]).to_dict("records")]
+            frame = frame[keep].copy()
+        if "created_at" in frame:
+            frame["created_at"] = pd.to_datetime(frame["created_at"])
+        # Match the float sums the raw-row path produces
+        for column in ("quantity", "revenue", "total_price", "total_spent", "available"):
+            if column in frame:
+                frame[column] = frame[column].astype("float64")
+        if not frame.empty:
+            engine.add_rollup(frame.drop(columns=["_rows"]), frame["_rows"])
+
+    for edge_min, edge_max in edges:
+        async for page in store.iter_pages("orders", {"created_at_min": edge_min, "created_at_max": edge_max}):
+            engine.add_page(page)
+
+    logger.info(f"Answered {plan.table} aggregate from rollups for {store.store_id}")
+    return engine.result()
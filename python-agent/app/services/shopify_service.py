@@ -1,204 +1,533 @@
-import requests
-from typing import Dict, Any, List, Optional
+import os
+import time
+import asyncio
+import httpx
+from typing import Dict, Any, List, Optional, AsyncIterator, Callable
 import logging
 from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_random_exponential
+)
+from app.services.http_client import ShopifyClientPool
+from app.services.admission import request_deadline
+from app.services.bulk_operations import (
+    BULK_DEADLINE_HEADROOM, BulkOperationError, BulkOperationRunner, BulkOperationTimeout, iter_bulk_orders
+)
+from app.services.rate_limiter import Priority, ShopifyRateLimiter, ShopifyRateLimitError, parse_retry_after
+from app.services.local_store import LocalStore
+from app.services.records import compact_rows
+from app.services.shopifyql import QueryPlan, plan_query
+from app.services.aggregation import aggregate_pages
+from app.services.singleflight import SingleFlight
+from app.services.metrics import (
+    ROWS_PROCESSED, SHOPIFY_PAGES, SHOPIFY_REQUEST_SECONDS, SHOPIFY_ROWS, endpoint_label, record_timing
+)
 
 logger = logging.getLogger(__name__)
 
+# Shopify REST maximum page size
+PAGE_SIZE = 250
+
+# Date ranges longer than this are split into concurrently fetched windows
+TIME_SLICE_DAYS = int(os.getenv("SHOPIFY_TIME_SLICE_DAYS", "7"))
+MAX_TIME_SLICES = int(os.getenv("SHOPIFY_MAX_TIME_SLICES", "8"))
+
+# Default number of raw rows returned when the query has no LIMIT
+DEFAULT_ROW_LIMIT = 50
+
+# Aggregations estimated above this many orders use a GraphQL bulk export
+BULK_OPERATIONS_ENABLED = os.getenv("SHOPIFY_BULK_OPERATIONS", "true").lower() == "true"
+BULK_ROW_THRESHOLD = int(os.getenv("SHOPIFY_BULK_ROW_THRESHOLD", "25000"))
+
+# inventory_levels needs location_ids (at most 50 per request) or inventory_item_ids
+INVENTORY_LOCATION_BATCH = 50
+
+# Attempts per request on throttling, 5xx and transport errors
+MAX_REQUEST_ATTEMPTS = int(os.getenv("SHOPIFY_MAX_REQUEST_ATTEMPTS", "5"))
+
+Pages = AsyncIterator[List[Dict[str, Any]]]
+
+# Coalesces identical in-flight GETs (same shop, endpoint and params) across agents
+ENDPOINT_FLIGHT = SingleFlight("shopify")
+
+class ShopifyGraphQLError(Exception):
+    """Raised when the GraphQL Admin API returns top-level errors"""
+
 class ShopifyService:
     """Service for interacting with Shopify Admin API"""
     
-    def __init__(self, store_id: str, access_token: str, api_version: str = "2024-01"):
+    def __init__(
+        self,
+        store_id: str,
+        access_token: str,
+        http_pool: ShopifyClientPool,
+        rate_limiter: ShopifyRateLimiter,
+        api_version: str = "2024-01",
+        priority: Priority = Priority.INTERACTIVE
+    ):
         self.store_id = store_id
         self.access_token = access_token
         self.api_version = api_version
         self.base_url = f"https://{store_id}/admin/api/{api_version}"
+        # The app's pool and limiter: a private one per service would leak clients and split the shop's bucket
+        self.http_pool = http_pool
+        self.rate_limiter = rate_limiter
+        self.priority = priority
+        self._location_ids: Optional[List[str]] = None
+    
+    @staticmethod
+    def _is_retryable(error: BaseException) -> bool:
+        """Throttling, server errors and dropped connections are retried"""
+        if isinstance(error, (ShopifyRateLimitError, httpx.TransportError)):
+            return True
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code >= 500
+        return False
         
-    def _make_request(self, endpoint: str, params: Optional[Dict] = None) -> Dict:
-        """Make authenticated request to Shopify API"""
+    async def _send(
+        self,
+        endpoint: str,
+        params: Optional[Dict] = None,
+        method: str = "GET",
+        json_body: Optional[Dict] = None
+    ) -> httpx.Response:
+        """Send authenticated request to Shopify API (identical concurrent GETs share one call)"""
+        if method != "GET":
+            return await self._request(endpoint, params, method, json_body)
+        
+        key = (self.base_url, endpoint, tuple(sorted((k, str(v)) for k, v in (params or {}).items())))
+        return await ENDPOINT_FLIGHT.do(key, lambda: self._request(endpoint, params))
+    
+    async def _request(
+        self,
+        endpoint: str,
+        params: Optional[Dict] = None,
+        method: str = "GET",
+        json_body: Optional[Dict] = None
+    ) -> httpx.Response:
         headers = {
             "X-Shopify-Access-Token": self.access_token,
             "Content-Type": "application/json"
         }
         
         url = f"{self.base_url}/{endpoint}.json"
+        client = await self.http_pool.get_client(self.store_id)
+        bucket = self.rate_limiter.bucket(self.store_id)
+        
+        retrying = AsyncRetrying(
+            retry=retry_if_exception(self._is_retryable),
+            wait=wait_random_exponential(multiplier=0.5, max=8),
+            stop=stop_after_attempt(MAX_REQUEST_ATTEMPTS),
+            reraise=True
+        )
         
         try:
-            response = requests.get(url, headers=headers, params=params, timeout=10)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
+            async for attempt in retrying:
+                with attempt:
+                    await bucket.acquire(self.priority)
+                    started = time.perf_counter()
+                    try:
+                        response = await client.request(
+                            method, url, headers=headers, params=params, json=json_body
+                        )
+                    except httpx.TransportError:
+                        self._observe(endpoint, "error", started)
+                        raise
+                    self._observe(endpoint, response.status_code, started)
+                    bucket.observe(response.headers)
+                    
+                    if response.status_code == 429:
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                        logger.warning(f"Shopify throttled {self.store_id}, retry after {retry_after}s")
+                        raise ShopifyRateLimitError(self.store_id, retry_after)
+                    
+                    response.raise_for_status()
+                    return response
+        except (httpx.HTTPError, ShopifyRateLimitError) as e:
             logger.error(f"Shopify API error: {str(e)}")
             raise
     
-    async def query_orders(self, query: str) -> List[Dict[str, Any]]:
-        """Query orders data"""
-        # Parse query to extract filters
-        filters = self._parse_query_filters(query)
+    @staticmethod
+    def _observe(endpoint: str, status: Any, started: float) -> None:
+        elapsed = time.perf_counter() - started
+        SHOPIFY_REQUEST_SECONDS.observe(elapsed, endpoint=endpoint_label(endpoint), status=status)
+        record_timing("shopify", elapsed)
+    
+    async def _make_request(self, endpoint: str, params: Optional[Dict] = None) -> Dict:
+        """Make authenticated request to Shopify API"""
+        response = await self._send(endpoint, params)
+        return response.json()
+    
+    async def graphql(self, query: str, variables: Optional[Dict] = None) -> Dict:
+        """Run a GraphQL Admin API request and return its data"""
+        response = await self._send(
+            "graphql", method="POST", json_body={"query": query, "variables": variables or {}}
+        )
+        body = response.json()
         
-        # Build API parameters
-        params = {
-            "status": "any",
-            "limit": filters.get("limit", 50)
-        }
+        if body.get("errors"):
+            raise ShopifyGraphQLError(str(body["errors"]))
+        
+        return body.get("data") or {}
+    
+    async def stream_lines(self, url: str) -> AsyncIterator[str]:
+        """Stream a (pre-signed, unauthenticated) download line by line"""
+        client = await self.http_pool.get_client(urlparse(url).netloc)
+        
+        async with client.stream("GET", url) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                yield line
+    
+    async def _count(self, endpoint: str, params: Dict[str, Any]) -> int:
+        """Ask Shopify how many rows a listing would return"""
+        count_params = {k: v for k, v in params.items() if k not in ("limit", "fields")}
+        result = await self._make_request(f"{endpoint}/count", count_params)
+        return result.get("count", 0)
+    
+    async def _iter_bulk_orders(self, params: Dict[str, Any]) -> Pages:
+        """
+        Stream orders from a bulk export, falling back to REST paging. Within
+        a request the export must finish before the request's deadline
+        (BulkOperationTimeout otherwise); jobs wait as long as it takes.
+        """
+        runner = BulkOperationRunner(self)
+        deadline = request_deadline()
+        if deadline is not None and deadline - BULK_DEADLINE_HEADROOM <= time.monotonic():
+            raise BulkOperationTimeout("Not enough time left in this request for a bulk export; submit it to /api/jobs instead")
+        
+        try:
+            operation_id = await runner.submit(runner.build_orders_query(params))
+            url = await runner.wait(operation_id, deadline)
+        except (BulkOperationError, ShopifyGraphQLError) as e:
+            logger.warning(f"Bulk operation unavailable, falling back to REST paging: {str(e)}")
+            async for page in self._iter_pages("orders", "orders", params):
+                yield page
+            return
+        
+        if url:
+            async for page in iter_bulk_orders(url, self):
+                yield page
+    
+    @staticmethod
+    def _next_page_info(response: httpx.Response) -> Optional[str]:
+        """Extract the next page_info cursor from the Link header"""
+        next_url = response.links.get("next", {}).get("url")
+        if not next_url:
+            return None
         
-        if filters.get("created_at_min"):
-            params["created_at_min"] = filters["created_at_min"]
+        values = parse_qs(urlparse(next_url).query).get("page_info")
+        return values[0] if values else None
+    
+    async def _paginate(
+        self,
+        endpoint: str,
+        resource: str,
+        params: Dict[str, Any],
+        max_rows: Optional[int] = None
+    ) -> Pages:
+        """Yield pages of a resource by following Link header cursors"""
+        page_size = min(max_rows, PAGE_SIZE) if max_rows else PAGE_SIZE
+        page_params = {**params, "limit": page_size}
+        fields = params["fields"].split(",") if params.get("fields") else None
+        fetched = 0
+        
+        while True:
+            response = await self._send(endpoint, page_params)
+            # Compact on parse: only the projected fields and trimmed nested objects are kept
+            rows = compact_rows(resource, response.json().get(resource, []), fields)
+            SHOPIFY_PAGES.inc(resource=resource)
+            SHOPIFY_ROWS.inc(len(rows), resource=resource)
+            
+            if max_rows is not None:
+                rows = rows[:max_rows - fetched]
+            fetched += len(rows)
+            
+            if rows:
+                yield rows
+            
+            page_info = self._next_page_info(response)
+            if not page_info or (max_rows is not None and fetched >= max_rows):
+                break
+            
+            # Shopify rejects filter params alongside page_info
+            page_params = {"limit": page_size, "page_info": page_info}
+            if "fields" in params:
+                page_params["fields"] = params["fields"]
+    
+    async def location_ids(self) -> List[str]:
+        """The shop's location ids (fetched once per service)"""
+        if self._location_ids is None:
+            rows = await self._collect(self._paginate("locations", "locations", {"fields": "id"}))
+            self._location_ids = [str(row["id"]) for row in rows if row.get("id")]
+        return self._location_ids
+    
+    async def _iter_inventory_levels(self, params: Dict[str, Any], max_rows: Optional[int] = None) -> Pages:
+        """Page inventory levels across every location, in batches Shopify accepts"""
+        locations = await self.location_ids()
+        fetched = 0
+        
+        for i in range(0, len(locations), INVENTORY_LOCATION_BATCH):
+            batch = {**params, "location_ids": ",".join(locations[i:i + INVENTORY_LOCATION_BATCH])}
+            remaining = max_rows - fetched if max_rows is not None else None
+            async for page in self._paginate("inventory_levels", "inventory_levels", batch, remaining):
+                fetched += len(page)
+                yield page
+            if max_rows is not None and fetched >= max_rows:
+                return
+    
+    @staticmethod
+    def _split_windows(params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Split a created_at range into contiguous, non-overlapping windows"""
+        if not params.get("created_at_min"):
+            return [params]
         
-        if filters.get("created_at_max"):
-            params["created_at_max"] = filters["created_at_max"]
+        start = datetime.fromisoformat(params["created_at_min"])
+        end = (
+            datetime.fromisoformat(params["created_at_max"])
+            if params.get("created_at_max")
+            else datetime.now(start.tzinfo)
+        )
         
-        # Fetch orders
-        result = self._make_request("orders", params)
-        orders = result.get("orders", [])
+        slices = min(MAX_TIME_SLICES, (end - start).days // TIME_SLICE_DAYS)
+        if slices <= 1:
+            return [params]
+        
+        step = (end - start) / slices
+        windows = []
+        for i in range(slices):
+            window_min = start + step * i
+            window_max = end if i == slices - 1 else start + step * (i + 1) - timedelta(seconds=1)
+            windows.append({
+                **params,
+                "created_at_min": window_min.isoformat(timespec="seconds"),
+                "created_at_max": window_max.isoformat(timespec="seconds")
+            })
+        
+        return windows
+    
+    async def _iter_pages(
+        self,
+        endpoint: str,
+        resource: str,
+        params: Dict[str, Any],
+        max_rows: Optional[int] = None
+    ) -> Pages:
+        """
+        Stream pages for a query. Full-range scans over long date ranges are
+        fetched as concurrent time slices; pages are handed to the consumer as
+        soon as any slice produces them, with a bounded buffer in between.
+        """
+        if endpoint == "inventory_levels" and not (params.get("location_ids") or params.get("inventory_item_ids")):
+            async for page in self._iter_inventory_levels(params, max_rows):
+                yield page
+            return
+        
+        windows = self._split_windows(params) if max_rows is None else [params]
+        
+        if len(windows) == 1:
+            async for page in self._paginate(endpoint, resource, params, max_rows):
+                yield page
+            return
+        
+        queue: asyncio.Queue = asyncio.Queue(maxsize=len(windows) * 2)
+        done = object()
+        
+        async def produce(window_params: Dict[str, Any]) -> None:
+            # Each slice ends with one item: `done` or its error. A cancelled
+            # slice puts nothing, so cleanup never waits on a full queue.
+            try:
+                async for page in self._paginate(endpoint, resource, window_params):
+                    await queue.put(page)
+                last = done
+            except Exception as e:
+                last = e
+            await queue.put(last)
+        
+        tasks = [asyncio.create_task(produce(window)) for window in windows]
+        logger.info(f"Fetching {endpoint} in {len(windows)} concurrent time slices")
+        
+        try:
+            remaining = len(tasks)
+            while remaining:
+                item = await queue.get()
+                if item is done:
+                    remaining -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def _source_pages(
+        self,
+        source: Optional[LocalStore],
+        endpoint: str,
+        resource: str,
+        params: Dict[str, Any],
+        max_rows: Optional[int] = None
+    ) -> Pages:
+        """Read pages from the local store when given one, otherwise from the API"""
+        if source is not None:
+            return source.iter_pages(resource, params, max_rows)
+        return self._iter_pages(endpoint, resource, params, max_rows)
+    
+    @staticmethod
+    async def _collect(pages: Pages) -> List[Dict[str, Any]]:
+        """Materialize a page stream into a single list"""
+        rows = []
+        async for page in pages:
+            rows.extend(page)
+        return rows
+    
+    @staticmethod
+    def _row_predicate(plan: QueryPlan, source: Optional[LocalStore]) -> Optional[Callable[[Dict], bool]]:
+        """Local filter for rows: the residual for the API, the full WHERE for local reads"""
+        if source is not None:
+            return plan.matches_all if plan.query.where is not None else None
+        return plan.matches if plan.residual is not None else None
+    
+    async def _select_rows(
+        self,
+        pages: Pages,
+        plan: QueryPlan,
+        source: Optional[LocalStore],
+        limit: Optional[int]
+    ) -> List[Dict[str, Any]]:
+        """Filter, order and limit raw (non-aggregated) rows"""
+        predicate = self._row_predicate(plan, source)
+        
+        if plan.query.order_by:
+            rows = plan.sort_rows(await self._take(pages, None, predicate))
+            return rows[:limit] if limit else rows
+        
+        return await self._take(pages, limit, predicate)
+    
+    def _row_pages(
+        self,
+        source: Optional[LocalStore],
+        endpoint: str,
+        resource: str,
+        params: Dict[str, Any],
+        plan: QueryPlan,
+        limit: Optional[int]
+    ) -> Pages:
+        """Page stream for a raw listing; stops early only when nothing is filtered or sorted locally"""
+        bounded = self._row_predicate(plan, source) is None and not plan.query.order_by
+        return self._source_pages(source, endpoint, resource, params, limit if bounded else None)
+    
+    async def query_orders(self, query: str, source: Optional[LocalStore] = None) -> List[Dict[str, Any]]:
+        """Query orders data"""
+        plan = plan_query(query)
+        
+        # Pushed-down filters become API parameters
+        params = {"status": "any", **plan.api_params()}
+        
+        # Aggregations need the full range; raw listings stop at the limit
+        if not plan.aggregates:
+            limit = plan.limit or DEFAULT_ROW_LIMIT
+            pages = self._row_pages(source, "orders", "orders", params, plan, limit)
+            return await self._select_rows(pages, plan, source, limit)
+        
+        if source is not None:
+            pages = source.iter_pages("orders", params)
+        elif BULK_OPERATIONS_ENABLED and await self._count("orders", params) > BULK_ROW_THRESHOLD:
+            pages = self._iter_bulk_orders(params)
+        else:
+            pages = self._iter_pages("orders", "orders", params)
         
         # Apply additional filtering and aggregation
-        processed_data = self._process_orders(orders, query)
+        processed_data = await self._process_orders(pages, plan, self._row_predicate(plan, source))
         
         return processed_data
     
-    async def query_products(self, query: str) -> List[Dict[str, Any]]:
+    async def query_products(self, query: str, source: Optional[LocalStore] = None) -> List[Dict[str, Any]]:
         """Query products data"""
-        filters = self._parse_query_filters(query)
+        plan = plan_query(query)
+        limit = plan.limit or DEFAULT_ROW_LIMIT
         
-        params = {
-            "limit": filters.get("limit", 50)
-        }
+        if plan.aggregates:
+            pages = self._source_pages(source, "products", "products", plan.api_params())
+            return await aggregate_pages(pages, plan, self._row_predicate(plan, source))
         
-        result = self._make_request("products", params)
-        products = result.get("products", [])
+        pages = self._row_pages(source, "products", "products", plan.api_params(), plan, limit)
         
-        return self._process_products(products, query)
+        return await self._select_rows(pages, plan, source, limit)
     
-    async def query_inventory(self, query: str) -> List[Dict[str, Any]]:
+    async def query_inventory(self, query: str, source: Optional[LocalStore] = None) -> List[Dict[str, Any]]:
         """Query inventory data"""
-        filters = self._parse_query_filters(query)
+        plan = plan_query(query)
         
-        # Get inventory levels
-        params = {"limit": filters.get("limit", 50)}
+        # Filtered scans (e.g. low stock) return every match unless limited
+        limit = plan.limit or (None if plan.query.where else DEFAULT_ROW_LIMIT)
+        
+        if plan.aggregates:
+            pages = self._source_pages(source, "inventory_levels", "inventory_levels", plan.api_params())
+            return await aggregate_pages(pages, plan, self._row_predicate(plan, source))
         
-        result = self._make_request("inventory_levels", params)
-        inventory = result.get("inventory_levels", [])
+        # Get inventory levels
+        pages = self._row_pages(source, "inventory_levels", "inventory_levels", plan.api_params(), plan, limit)
         
-        return self._process_inventory(inventory, query)
+        return await self._select_rows(pages, plan, source, limit)
     
-    async def query_customers(self, query: str) -> List[Dict[str, Any]]:
+    async def query_customers(self, query: str, source: Optional[LocalStore] = None) -> List[Dict[str, Any]]:
         """Query customers data"""
-        filters = self._parse_query_filters(query)
+        plan = plan_query(query)
         
-        params = {
-            "limit": filters.get("limit", 50)
-        }
+        # Filtered scans (e.g. repeat customers) return every match unless limited
+        limit = plan.limit or (None if plan.query.where else DEFAULT_ROW_LIMIT)
         
-        if filters.get("created_at_min"):
-            params["created_at_min"] = filters["created_at_min"]
+        if plan.aggregates:
+            pages = self._source_pages(source, "customers", "customers", plan.api_params())
+            return await aggregate_pages(pages, plan, self._row_predicate(plan, source))
         
-        result = self._make_request("customers", params)
-        customers = result.get("customers", [])
+        pages = self._row_pages(source, "customers", "customers", plan.api_params(), plan, limit)
         
-        return self._process_customers(customers, query)
+        return await self._select_rows(pages, plan, source, limit)
     
     def _parse_query_filters(self, query: str) -> Dict[str, Any]:
-        """Extract filters from ShopifyQL-like query"""
-        filters = {}
-        query_lower = query.lower()
+        """Extract the API-level filters from a ShopifyQL query"""
+        plan = plan_query(query)
+        filters = plan.api_params()
         
-        # Extract LIMIT
-        if "limit" in query_lower:
-            try:
-                limit_idx = query_lower.index("limit")
-                limit_value = query[limit_idx:].split()[1]
-                filters["limit"] = int(limit_value)
-            except (ValueError, IndexError):
-                pass
-        
-        # Extract date filters
-        if "last" in query_lower and "day" in query_lower:
-            if "7 day" in query_lower or "week" in query_lower:
-                days = 7
-            elif "30 day" in query_lower or "month" in query_lower:
-                days = 30
-            elif "90 day" in query_lower:
-                days = 90
-            else:
-                days = 7
-            
-            filters["created_at_min"] = (
-                datetime.now() - timedelta(days=days)
-            ).isoformat()
+        if plan.limit:
+            filters["limit"] = plan.limit
         
         return filters
     
-    def _process_orders(self, orders: List[Dict], query: str) -> List[Dict[str, Any]]:
-        """Process and aggregate order data"""
-        query_lower = query.lower()
-        
-        # Check if we need to group by product
-        if "group by product" in query_lower or "by product" in query_lower:
-            product_sales = {}
-            
-            for order in orders:
-                for item in order.get("line_items", []):
-                    product_id = item.get("product_id")
-                    product_name = item.get("name")
-                    quantity = item.get("quantity", 0)
-                    
-                    if product_id not in product_sales:
-                        product_sales[product_id] = {
-                            "product_id": product_id,
-                            "product_name": product_name,
-                            "total_quantity": 0,
-                            "total_revenue": 0
-                        }
-                    
-                    product_sales[product_id]["total_quantity"] += quantity
-                    product_sales[product_id]["total_revenue"] += float(item.get("price", 0)) * quantity
-            
-            result = list(product_sales.values())
-            
-            # Sort by quantity if ORDER BY in query
-            if "order by" in query_lower:
-                result.sort(key=lambda x: x["total_quantity"], reverse=True)
-            
-            return result
+    @staticmethod
+    async def _take(
+        pages: Pages,
+        limit: Optional[int],
+        predicate: Optional[Callable[[Dict], bool]] = None
+    ) -> List[Dict[str, Any]]:
+        """Consume pages until `limit` matching rows are collected"""
+        rows = []
+        try:
+            async for page in pages:
+                ROWS_PROCESSED.inc(len(page), operation="select")
+                for row in page:
+                    if predicate is None or predicate(row):
+                        rows.append(row)
+                        if limit is not None and len(rows) >= limit:
+                            return rows
+        finally:
+            await pages.aclose()
         
-        return orders
-    
-    def _process_products(self, products: List[Dict], query: str) -> List[Dict[str, Any]]:
-        """Process product data"""
-        return products
+        return rows
     
-    def _process_inventory(self, inventory: List[Dict], query: str) -> List[Dict[str, Any]]:
-        """Process inventory data"""
-        query_lower = query.lower()
-        
-        # Filter low stock items
-        if "where" in query_lower and "quantity" in query_lower:
-            try:
-                # Extract threshold
-                threshold = 10  # default
-                if "<" in query:
-                    threshold_str = query.split("<")[1].split()[0]
-                    threshold = int(threshold_str)
-                
-                inventory = [
-                    item for item in inventory
-                    if item.get("available", 0) < threshold
-                ]
-            except (ValueError, IndexError):
-                pass
-        
-        return inventory
-    
-    def _process_customers(self, customers: List[Dict], query: str) -> List[Dict[str, Any]]:
-        """Process customer data"""
-        query_lower = query.lower()
-        
-        # Filter repeat customers
-        if "repeat" in query_lower or "orders_count" in query_lower:
-            customers = [
-                c for c in customers
-                if c.get("orders_count", 0) > 1
-            ]
-        
-        return customers
\ No newline at end of file
+    async def _process_orders(
+        self,
+        pages: Pages,
+        plan: QueryPlan,
+        predicate: Optional[Callable[[Dict], bool]] = None
+    ) -> List[Dict[str, Any]]:
+        """Aggregate orders (or their line items) with the vectorised engine"""
+        return await aggregate_pages(pages, plan, predicate)
@@ -0,0 +1,1115 @@
+import re
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from app.services.records import DOMAIN_RESOURCES, RECORD_FIELDS
+
+logger = logging.getLogger(__name__)
+
+PLAN_CACHE_SIZE = 1024
+
+
+class ShopifyQLSyntaxError(ValueError):
+    """Raised when a query cannot be tokenized or parsed"""
+
+
+# ---------------------------------------------------------------------------
+# AST
+# ---------------------------------------------------------------------------
+
+# Nodes are immutable (sequences held as tuples) since parsed plans are
+# cached and shared between requests.
+
+
+def _freeze(node: Any, *names: str) -> None:
+    for name in names:
+        value = getattr(node, name)
+        if isinstance(value, list):
+            object.__setattr__(node, name, tuple(value))
+
+@dataclass(frozen=True)
+class Column:
+    name: str
+
+
+@dataclass(frozen=True)
+class Literal:
+    value: Any
+
+
+@dataclass(frozen=True)
+class Star:
+    pass
+
+
+@dataclass(frozen=True)
+class Duration:
+    """ShopifyQL relative offset such as -30d or -1m"""
+    amount: int
+    unit: str
+
+
+@dataclass(frozen=True)
+class Interval:
+    """SQL INTERVAL n UNIT"""
+    amount: float
+    unit: str
+
+
+@dataclass(frozen=True)
+class FuncCall:
+    name: str
+    args: Tuple["Expr", ...] = ()
+
+    def __post_init__(self):
+        _freeze(self, "args")
+
+
+@dataclass(frozen=True)
+class BinaryOp:
+    op: str
+    left: "Expr"
+    right: "Expr"
+
+
+@dataclass(frozen=True)
+class Comparison:
+    op: str
+    left: "Expr"
+    right: Any  # Expr, tuple of Expr for IN, (low, high) for BETWEEN
+    negated: bool = False
+
+    def __post_init__(self):
+        _freeze(self, "right")
+
+
+@dataclass(frozen=True)
+class BoolOp:
+    op: str  # "and" | "or"
+    conditions: Tuple["Condition", ...]
+
+    def __post_init__(self):
+        _freeze(self, "conditions")
+
+
+@dataclass(frozen=True)
+class Not:
+    condition: "Condition"
+
+
+@dataclass(frozen=True)
+class SelectItem:
+    expr: "Expr"
+    alias: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class OrderItem:
+    expr: "Expr"
+    descending: bool = False
+
+
+@dataclass(frozen=True)
+class Query:
+    table: str
+    select: Tuple[SelectItem, ...] = ()
+    where: Optional["Condition"] = None
+    group_by: Tuple["Expr", ...] = ()
+    having: Optional["Condition"] = None
+    order_by: Tuple[OrderItem, ...] = ()
+    limit: Optional[int] = None
+    since: Optional["Expr"] = None
+    until: Optional["Expr"] = None
+    during: Optional[str] = None
+
+    def __post_init__(self):
+        _freeze(self, "select", "group_by", "order_by")
+
+
+Expr = Union[Column, Literal, Star, Duration, Interval, FuncCall, BinaryOp]
+Condition = Union[Comparison, BoolOp, Not]
+
+AGGREGATES = {"sum", "count", "avg", "average", "min", "max"}
+
+
+# ---------------------------------------------------------------------------
+# Tokenizer
+# ---------------------------------------------------------------------------
+
+KEYWORDS = {
+    "select", "show", "from", "where", "group", "by", "having", "order", "limit", "asc", "desc",
+    "and", "or", "not", "in", "between", "is", "null", "as", "since", "until", "during",
+    "interval", "like", "true", "false", "offset", "visualize",
+}
+
+# Statements that would modify data are rejected outright
+WRITE_KEYWORDS = {"drop", "delete", "update", "insert", "alter", "truncate", "create", "grant", "merge"}
+
+TOKEN_RE = re.compile(
+    r"""
+    (?P<ws>\s+)
+    |(?P<comment>--[^\n]*)
+    |(?P<string>'(?:[^']|'')*'|"(?:[^"]|"")*")
+    |(?P<date>\d{4}-\d{2}-\d{2}(?:[Tt]\d{2}:\d{2}(?::\d{2})?)?\b)
+    |(?P<duration>[-+]\d+[dwmqy]\b)
+    |(?P<number>\d+(?:\.\d+)?)
+    |(?P<ident>[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*)
+    |(?P<op><=|>=|!=|<>|=|<|>|\+|-|\*|/|,|\(|\)|;)
+    """,
+    re.VERBOSE,
+)
+
+
+@dataclass
+class Token:
+    kind: str  # keyword | ident | string | number | duration | op | eof
+    value: Any
+
+
+def tokenize(query: str) -> List[Token]:
+    """Split a ShopifyQL/SQL-like query into tokens"""
+    tokens: List[Token] = []
+    pos = 0
+
+    while pos < len(query):
+        match = TOKEN_RE.match(query, pos)
+        if not match:
+            raise ShopifyQLSyntaxError(f"Unexpected character {query[pos]!r} at position {pos}")
+        pos = match.end()
+        kind = match.lastgroup
+        text = match.group()
+
+        if kind in ("ws", "comment"):
+            continue
+        if kind == "string":
+            quote = text[0]
+            tokens.append(Token("string", text[1:-1].replace(quote * 2, quote)))
+        elif kind == "date":
+            # Bare ShopifyQL dates (SINCE 2024-01-01) read like quoted ones
+            tokens.append(Token("string", text.upper()))
+        elif kind == "number":
+            tokens.append(Token("number", float(text) if "." in text else int(text)))
+        elif kind == "duration":
+            tokens.append(Token("duration", (int(text[:-1]), text[-1])))
+        elif kind == "ident":
+            lowered = text.lower()
+            if lowered in WRITE_KEYWORDS:
+                raise ShopifyQLSyntaxError(f"Write operation {text.upper()} is not allowed")
+            tokens.append(Token("keyword" if lowered in KEYWORDS else "ident", lowered))
+        elif text != ";":
+            tokens.append(Token("op", text))
+
+    tokens.append(Token("eof", None))
+    return tokens
+
+
+# ---------------------------------------------------------------------------
+# Parser
+# ---------------------------------------------------------------------------
+
+COMPARISON_OPS = {"=", "!=", "<>", "<", "<=", ">", ">="}
+CLAUSE_KEYWORDS = {
+    "select", "show", "from", "where", "group", "having", "order", "limit", "since", "until", "during", "visualize",
+}
+
+
+class Parser:
+    """Recursive-descent parser producing a Query AST"""
+
+    def __init__(self, tokens: List[Token]):
+        self.tokens = tokens
+        self.pos = 0
+
+    @property
+    def current(self) -> Token:
+        return self.tokens[self.pos]
+
+    def _advance(self) -> Token:
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def _at(self, kind: str, value: Any = None) -> bool:
+        token = self.current
+        return token.kind == kind and (value is None or token.value == value)
+
+    def _accept(self, kind: str, value: Any = None) -> Optional[Token]:
+        if self._at(kind, value):
+            return self._advance()
+        return None
+
+    def _expect(self, kind: str, value: Any = None) -> Token:
+        token = self._accept(kind, value)
+        if token is None:
+            expected = value or kind
+            raise ShopifyQLSyntaxError(f"Expected {expected!r} but found {self.current.value!r}")
+        return token
+
+    def parse(self) -> Query:
+        query: Dict[str, Any] = {"table": ""}
+        seen = set()
+
+        while not self._at("eof"):
+            token = self._expect("keyword")
+            clause = token.value
+            if clause not in CLAUSE_KEYWORDS:
+                raise ShopifyQLSyntaxError(f"Unexpected keyword {clause.upper()}")
+            if clause in seen:
+                raise ShopifyQLSyntaxError(f"Duplicate {clause.upper()} clause")
+            seen.add(clause)
+
+            if clause in ("select", "show"):
+                query["select"] = self._parse_select_list()
+            elif clause == "from":
+                query["table"] = self._expect("ident").value
+            elif clause == "where":
+                query["where"] = self._parse_condition()
+            elif clause == "group":
+                self._expect("keyword", "by")
+                query["group_by"] = self._parse_expr_list()
+            elif clause == "having":
+                # Filters groups after aggregation (see AggregationEngine)
+                query["having"] = self._parse_condition()
+            elif clause == "order":
+                self._expect("keyword", "by")
+                query["order_by"] = self._parse_order_list()
+            elif clause == "limit":
+                query["limit"] = int(self._expect("number").value)
+                if self._at("keyword", "offset"):
+                    raise ShopifyQLSyntaxError("OFFSET is not supported")
+            elif clause == "since":
+                query["since"] = self._parse_expr()
+            elif clause == "until":
+                query["until"] = self._parse_expr()
+            elif clause == "during":
+                query["during"] = self._expect("ident").value
+            elif clause == "visualize":
+                # Presentation hint only; skip to the next clause
+                while not self._at("eof") and not (
+                    self.current.kind == "keyword" and self.current.value in CLAUSE_KEYWORDS
+                ):
+                    self._advance()
+
+            # ShopifyQL "SHOW x BY y" is shorthand for GROUP BY
+            if clause in ("select", "show") and self._accept("keyword", "by"):
+                query["group_by"] = self._parse_expr_list()
+
+        if not query["table"]:
+            raise ShopifyQLSyntaxError("Query must contain a FROM clause")
+
+        return Query(**query)
+
+    def _parse_select_list(self) -> List[SelectItem]:
+        items = []
+        while True:
+            expr = self._parse_expr()
+            alias = None
+            if self._accept("keyword", "as"):
+                alias = self._expect("ident").value
+            elif self._at("ident"):
+                alias = self._advance().value
+            items.append(SelectItem(expr, alias))
+            if not self._accept("op", ","):
+                return items
+
+    def _parse_expr_list(self) -> List[Expr]:
+        exprs = [self._parse_expr()]
+        while self._accept("op", ","):
+            exprs.append(self._parse_expr())
+        return exprs
+
+    def _parse_order_list(self) -> List[OrderItem]:
+        items = []
+        while True:
+            expr = self._parse_expr()
+            descending = False
+            if self._accept("keyword", "desc"):
+                descending = True
+            else:
+                self._accept("keyword", "asc")
+            items.append(OrderItem(expr, descending))
+            if not self._accept("op", ","):
+                return items
+
+    # Conditions
+
+    def _parse_condition(self) -> Condition:
+        conditions = [self._parse_and()]
+        while self._accept("keyword", "or"):
+            conditions.append(self._parse_and())
+        return conditions[0] if len(conditions) == 1 else BoolOp("or", conditions)
+
+    def _parse_and(self) -> Condition:
+        conditions = [self._parse_not()]
+        while self._accept("keyword", "and"):
+            conditions.append(self._parse_not())
+        return conditions[0] if len(conditions) == 1 else BoolOp("and", conditions)
+
+    def _parse_not(self) -> Condition:
+        if self._accept("keyword", "not"):
+            return Not(self._parse_not())
+        return self._parse_predicate()
+
+    def _parse_predicate(self) -> Condition:
+        if self._at("op", "("):
+            # Either a parenthesised condition or an expression such as (a + b) > 1
+            start = self.pos
+            try:
+                self._advance()
+                condition = self._parse_condition()
+                self._expect("op", ")")
+                if not (self.current.kind == "op" and self.current.value in COMPARISON_OPS):
+                    return condition
+            except ShopifyQLSyntaxError:
+                pass
+            self.pos = start
+
+        left = self._parse_expr()
+        negated = bool(self._accept("keyword", "not"))
+
+        if self._accept("keyword", "in"):
+            self._expect("op", "(")
+            values = self._parse_expr_list()
+            self._expect("op", ")")
+            return Comparison("in", left, values, negated)
+
+        if self._accept("keyword", "between"):
+            low = self._parse_expr()
+            self._expect("keyword", "and")
+            high = self._parse_expr()
+            return Comparison("between", left, (low, high), negated)
+
+        if self._accept("keyword", "like"):
+            return Comparison("like", left, self._parse_expr(), negated)
+
+        if self._accept("keyword", "is"):
+            is_not = bool(self._accept("keyword", "not"))
+            self._expect("keyword", "null")
+            return Comparison("is_null", left, None, is_not)
+
+        if negated:
+            raise ShopifyQLSyntaxError("Expected IN, BETWEEN or LIKE after NOT")
+
+        if self.current.kind == "op" and self.current.value in COMPARISON_OPS:
+            op = self._advance().value
+            return Comparison("!=" if op == "<>" else op, left, self._parse_expr())
+
+        # Bare boolean column
+        return Comparison("=", left, Literal(True))
+
+    # Expressions
+
+    def _parse_expr(self) -> Expr:
+        left = self._parse_term()
+        while self.current.kind == "op" and self.current.value in ("+", "-"):
+            op = self._advance().value
+            left = BinaryOp(op, left, self._parse_term())
+        return left
+
+    def _parse_term(self) -> Expr:
+        left = self._parse_factor()
+        while self.current.kind == "op" and self.current.value in ("*", "/"):
+            op = self._advance().value
+            left = BinaryOp(op, left, self._parse_factor())
+        return left
+
+    def _parse_factor(self) -> Expr:
+        token = self.current
+
+        if token.kind == "number":
+            self._advance()
+            return Literal(token.value)
+        if token.kind == "string":
+            self._advance()
+            return Literal(token.value)
+        if token.kind == "duration":
+            self._advance()
+            return Duration(*token.value)
+        if self._accept("op", "*"):
+            return Star()
+        if self._accept("op", "-"):
+            return BinaryOp("-", Literal(0), self._parse_factor())
+        if self._accept("op", "("):
+            expr = self._parse_expr()
+            self._expect("op", ")")
+            return expr
+        if self._accept("keyword", "interval"):
+            amount = self._parse_factor()
+            if not isinstance(amount, Literal):
+                raise ShopifyQLSyntaxError("INTERVAL amount must be a literal")
+            unit = self._expect("ident").value
+            return Interval(float(amount.value), unit.rstrip("s"))
+        if self._accept("keyword", "true"):
+            return Literal(True)
+        if self._accept("keyword", "false"):
+            return Literal(False)
+        if self._accept("keyword", "null"):
+            return Literal(None)
+
+        if token.kind == "ident":
+            self._advance()
+            if self._accept("op", "("):
+                args: List[Expr] = []
+                if not self._at("op", ")"):
+                    args = self._parse_expr_list()
+                self._expect("op", ")")
+                return FuncCall(token.value, args)
+            return Column(token.value)
+
+        raise ShopifyQLSyntaxError(f"Unexpected token {token.value!r}")
+
+
+def normalize_query(query: str) -> str:
+    """Canonical form used as the plan cache key (case-folded outside quotes)"""
+    parts = re.split(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")", query.strip().rstrip(";"))
+    return " ".join(
+        part if i % 2 else " ".join(part.lower().split())
+        for i, part in enumerate(parts)
+    ).strip()
+
+
+def parse(query: str) -> Query:
+    """Parse a query into its AST"""
+    return Parser(tokenize(query)).parse()
+
+
+# ---------------------------------------------------------------------------
+# Evaluation
+# ---------------------------------------------------------------------------
+
+# Query column names the LLM uses that differ from the REST field names
+COLUMN_ALIASES = {
+    "inventory": {"quantity": "available", "inventory_quantity": "available", "stock": "available"},
+    "customers": {"order_count": "orders_count", "number_of_orders": "orders_count"},
+    "orders": {"total_sales": "total_price", "order_total": "total_price"},
+    "line_items": {"product_title": "title", "product_name": "title", "product": "product_id"},
+}
+
+DAY_UNITS = {"d": 1, "day": 1, "w": 7, "week": 7}
+MONTH_UNITS = {"m": 1, "month": 1, "q": 3, "quarter": 3, "y": 12, "year": 12}
+SECOND_UNITS = {"second": 1, "minute": 60, "hour": 3600}
+
+
+# Bare date words ShopifyQL accepts in SINCE/UNTIL
+RELATIVE_DATES = {"now", "today", "yesterday"}
+
+
+def _relative_date(name: str, now: datetime) -> datetime:
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if name == "today":
+        return today
+    if name == "yesterday":
+        return today - timedelta(days=1)
+    return now
+
+
+def _add_months(value: datetime, months: int) -> datetime:
+    month_index = value.month - 1 + months
+    year, month = value.year + month_index // 12, month_index % 12 + 1
+    days_in_month = (datetime(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)).day
+    return value.replace(year=year, month=month, day=min(value.day, days_in_month))
+
+
+def _shift(value: datetime, amount: float, unit: str) -> datetime:
+    if unit in DAY_UNITS:
+        return value + timedelta(days=amount * DAY_UNITS[unit])
+    if unit in MONTH_UNITS:
+        return _add_months(value, int(amount * MONTH_UNITS[unit]))
+    if unit in SECOND_UNITS:
+        return value + timedelta(seconds=amount * SECOND_UNITS[unit])
+    raise ShopifyQLSyntaxError(f"Unknown interval unit {unit!r}")
+
+
+def utc_now() -> datetime:
+    """The current time as a naive UTC datetime (the planner's time basis)"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def utc_iso(value: Any) -> Optional[str]:
+    """Normalise ISO timestamps to naive UTC so they compare as strings"""
+    if not value:
+        return value
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, date):
+        # Plan parameters may carry plain dates
+        parsed = datetime(value.year, value.month, value.day)
+    else:
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.isoformat(timespec="seconds")
+
+
+def _iso_utc(value: datetime) -> str:
+    """API parameter form of a naive UTC datetime, with an explicit offset"""
+    return value.replace(tzinfo=timezone.utc).isoformat(timespec="seconds")
+
+
+def _to_datetime(value: Any) -> Any:
+    """Parse ISO strings into naive UTC datetimes (naive input is taken as UTC); pass other values through"""
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, str) and len(value) >= 10 and value[4:5] == "-":
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return value
+    else:
+        return value
+
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def named_range(name: str, now: datetime) -> Tuple[datetime, datetime]:
+    """Resolve a ShopifyQL DURING range such as last_week or last_30_days"""
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    match = re.fullmatch(r"last_(\d+)_days?", name)
+    if match:
+        return now - timedelta(days=int(match.group(1))), now
+    if name == "today":
+        return today, now
+    if name == "yesterday":
+        return today - timedelta(days=1), today - timedelta(seconds=1)
+    if name == "this_week":
+        return today - timedelta(days=today.weekday()), now
+    if name == "last_week":
+        start = today - timedelta(days=today.weekday() + 7)
+        return start, start + timedelta(days=7, seconds=-1)
+    if name == "this_month":
+        return today.replace(day=1), now
+    if name == "last_month":
+        end = today.replace(day=1)
+        return _add_months(end, -1), end - timedelta(seconds=1)
+    if name == "this_year":
+        return today.replace(month=1, day=1), now
+    if name == "last_year":
+        end = today.replace(month=1, day=1)
+        return end.replace(year=end.year - 1), end - timedelta(seconds=1)
+
+    raise ShopifyQLSyntaxError(f"Unknown date range {name!r}")
+
+
+def evaluate(expr: Expr, row: Optional[Dict[str, Any]], now: datetime, table: str = "") -> Any:
+    """Evaluate a scalar expression against a row (None for constant expressions)"""
+    if isinstance(expr, Literal):
+        return expr.value
+    if isinstance(expr, Column):
+        if row is None:
+            if expr.name in RELATIVE_DATES:
+                return _relative_date(expr.name, now)
+            raise ShopifyQLSyntaxError(f"Column {expr.name} used in a constant expression")
+        return column_value(row, expr.name, table)
+    if isinstance(expr, Duration):
+        return _shift(now, expr.amount, expr.unit)
+    if isinstance(expr, Interval):
+        return expr
+    if isinstance(expr, BinaryOp):
+        left = _to_datetime(evaluate(expr.left, row, now, table))
+        right = evaluate(expr.right, row, now, table)
+        if isinstance(right, Interval):
+            sign = 1 if expr.op == "+" else -1
+            return _shift(left, sign * right.amount, right.unit)
+        left, right = _coerce_pair(left, right)
+        if left is None or right is None:
+            return None
+        if expr.op == "+":
+            return left + right
+        if expr.op == "-":
+            return left - right
+        if expr.op == "*":
+            return left * right
+        return left / right if right else None
+    if isinstance(expr, FuncCall):
+        return _call(expr, row, now, table)
+    raise ShopifyQLSyntaxError(f"Cannot evaluate {type(expr).__name__}")
+
+
+def _call(expr: FuncCall, row: Optional[Dict[str, Any]], now: datetime, table: str) -> Any:
+    name = expr.name
+    args = [evaluate(arg, row, now, table) for arg in expr.args]
+
+    if name in ("now", "current_timestamp", "getdate"):
+        return now
+    if name in ("current_date", "today", "curdate"):
+        return now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if name in ("date_sub", "date_add") and len(args) == 2 and isinstance(args[1], Interval):
+        sign = -1 if name == "date_sub" else 1
+        return _shift(_to_datetime(args[0]), sign * args[1].amount, args[1].unit)
+    if name in ("date", "datetime", "timestamp") and len(args) == 1:
+        return _to_datetime(args[0])
+    if name in ("lower", "upper") and len(args) == 1:
+        return getattr(str(args[0]), name)() if args[0] is not None else None
+    if name in AGGREGATES:
+        raise ShopifyQLSyntaxError(f"Aggregate {name.upper()} cannot be evaluated per row")
+
+    raise ShopifyQLSyntaxError(f"Unsupported function {name.upper()}")
+
+
+def column_value(row: Dict[str, Any], name: str, table: str = "") -> Any:
+    """Look up a (possibly dotted or aliased) column in a REST-shaped row"""
+    name = COLUMN_ALIASES.get(table, {}).get(name, name)
+    value: Any = row
+    for part in name.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _coerce_pair(left: Any, right: Any) -> Tuple[Any, Any]:
+    """Make two values comparable (ISO strings vs datetimes, numeric strings vs numbers)"""
+    if isinstance(left, datetime) or isinstance(right, datetime):
+        return _to_datetime(left), _to_datetime(right)
+    if isinstance(left, str) and isinstance(right, str):
+        # Timestamps with different offsets compare as instants, not text
+        parsed = _to_datetime(left), _to_datetime(right)
+        if all(isinstance(value, datetime) for value in parsed):
+            return parsed
+    if isinstance(left, (int, float)) and isinstance(right, str):
+        try:
+            return left, float(right)
+        except ValueError:
+            return str(left), right
+    if isinstance(right, (int, float)) and isinstance(left, str):
+        try:
+            return float(left), right
+        except ValueError:
+            return left, str(right)
+    return left, right
+
+
+def matches(condition: Condition, row: Dict[str, Any], now: datetime, table: str = "") -> bool:
+    """Evaluate a WHERE condition against a row"""
+    if isinstance(condition, BoolOp):
+        if condition.op == "and":
+            return all(matches(c, row, now, table) for c in condition.conditions)
+        return any(matches(c, row, now, table) for c in condition.conditions)
+    if isinstance(condition, Not):
+        return not matches(condition.condition, row, now, table)
+
+    left = evaluate(condition.left, row, now, table)
+    op = condition.op
+
+    if op == "is_null":
+        result = left is None
+    elif op == "in":
+        values = [evaluate(v, row, now, table) for v in condition.right]
+        result = any(_compare("=", left, v) for v in values)
+    elif op == "between":
+        low, high = (evaluate(v, row, now, table) for v in condition.right)
+        result = _compare(">=", left, low) and _compare("<=", left, high)
+    elif op == "like":
+        pattern = evaluate(condition.right, row, now, table)
+        regex = "^" + re.escape(str(pattern)).replace("%", ".*").replace("_", ".") + "$"
+        result = left is not None and re.match(regex, str(left), re.IGNORECASE) is not None
+    else:
+        result = _compare(op, left, evaluate(condition.right, row, now, table))
+
+    return result != condition.negated
+
+
+def _compare(op: str, left: Any, right: Any) -> bool:
+    left, right = _coerce_pair(left, right)
+    if isinstance(left, str) and isinstance(right, str):
+        left, right = left.lower(), right.lower()
+    if op == "=":
+        return left == right
+    if op == "!=":
+        return left != right
+    if left is None or right is None:
+        return False
+    try:
+        if op == "<":
+            return left < right
+        if op == "<=":
+            return left <= right
+        if op == ">":
+            return left > right
+        if op == ">=":
+            return left >= right
+    except TypeError:
+        return False
+    raise ShopifyQLSyntaxError(f"Unknown operator {op}")
+
+
+def columns_in(node: Any) -> List[str]:
+    """Every column name referenced by an AST node"""
+    if isinstance(node, Column):
+        return [node.name]
+    if isinstance(node, (list, tuple)):
+        return [name for item in node for name in columns_in(item)]
+    if isinstance(node, (BinaryOp,)):
+        return columns_in(node.left) + columns_in(node.right)
+    if isinstance(node, FuncCall):
+        return columns_in(node.args)
+    if isinstance(node, Comparison):
+        return columns_in(node.left) + columns_in(node.right)
+    if isinstance(node, BoolOp):
+        return columns_in(node.conditions)
+    if isinstance(node, Not):
+        return columns_in(node.condition)
+    if isinstance(node, (SelectItem, OrderItem)):
+        return columns_in(node.expr)
+    return []
+
+
+def aggregate_calls(node: Any) -> List[FuncCall]:
+    """Outermost aggregate calls inside an expression or condition"""
+    if isinstance(node, FuncCall):
+        return [node] if node.name in AGGREGATES else aggregate_calls(node.args)
+    if isinstance(node, (list, tuple)):
+        return [call for item in node for call in aggregate_calls(item)]
+    if isinstance(node, BinaryOp):
+        return aggregate_calls(node.left) + aggregate_calls(node.right)
+    if isinstance(node, Comparison):
+        return aggregate_calls(node.left) + aggregate_calls(node.right)
+    if isinstance(node, BoolOp):
+        return aggregate_calls(node.conditions)
+    if isinstance(node, Not):
+        return aggregate_calls(node.condition)
+    return []
+
+
+def is_constant(expr: Any) -> bool:
+    names = [name for name in columns_in(expr) if name not in RELATIVE_DATES]
+    return not names and not isinstance(expr, Star)
+
+
+def has_aggregate(node: Any) -> bool:
+    if isinstance(node, FuncCall):
+        return node.name in AGGREGATES or any(has_aggregate(a) for a in node.args)
+    if isinstance(node, BinaryOp):
+        return has_aggregate(node.left) or has_aggregate(node.right)
+    if isinstance(node, (SelectItem, OrderItem)):
+        return has_aggregate(node.expr)
+    return False
+
+
+# ---------------------------------------------------------------------------
+# Planner
+# ---------------------------------------------------------------------------
+
+TABLE_DOMAINS = {
+    "orders": "orders",
+    "sales": "orders",
+    "line_items": "orders",
+    "products": "products",
+    "inventory": "inventory",
+    "inventory_levels": "inventory",
+    "customers": "customers",
+}
+
+# Timestamp columns Shopify can filter server-side, per domain
+PUSHABLE_DATES = {
+    "orders": {"created_at", "updated_at", "processed_at"},
+    "customers": {"created_at", "updated_at"},
+    "products": {"created_at", "updated_at", "published_at"},
+    "inventory": {"updated_at"},
+}
+
+# Domains whose records have a created_at that SINCE/UNTIL/DURING can bound
+DATED_DOMAINS = {"orders", "customers", "products"}
+
+# Equality filters Shopify accepts as query parameters, per domain
+PUSHABLE_EQUALITY = {
+    "orders": {"status", "financial_status", "fulfillment_status"},
+    "products": {"status", "vendor", "product_type", "handle"},
+}
+
+# Pushed filters that are not fields of the returned rows (an order's
+# `status` is open/closed/cancelled/any), so only Shopify can evaluate them
+API_ONLY_FILTERS = {
+    "orders": {"status"},
+}
+
+PRODUCT_GROUP_COLUMNS = {
+    "product_id", "product", "product_title", "product_name", "title", "name",
+    "line_items.product_id", "line_items.title", "line_items.name",
+}
+
+REVENUE_TERMS = ("revenue", "price", "sales", "amount", "total")
+
+# Order columns that belong to its line items (`line_items.*` always does;
+# `title` and `name` only when querying the line_items table)
+LINE_ITEM_WHERE_COLUMNS = {
+    "product_id", "product", "product_title", "product_name", "variant_id", "sku", "quantity", "price",
+}
+
+
+def _groups_by_product(query: Query, domain: str) -> bool:
+    return domain == "orders" and bool(set(columns_in(query.group_by)) & PRODUCT_GROUP_COLUMNS)
+
+
+def _is_line_item_condition(condition: Condition, table: str) -> bool:
+    """Whether every column a conjunct reads is a line item's"""
+    line_item_columns = LINE_ITEM_WHERE_COLUMNS | ({"title", "name"} if table == "line_items" else set())
+    names = [name for name in columns_in(condition) if name not in RELATIVE_DATES]
+    return bool(names) and all(name.startswith("line_items.") or name in line_item_columns for name in names)
+
+
+def _line_item_row(item: Dict[str, Any]) -> Dict[str, Any]:
+    """A line item addressable both bare (`sku`) and as `line_items.sku`"""
+    return {**item, "line_items": item}
+
+
+@dataclass(frozen=True)
+class QueryPlan:
+    """
+    Execution plan for a parsed query.
+
+    Predicates Shopify can evaluate are kept as `pushed` (API parameter,
+    expression) pairs; everything else stays in `residual` for the local
+    executor; of those, conjuncts on an order's line item columns are kept in
+    `line_item_conjuncts` too, since they hold per line item rather than per
+    order. Relative dates are resolved by `api_params` at execution time,
+    so a cached plan never goes stale. Plans are immutable because
+    `plan_query` hands the same instance to every caller.
+    """
+    query: Query
+    domain: str
+    pushed: Tuple[Tuple[str, Expr], ...] = ()
+    residual: Optional[Condition] = None
+    fields: Optional[Tuple[str, ...]] = None
+    line_item_conjuncts: Tuple[Condition, ...] = ()
+
+    def __post_init__(self):
+        _freeze(self, "pushed", "fields", "line_item_conjuncts")
+
+    @property
+    def table(self) -> str:
+        return self.query.table
+
+    @property
+    def limit(self) -> Optional[int]:
+        return self.query.limit
+
+    @property
+    def aggregates(self) -> bool:
+        query = self.query
+        return bool(query.group_by) or query.having is not None or any(has_aggregate(item) for item in query.select)
+
+    @property
+    def groups_by_product(self) -> bool:
+        return _groups_by_product(self.query, self.domain)
+
+    @property
+    def api_only(self) -> bool:
+        """Whether a pushed filter can only be evaluated by Shopify, not on fetched rows"""
+        only = API_ONLY_FILTERS.get(self.domain, set())
+        return any(param in only for param, _ in self.pushed)
+
+    @property
+    def sort_metric(self) -> Tuple[str, bool]:
+        """Aggregated product column to sort by and whether descending"""
+        if not self.query.order_by:
+            return "total_quantity", True
+        first = self.query.order_by[0]
+        names = " ".join(columns_in(first)).lower()
+        metric = "total_revenue" if any(term in names for term in REVENUE_TERMS) else "total_quantity"
+        return metric, first.descending
+
+    def api_params(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Shopify query parameters for the pushed-down predicates (timestamps in
+        UTC). Bounds on the same timestamp from WHERE, SINCE/UNTIL and DURING
+        are intersected, so the query covers only the range all of them allow.
+        """
+        now = _to_datetime(now) if now else utc_now()
+        params: Dict[str, Any] = {}
+
+        for param, expr in self.pushed:
+            value = evaluate(expr, None, now)
+            if param == "during":
+                start, end = named_range(value, now)
+                bounds = [("created_at_min", start), ("created_at_max", end)]
+            else:
+                bounds = [(param, _to_datetime(value))]
+
+            for name, value in bounds:
+                previous = params.get(name)
+                if isinstance(value, datetime) and isinstance(previous, datetime):
+                    value = max(previous, value) if name.endswith("_min") else min(previous, value)
+                params[name] = value
+
+        params = {name: _iso_utc(value) if isinstance(value, datetime) else value for name, value in params.items()}
+
+        if self.fields:
+            params["fields"] = ",".join(self.fields)
+
+        return params
+
+    def _matches(self, condition: Condition, row: Dict[str, Any], now: Optional[datetime]) -> bool:
+        now = now or utc_now()
+        for conjunct in _conjuncts(condition):
+            if conjunct not in self.line_item_conjuncts and not matches(conjunct, row, now, self.domain):
+                return False
+        # Line item conjuncts hold for an order when one of its line items meets them all
+        if self.line_item_conjuncts:
+            return any(self.matches_line_item(item, now) for item in row.get("line_items") or ())
+        return True
+
+    def matches(self, row: Dict[str, Any], now: Optional[datetime] = None) -> bool:
+        """Evaluate the residual predicate locally"""
+        if self.residual is None:
+            return True
+        return self._matches(self.residual, row, now)
+
+    def matches_all(self, row: Dict[str, Any], now: Optional[datetime] = None) -> bool:
+        """Evaluate the whole WHERE clause locally (for sources without pushdown)"""
+        if self.query.where is None:
+            return True
+        return self._matches(self.query.where, row, now)
+
+    def matches_line_item(self, item: Dict[str, Any], now: Optional[datetime] = None) -> bool:
+        """Evaluate the line item conjuncts against one of an order's line items"""
+        now = now or utc_now()
+        row = _line_item_row(item)
+        return all(matches(conjunct, row, now, "line_items") for conjunct in self.line_item_conjuncts)
+
+    def sort_rows(self, rows: List[Dict[str, Any]], now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Apply ORDER BY to raw (non-aggregated) rows"""
+        now = now or utc_now()
+        for item in reversed(self.query.order_by):
+            keyed = [(_to_datetime(evaluate(item.expr, row, now, self.domain)), row) for row in rows]
+            present = [pair for pair in keyed if pair[0] is not None]
+            missing = [row for value, row in keyed if value is None]
+            try:
+                present.sort(key=lambda pair: pair[0], reverse=item.descending)
+            except TypeError:
+                present.sort(key=lambda pair: str(pair[0]), reverse=item.descending)
+            rows = [row for _, row in present] + missing
+        return rows
+
+
+def _conjuncts(condition: Optional[Condition]) -> List[Condition]:
+    if condition is None:
+        return []
+    if isinstance(condition, BoolOp) and condition.op == "and":
+        return [c for sub in condition.conditions for c in _conjuncts(sub)]
+    return [condition]
+
+
+def _push_predicate(condition: Condition, domain: str) -> Optional[List[Tuple[str, Expr]]]:
+    """API parameters equivalent to a single conjunct, or None if it must run locally"""
+    if not isinstance(condition, Comparison) or condition.negated:
+        return None
+    if not isinstance(condition.left, Column):
+        return None
+
+    column = condition.left.name.split(".")[-1]
+    op = condition.op
+
+    if column in PUSHABLE_DATES.get(domain, set()):
+        if op == "between":
+            low, high = condition.right
+            if is_constant(low) and is_constant(high):
+                return [(f"{column}_min", low), (f"{column}_max", high)]
+        elif op in (">", ">=") and is_constant(condition.right):
+            return [(f"{column}_min", condition.right)]
+        elif op in ("<", "<=") and is_constant(condition.right):
+            return [(f"{column}_max", condition.right)]
+        return None
+
+    if (
+        op == "="
+        and column in PUSHABLE_EQUALITY.get(domain, set())
+        and isinstance(condition.right, Literal)
+        and isinstance(condition.right.value, str)
+    ):
+        return [(column, condition.right)]
+
+    return None
+
+
+def _projected_fields(query: Query, domain: str, groups_by_product: bool) -> List[str]:
+    """Top-level REST fields the query needs; whole-record listings get the compact record fields"""
+    referenced = (
+        columns_in(query.select) + columns_in(query.where) + columns_in(query.group_by)
+        + columns_in(aggregate_calls(query.having)) + columns_in(query.order_by)
+    )
+
+    aliases = COLUMN_ALIASES.get(domain, {})
+    fields = {aliases.get(name, name).split(".")[0] for name in referenced}
+
+    selects_everything = not query.select or any(isinstance(item.expr, Star) for item in query.select)
+    if selects_everything and not query.group_by:
+        return sorted(fields | set(RECORD_FIELDS[DOMAIN_RESOURCES[domain]]))
+
+    if domain == "orders":
+        fields.update({"id", "created_at"})
+        # Per-product figures and line item filters read the nested line items
+        filters_line_items = any(_is_line_item_condition(c, query.table) for c in _conjuncts(query.where))
+        if groups_by_product or query.table == "line_items" or filters_line_items:
+            fields = (fields - PRODUCT_GROUP_COLUMNS - LINE_ITEM_WHERE_COLUMNS) | {"line_items"}
+    elif domain == "inventory":
+        fields.update({"inventory_item_id", "location_id"})
+    else:
+        fields.add("id")
+
+    return sorted(fields)
+
+
+def build_plan(query: Query) -> QueryPlan:
+    """Split a parsed query into pushed-down API parameters and local work"""
+    domain = TABLE_DOMAINS.get(query.table)
+    if domain is None:
+        raise ShopifyQLSyntaxError(f"Unknown table {query.table!r}")
+
+    if domain not in DATED_DOMAINS and (query.since is not None or query.until is not None or query.during):
+        raise ShopifyQLSyntaxError(
+            f"SINCE/UNTIL/DURING cannot be used on {query.table}: it has no creation date "
+            f"(filter on updated_at in WHERE instead)"
+        )
+
+    pushed: List[Tuple[str, Expr]] = []
+    residual: List[Condition] = []
+    pushed_params = set()
+
+    for conjunct in _conjuncts(query.where):
+        params = _push_predicate(conjunct, domain)
+        if params and not any(name in pushed_params for name, _ in params):
+            pushed.extend(params)
+            pushed_params.update(name for name, _ in params)
+        else:
+            residual.append(conjunct)
+
+    # Pushed alongside any WHERE bound on created_at; api_params intersects them
+    if query.since is not None:
+        pushed.append(("created_at_min", query.since))
+    if query.until is not None:
+        until = query.until
+        # UNTIL today/yesterday includes the whole of that day
+        if isinstance(until, Column) and until.name in ("today", "yesterday"):
+            until = BinaryOp("-", BinaryOp("+", until, Interval(1, "day")), Interval(1, "second"))
+        pushed.append(("created_at_max", until))
+    if query.during:
+        pushed.append(("during", Literal(query.during)))
+
+    return QueryPlan(
+        query=query,
+        domain=domain,
+        pushed=pushed,
+        residual=None if not residual else residual[0] if len(residual) == 1 else BoolOp("and", residual),
+        fields=_projected_fields(query, domain, _groups_by_product(query, domain)),
+        line_item_conjuncts=[c for c in residual if domain == "orders" and _is_line_item_condition(c, query.table)],
+    )
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def _plan_normalized(normalized: str) -> QueryPlan:
+    return build_plan(parse(normalized))
+
+
+def plan_query(query: str) -> QueryPlan:
+    """Parse and plan a query, memoized by its normalized text"""
+    return _plan_normalized(normalize_query(query))
@@ -0,0 +1,160 @@
+import os
+import uuid
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+import redis.asyncio as redis
+
+logger = logging.getLogger(__name__)
+
+SINGLEFLIGHT_LOCK_TTL = float(os.getenv("SINGLEFLIGHT_LOCK_TTL", "30"))
+SINGLEFLIGHT_POLL_INTERVAL = 0.05
+
+# Sentinel for "nothing published yet" from a DistributedSingleFlight loader
+MISSING = object()
+
+RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+
+class SingleFlight:
+    """
+    In-process request coalescing.
+
+    Concurrent `do` calls with the same key share one execution of the
+    leader's function and all get its result or exception. If the leader is
+    cancelled, a waiting caller takes over instead of failing with it.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.counters = {"leaders": 0, "coalesced": 0}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+
+            self.counters["coalesced"] += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # The leader was cancelled; loop to join or become the next leader
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        self.counters["leaders"] += 1
+        try:
+            value = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Followers re-raise it; don't warn about it being unretrieved here
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+
+class DistributedSingleFlight(SingleFlight):
+    """
+    SingleFlight that also coalesces across workers through Redis.
+
+    The in-process leader takes a SET NX PX lock; workers that lose the race
+    poll `load` (e.g. a cache read) until the lock holder has published its
+    result, and compute themselves if the lock disappears without one. `fn`
+    is responsible for publishing what `load` reads. Without Redis (or on
+    Redis errors) this degrades to in-process coalescing.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        client: Callable[[], Optional[redis.Redis]],
+        lock_ttl: float = SINGLEFLIGHT_LOCK_TTL,
+        poll_interval: float = SINGLEFLIGHT_POLL_INTERVAL
+    ):
+        super().__init__(name)
+        self.client = client
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self.counters.update({"lock_waits": 0, "errors": 0})
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        load: Optional[Callable[[], Awaitable[Any]]] = None
+    ) -> Any:
+        return await super().do(key, lambda: self._locked(key, fn, load))
+
+    async def _locked(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        load: Optional[Callable[[], Awaitable[Any]]]
+    ) -> Any:
+        client = self.client()
+        if client is None or load is None:
+            return await fn()
+
+        lock_key = f"lock:{key}"
+        token = uuid.uuid4().hex
+        try:
+            locked = bool(await client.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000)))
+        except Exception as e:
+            self.counters["errors"] += 1
+            logger.error(f"{self.name} lock error: {str(e)}")
+            return await fn()
+
+        if not locked:
+            value = await self._wait(client, lock_key, load)
+            if value is not MISSING:
+                return value
+
+        try:
+            return await fn()
+        finally:
+            if locked:
+                await self._release(client, lock_key, token)
+
+    async def _wait(self, client: redis.Redis, lock_key: str, load: Callable[[], Awaitable[Any]]) -> Any:
+        """Poll for the lock holder's result until it publishes or the lock goes away"""
+        self.counters["lock_waits"] += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lock_ttl
+
+        while loop.time() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                value = await load()
+                if value is not MISSING:
+                    return value
+                if not await client.exists(lock_key):
+                    break
+            except Exception as e:
+                self.counters["errors"] += 1
+                logger.error(f"{self.name} wait error: {str(e)}")
+                break
+
+        return MISSING
+
+    async def _release(self, client: redis.Redis, lock_key: str, token: str) -> None:
+        # Only delete the lock if it is still ours (it may have expired)
+        try:
+            await client.eval(RELEASE_SCRIPT, 1, lock_key, token)
+        except Exception as e:
+            logger.error(f"{self.name} unlock error: {str(e)}")
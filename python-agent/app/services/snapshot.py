@@ -0,0 +1,111 @@
+import os
+import bisect
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, TYPE_CHECKING
+
+from app.services.records import DOMAIN_RESOURCES
+from app.services.shopifyql import QueryPlan, utc_iso, utc_now
+
+if TYPE_CHECKING:
+    from app.services.shopify_service import ShopifyService
+
+logger = logging.getLogger(__name__)
+
+# Larger shared fetches are skipped; those queries run on their own (bulk/paged) path
+BATCH_SNAPSHOT_MAX_ROWS = int(os.getenv("BATCH_SNAPSHOT_MAX_ROWS", "50000"))
+
+SNAPSHOT_PAGE_SIZE = 1000
+
+# Resources with a /count endpoint to size a shared fetch before running it
+COUNTABLE = {"orders", "products", "customers"}
+
+
+def shares_scan(plan: QueryPlan) -> bool:
+    """
+    Queries that read a whole (date-bounded) resource rather than stopping at
+    a LIMIT. Those with API-only filters (orders `status`) cannot be checked
+    against shared rows, so they run on their own.
+    """
+    if plan.api_only:
+        return False
+    scans = plan.aggregates or plan.query.where is not None or bool(plan.query.order_by)
+    if plan.domain == "orders":
+        return scans and "created_at_min" in plan.api_params()
+    return scans
+
+
+class SharedSnapshot:
+    """
+    Rows of one resource fetched once and shared by several queries.
+
+    Read through the same `iter_pages` / `query_rollups` interface as
+    LocalStore, so ShopifyService evaluates each query's full WHERE locally
+    and only the created_at window has to be honoured here.
+    """
+
+    def __init__(self, resource: str, rows: List[Dict[str, Any]]):
+        self.resource = resource
+        keyed = sorted(((utc_iso(row.get("created_at")) or "", row) for row in rows), key=lambda pair: pair[0])
+        self._keys = [key for key, _ in keyed]
+        self._rows = [row for _, row in keyed]
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    async def iter_pages(
+        self,
+        resource: str,
+        params: Dict[str, Any],
+        max_rows: Optional[int] = None
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        start, end = 0, len(self._rows)
+        if params.get("created_at_min"):
+            start = bisect.bisect_left(self._keys, utc_iso(params["created_at_min"]))
+        if params.get("created_at_max"):
+            end = bisect.bisect_right(self._keys, utc_iso(params["created_at_max"]))
+        if max_rows is not None:
+            end = min(end, start + max_rows)
+
+        for offset in range(start, end, SNAPSHOT_PAGE_SIZE):
+            yield self._rows[offset:min(offset + SNAPSHOT_PAGE_SIZE, end)]
+
+    async def query_rollups(self, plan: QueryPlan) -> None:
+        return None
+
+    @classmethod
+    async def fetch(
+        cls,
+        service: "ShopifyService",
+        domain: str,
+        plans: List[QueryPlan]
+    ) -> Optional["SharedSnapshot"]:
+        """One fetch covering every plan's window and fields, or None if too large"""
+        resource = DOMAIN_RESOURCES[domain]
+        now = utc_now()
+        params_list = [plan.api_params(now) for plan in plans]
+
+        params: Dict[str, Any] = {"status": "any"} if domain == "orders" else {}
+        if domain == "orders":
+            # Widest window, keeping the UTC offset on what is sent to Shopify
+            params["created_at_min"] = min((p["created_at_min"] for p in params_list), key=utc_iso)
+            maxes = [p.get("created_at_max") for p in params_list]
+            if all(maxes):
+                params["created_at_max"] = max(maxes, key=utc_iso)
+
+        # Project only if every query projects, onto the union of their fields
+        if all(p.get("fields") for p in params_list):
+            fields = sorted({f for p in params_list for f in p["fields"].split(",")} | {"created_at"})
+            params["fields"] = ",".join(fields)
+
+        if resource in COUNTABLE:
+            count = await service._count(resource, {k: v for k, v in params.items() if k != "fields"})
+            if count > BATCH_SNAPSHOT_MAX_ROWS:
+                logger.info(f"Not sharing {resource}: {count} rows exceeds {BATCH_SNAPSHOT_MAX_ROWS}")
+                return None
+
+        rows: List[Dict[str, Any]] = []
+        async for page in service._iter_pages(resource, resource, params):
+            rows.extend(page)
+
+        logger.info(f"Shared {len(rows)} {resource} rows across {len(plans)} queries")
+        return cls(resource, rows)
@@ -0,0 +1,205 @@
+import os
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.services.records import flatten_row
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:  # pragma: no cover - character estimate fallback
+    tiktoken = None
+    TIKTOKEN_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Token budget for the data digest sent to the explanation LLM call
+EXPLANATION_TOKEN_BUDGET = int(os.getenv("EXPLANATION_TOKEN_BUDGET", "800"))
+
+MAX_TOP_ROWS = 20
+MIN_TOP_ROWS = 3
+TOP_VALUES = 3
+MAX_STATS_COLUMNS = 12
+
+# Columns treated as the time axis of a series, in order of preference
+TIME_COLUMNS = ("day", "date", "week", "month", "quarter", "year", "hour", "created_at", "updated_at")
+
+# Columns that identify rows rather than measure anything
+ID_SUFFIXES = ("id", "_id", "_ids")
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken's cl100k_base, or a ~4 chars/token estimate"""
+    global _encoding, TIKTOKEN_AVAILABLE
+    if TIKTOKEN_AVAILABLE and _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            # The encoding file is fetched on first use; offline hosts fall back
+            logger.warning(f"tiktoken unavailable, estimating tokens: {str(e)}")
+            TIKTOKEN_AVAILABLE = False
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def _round(value: Any) -> Any:
+    if isinstance(value, (float, np.floating)):
+        if not np.isfinite(value):
+            return None
+        return round(float(value), 2) if abs(value) >= 1 else float(f"{value:.3g}")
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, (pd.Timestamp,)):
+        return value.isoformat()
+    return value
+
+
+def _frame(data: Any) -> Optional[pd.DataFrame]:
+    """Flatten a result set into a frame (one level deep; nested lists become counts)"""
+    if isinstance(data, dict):
+        data = [data]
+    if not isinstance(data, list) or not data or not all(isinstance(row, dict) for row in data):
+        return None
+
+    return pd.DataFrame.from_records([flatten_row(row) for row in data])
+
+
+def _is_id(column: str) -> bool:
+    name = column.lower().split(".")[-1]
+    return name == "id" or name.endswith(ID_SUFFIXES[1:])
+
+
+def _numeric_columns(frame: pd.DataFrame) -> List[str]:
+    numeric = []
+    for column in frame.columns:
+        if _is_id(column):
+            continue
+        series = frame[column]
+        if not pd.api.types.is_numeric_dtype(series):
+            converted = pd.to_numeric(series, errors="coerce")
+            # Shopify sends money as strings; treat mostly-numeric columns as numbers
+            if converted.notna().sum() < max(1, 0.9 * series.notna().sum()):
+                continue
+            frame[column] = converted
+        if pd.api.types.is_bool_dtype(frame[column]):
+            continue
+        numeric.append(column)
+    return numeric
+
+
+def _time_column(frame: pd.DataFrame) -> Optional[str]:
+    for name in TIME_COLUMNS:
+        if name in frame.columns and frame[name].notna().any():
+            return name
+    return None
+
+
+def _column_stats(frame: pd.DataFrame, numeric: List[str]) -> Dict[str, Any]:
+    stats: Dict[str, Any] = {}
+    if numeric:
+        described = frame[numeric].agg(["min", "max", "mean", "median"]).T
+        for column, row in described.iterrows():
+            stats[column] = {name: _round(value) for name, value in row.items()}
+
+    for column in frame.columns:
+        if column in stats or _is_id(column):
+            continue
+        series = frame[column].dropna().astype(str)
+        if series.empty:
+            continue
+        counts = series.value_counts()
+        stats[column] = {
+            "distinct": int(counts.size),
+            "top": {str(value): int(count) for value, count in counts.head(TOP_VALUES).items()}
+        }
+    return stats
+
+
+def _time_series(frame: pd.DataFrame, time_column: str, numeric: List[str]) -> Dict[str, Any]:
+    series = frame.sort_values(time_column)
+    first, last = series.iloc[0], series.iloc[-1]
+    trend: Dict[str, Any] = {"from": _round(first[time_column]), "to": _round(last[time_column]), "points": len(series)}
+
+    for column in numeric:
+        values = series[column].astype(float)
+        start, end = values.iloc[0], values.iloc[-1]
+        peak = values.idxmax()
+        trend[column] = {
+            "first": _round(start),
+            "last": _round(end),
+            "change_pct": _round((end - start) / abs(start) * 100) if start else None,
+            "peak": {str(_round(series.at[peak, time_column])): _round(values.at[peak])},
+        }
+    return trend
+
+
+def _records(frame: pd.DataFrame, limit: int) -> List[Dict[str, Any]]:
+    head = frame.head(limit)
+    return [{k: _round(v) for k, v in row.items() if pd.notna(v)} for row in head.to_dict("records")]
+
+
+def _render(digest: Dict[str, Any]) -> str:
+    return json.dumps(digest, separators=(",", ":"), default=str)
+
+
+def summarize_results(data: Any, budget: int = EXPLANATION_TOKEN_BUDGET) -> str:
+    """
+    Compact digest of a result set for the explanation prompt.
+
+    Row count, column totals and statistics (numeric min/max/mean/median,
+    categorical top values), first/last/peak of a time series and the first
+    rows in query order, shrunk until it fits `budget` tokens.
+    """
+    frame = _frame(data)
+    if frame is None:
+        text = _render(data) if isinstance(data, (list, dict)) else str(data)
+        return _truncate(text, budget)
+
+    time_column = _time_column(frame)
+    numeric = [column for column in _numeric_columns(frame) if column != time_column]
+    digest: Dict[str, Any] = {"rows": len(frame.index)}
+
+    if len(frame.index) > 1 and numeric:
+        digest["totals"] = {column: _round(frame[column].sum()) for column in numeric}
+        # Only aggregated series (one row per bucket) have a meaningful trend
+        if time_column is not None and frame[time_column].is_unique:
+            digest["trend"] = _time_series(frame, time_column, numeric)
+        digest["columns"] = _column_stats(frame, numeric)
+
+    top = min(len(frame.index), MAX_TOP_ROWS)
+    digest["top_rows"] = _records(frame, top)
+
+    text = _render(digest)
+    # Shed detail until the digest fits: fewer rows, fewer column stats, no trend
+    while count_tokens(text) > budget:
+        if top > MIN_TOP_ROWS:
+            top = max(MIN_TOP_ROWS, top // 2)
+            digest["top_rows"] = _records(frame, top)
+        elif len(digest.get("columns", {})) > MAX_STATS_COLUMNS:
+            digest["columns"] = dict(list(digest["columns"].items())[:MAX_STATS_COLUMNS])
+        elif "columns" in digest:
+            del digest["columns"]
+        elif "trend" in digest:
+            del digest["trend"]
+        elif top > 1:
+            top = 1
+            digest["top_rows"] = _records(frame, top)
+        else:
+            return _truncate(text, budget)
+        text = _render(digest)
+
+    return text
+
+
+def _truncate(text: str, budget: int) -> str:
+    if count_tokens(text) <= budget:
+        return text
+    # ~4 chars per token keeps the cut close without re-encoding repeatedly
+    return text[:budget * 4] + "..."
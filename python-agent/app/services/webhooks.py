@@ -0,0 +1,125 @@
+import os
+import hmac
+import time
+import base64
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from app.services.cache_service import CacheService
+from app.services.local_store import LocalStoreManager
+from app.services.metrics import WEBHOOK_EVENTS
+from app.services.records import DOMAIN_RESOURCES, compact_rows
+
+logger = logging.getLogger(__name__)
+
+# Webhooks are signed with the app's API secret key
+SHOPIFY_WEBHOOK_SECRET = os.getenv("SHOPIFY_WEBHOOK_SECRET") or os.getenv("SHOPIFY_API_SECRET", "")
+
+# Shopify retries a delivery for up to 48 hours; remember webhook ids that long
+WEBHOOK_DEDUPE_TTL = int(os.getenv("WEBHOOK_DEDUPE_TTL", str(48 * 3600)))
+WEBHOOK_DEDUPE_SIZE = 10000
+WEBHOOK_ID_PREFIX = "webhook:"
+
+# Subscribed topics and the query domain each one changes
+WEBHOOK_TOPICS = {
+    "orders/create": "orders",
+    "orders/updated": "orders",
+    "orders/paid": "orders",
+    "orders/cancelled": "orders",
+    "products/create": "products",
+    "products/update": "products",
+    "inventory_levels/update": "inventory",
+    "customers/create": "customers",
+    "customers/update": "customers",
+}
+
+
+def verify_webhook(body: bytes, signature: Optional[str], secret: str = SHOPIFY_WEBHOOK_SECRET) -> bool:
+    """Check X-Shopify-Hmac-Sha256 (base64 HMAC-SHA256 of the raw body)"""
+    if not secret or not signature:
+        return False
+    digest = hmac.new(secret.encode(), body, hashlib.sha256).digest()
+    return hmac.compare_digest(base64.b64encode(digest).decode(), signature.strip())
+
+
+class WebhookProcessor:
+    """
+    Applies verified Shopify webhooks as incremental updates.
+
+    The changed record is compacted and upserted into the shop's local store
+    (which adjusts its rollups in the same transaction), then only the
+    affected domain's cache namespace is bumped, so cached results for other
+    domains stay valid. Stores that keep sending webhooks get the longer
+    CACHE_WEBHOOK_RESULT_TTL. Redeliveries are dropped by webhook id.
+    """
+
+    def __init__(self, cache_service: CacheService, local_stores: Optional[LocalStoreManager] = None):
+        self.cache = cache_service
+        self.local_stores = local_stores
+        # In-process record of seen webhook ids, when Redis is unavailable
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+
+    async def _first_delivery(self, webhook_id: Optional[str]) -> bool:
+        """Whether this webhook id is new (claims it atomically in Redis)"""
+        if not webhook_id:
+            return True
+
+        redis_client = self.cache.redis_client
+        if redis_client is not None:
+            try:
+                claimed = await redis_client.set(f"{WEBHOOK_ID_PREFIX}{webhook_id}", 1, nx=True, ex=WEBHOOK_DEDUPE_TTL)
+                return bool(claimed)
+            except Exception as e:
+                logger.error(f"Webhook dedupe error: {str(e)}")
+
+        now = time.monotonic()
+        while self._seen and next(iter(self._seen.values())) <= now:
+            self._seen.popitem(last=False)
+        if webhook_id in self._seen:
+            return False
+        self._seen[webhook_id] = now + WEBHOOK_DEDUPE_TTL
+        if len(self._seen) > WEBHOOK_DEDUPE_SIZE:
+            self._seen.popitem(last=False)
+        return True
+
+    async def _forget(self, webhook_id: Optional[str]) -> None:
+        if not webhook_id:
+            return
+        self._seen.pop(webhook_id, None)
+        if self.cache.redis_client is not None:
+            try:
+                await self.cache.redis_client.delete(f"{WEBHOOK_ID_PREFIX}{webhook_id}")
+            except Exception as e:
+                logger.error(f"Webhook dedupe error: {str(e)}")
+
+    async def handle(self, shop: str, topic: str, payload: Dict[str, Any], webhook_id: Optional[str] = None) -> Dict[str, Any]:
+        """Apply one delivery; returns what was done (for the response body and logs)"""
+        domain = WEBHOOK_TOPICS.get(topic)
+        if domain is None:
+            WEBHOOK_EVENTS.inc(topic=topic, result="ignored")
+            return {"status": "ignored", "topic": topic}
+
+        if not await self._first_delivery(webhook_id):
+            WEBHOOK_EVENTS.inc(topic=topic, result="duplicate")
+            return {"status": "duplicate", "topic": topic}
+
+        applied = 0
+        resource = DOMAIN_RESOURCES[domain]
+        try:
+            if self.local_stores is not None:
+                store = await self.local_stores.get(shop)
+                applied = await store.apply_changes(resource, compact_rows(resource, [payload]))
+        except Exception:
+            # Let Shopify's retry through
+            await self._forget(webhook_id)
+            WEBHOOK_EVENTS.inc(topic=topic, result="error")
+            raise
+
+        await self.cache.invalidate(shop, domain)
+        await self.cache.mark_webhook_backed(shop)
+
+        WEBHOOK_EVENTS.inc(topic=topic, result="applied")
+        logger.info(f"Webhook {topic} for {shop}: {applied} local row(s) updated, {domain} namespace bumped")
+        return {"status": "applied", "topic": topic, "domain": domain, "rows": applied}
@@ -0,0 +1 @@
+"""Benchmarks and load tests against local Shopify and LLM stand-ins (see README.md)"""
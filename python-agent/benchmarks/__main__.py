@@ -0,0 +1,137 @@
+"""
+Run the benchmark suite and print (or write) the results as JSON.
+
+    python -m benchmarks micro --orders 20000
+    python -m benchmarks load --requests 500 --concurrency 32 --llm-latency 0.5
+    python -m benchmarks all --output results.json --baseline previous.json
+"""
+import os
+import sys
+import json
+import asyncio
+import logging
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+
+def _parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.split("\n\n")[0])
+    parser.add_argument("suite", choices=["micro", "load", "all"])
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    parser.add_argument("--baseline", help="Previous results to compare p95 latencies against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p95 regression (fraction)")
+
+    micro = parser.add_argument_group("micro")
+    micro.add_argument("--iterations", type=int, default=200)
+
+    store = parser.add_argument_group("synthetic store")
+    store.add_argument("--orders", type=int, default=5000)
+    store.add_argument("--products", type=int, default=200)
+    store.add_argument("--customers", type=int, default=1000)
+    store.add_argument("--days", type=int, default=90)
+
+    load = parser.add_argument_group("load")
+    load.add_argument("--requests", type=int, default=200)
+    load.add_argument("--concurrency", type=int, default=16)
+    load.add_argument("--stores", type=int, default=4)
+    load.add_argument("--endpoint", choices=["analyze", "stream"], default="analyze")
+    load.add_argument("--shopify-latency", type=float, default=0.05, help="Seconds per Admin API call")
+    load.add_argument("--bucket-size", type=int, default=40, help="Shopify call limit bucket")
+    load.add_argument("--leak-rate", type=float, default=2.0, help="Shopify bucket leak (calls/s)")
+    load.add_argument("--llm-latency", type=float, default=0.3, help="Seconds to first LLM token")
+    load.add_argument("--tokens-per-second", type=float, default=200.0)
+    load.add_argument("--local-store", action="store_true", help="Enable the local store (off by default)")
+    load.add_argument("--no-fast-path", action="store_true", help="Plan every question with the LLM")
+    return parser.parse_args(argv)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def _regressions(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, path: str = "") -> List[str]:
+    """p95 latencies that grew by more than `tolerance` versus the baseline"""
+    found = []
+    for key, value in results.items():
+        previous = baseline.get(key)
+        if not isinstance(value, dict) or not isinstance(previous, dict):
+            continue
+        name = f"{path}{key}"
+        if value.get("p95_ms") is not None and previous.get("p95_ms"):
+            if value["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+                found.append(f"{name}: p95 {previous['p95_ms']}ms -> {value['p95_ms']}ms")
+        found.extend(_regressions(value, previous, tolerance, f"{name}."))
+    return found
+
+
+async def _run(args: argparse.Namespace) -> Dict[str, Any]:
+    from benchmarks.synthetic import StoreSize
+
+    size = StoreSize(orders=args.orders, products=args.products, customers=args.customers, days=args.days)
+    results: Dict[str, Any] = {}
+
+    if args.suite in ("micro", "all"):
+        from benchmarks.micro import run_micro
+        results["micro"] = await run_micro(orders=args.orders, iterations=args.iterations)
+
+    if args.suite in ("load", "all"):
+        from benchmarks.load import run_load
+        results["load"] = await run_load(
+            requests=args.requests,
+            concurrency=args.concurrency,
+            stores=args.stores,
+            endpoint=args.endpoint,
+            size=size,
+            shopify_latency=args.shopify_latency,
+            bucket_size=args.bucket_size,
+            leak_rate=args.leak_rate,
+            llm_latency=args.llm_latency,
+            tokens_per_second=args.tokens_per_second
+        )
+    return results
+
+
+def main(argv: List[str]) -> int:
+    args = _parse_args(argv)
+
+    # Read at import time by the app modules, so set before importing them
+    os.environ.setdefault("LOCAL_STORE_ENABLED", "true" if args.local_store else "false")
+    os.environ.setdefault("FAST_PATH_ENABLED", "false" if args.no_fast_path else "true")
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    report = {
+        "suite": args.suite,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "results": asyncio.run(_run(args)),
+    }
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report["regressions"] = _regressions(report["results"], baseline.get("results", {}), args.tolerance)
+        status = 1 if report["regressions"] else 0
+
+    text = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,182 @@
+import re
+import json
+import random
+import asyncio
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+import openai
+from langchain_openai import ChatOpenAI
+
+from app.agents.intent_classifier import IntentClassifier
+from app.agents.llm_metrics import LLM_METRICS
+from app.agents.planner import PLAN_FUNCTION
+
+BASE_URL = "http://fake-llm/v1"
+MODEL = "fake-gpt"
+
+QUESTION_RE = re.compile(r"^Question:\s*(.+)$", re.MULTILINE)
+ROWS_RE = re.compile(r'"rows":(\d+)')
+
+# Plans for questions the template classifier has no query for
+FALLBACK_QUERY = (
+    "SELECT day, COUNT(*) AS orders, SUM(total_price) AS total_sales "
+    "FROM orders DURING last_30_days GROUP BY day ORDER BY day"
+)
+JOIN_QUERY = (
+    "WITH sales AS (FROM orders DURING last_30_days GROUP BY product_id), "
+    "stock AS (FROM inventory WHERE quantity < 10) "
+    "SELECT * FROM sales JOIN stock ORDER BY total_quantity DESC LIMIT 10"
+)
+JOIN_RE = re.compile(r"\b(stock|inventory)\b.*\b(sold|sell\w*|sales)\b|\b(sold|sell\w*|sales)\b.*\b(stock|inventory)\b")
+
+
+def _tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+class FakeLLM:
+    """
+    Deterministic OpenAI chat completions stand-in, served through an httpx
+    transport so the real ChatOpenAI client, tool calling and streaming code
+    paths run unchanged.
+
+    Planning calls (tool_choice analysis_plan) return the template query for
+    the question, a cross-domain join for sales-vs-stock questions, or a
+    daily sales series. Explanation calls return a fixed-shape JSON answer.
+    Latency is `latency` to the first token plus `1 / tokens_per_second`
+    per completion token.
+    """
+
+    def __init__(self, latency: float = 0.3, tokens_per_second: float = 200.0, seed: int = 7):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.classifier = IntentClassifier()
+        self.calls: Counter = Counter()
+        self.tokens: Counter = Counter()
+        self._rng = random.Random(seed)
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    def chat_model(self) -> ChatOpenAI:
+        """ChatOpenAI wired to this fake (with the same metrics callback as the registry's)"""
+        client = openai.AsyncOpenAI(
+            api_key="benchmark",
+            base_url=BASE_URL,
+            http_client=httpx.AsyncClient(transport=self.transport()),
+            max_retries=0
+        )
+        return ChatOpenAI(
+            model=MODEL,
+            api_key="benchmark",
+            base_url=BASE_URL,
+            callbacks=[LLM_METRICS],
+            async_client=client.chat.completions
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {"calls": dict(self.calls), "tokens": dict(self.tokens)}
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        if not request.url.path.endswith("/chat/completions"):
+            return httpx.Response(404, json={"error": {"message": "Not found"}})
+
+        body = json.loads(request.content)
+        prompt = "\n".join(str(message.get("content") or "") for message in body["messages"])
+        planning = any(tool.get("function", {}).get("name") == PLAN_FUNCTION for tool in body.get("tools") or [])
+
+        if planning:
+            self.calls["plan"] += 1
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": f"call_{self.calls['plan']}",
+                    "type": "function",
+                    "function": {"name": PLAN_FUNCTION, "arguments": json.dumps(self._plan(prompt))}
+                }]
+            }
+            completion = message["tool_calls"][0]["function"]["arguments"]
+        else:
+            self.calls["explain"] += 1
+            completion = json.dumps(self._explanation(prompt))
+            message = {"role": "assistant", "content": completion}
+
+        usage = {"prompt_tokens": _tokens(prompt), "completion_tokens": _tokens(completion)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        self.tokens["prompt"] += usage["prompt_tokens"]
+        self.tokens["completion"] += usage["completion_tokens"]
+
+        if body.get("stream"):
+            return httpx.Response(
+                200,
+                headers={"content-type": "text/event-stream"},
+                content=self._stream(body.get("model", MODEL), completion)
+            )
+
+        await asyncio.sleep(self.latency + usage["completion_tokens"] / self.tokens_per_second)
+        return httpx.Response(200, json={
+            "id": f"chatcmpl-{sum(self.calls.values())}",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body.get("model", MODEL),
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if planning else "stop"
+            }],
+            "usage": usage
+        })
+
+    async def _stream(self, model: str, completion: str) -> AsyncIterator[bytes]:
+        await asyncio.sleep(self.latency)
+        pieces: List[Optional[str]] = [completion[i:i + 16] for i in range(0, len(completion), 16)] + [None]
+        for piece in pieces:
+            if piece:
+                await asyncio.sleep(_tokens(piece) / self.tokens_per_second)
+            chunk = {
+                "id": "chatcmpl-stream",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": piece} if piece else {},
+                    "finish_reason": None if piece else "stop"
+                }]
+            }
+            yield f"data: {json.dumps(chunk)}\n\n".encode()
+        yield b"data: [DONE]\n\n"
+
+    def _plan(self, prompt: str) -> Dict[str, Any]:
+        match = QUESTION_RE.search(prompt)
+        question = match.group(1).strip() if match else ""
+        fast = self.classifier.classify(question)
+
+        if JOIN_RE.search(question.lower()):
+            domain, query = "orders", JOIN_QUERY
+        elif fast.query:
+            domain, query = fast.intent["domain"], fast.query
+        else:
+            domain, query = "orders", FALLBACK_QUERY
+
+        return {
+            "domain": domain,
+            "metrics": fast.intent.get("metrics", []),
+            "time_period": fast.intent.get("time_period"),
+            "filters": {},
+            "intent_summary": fast.label.replace("_", " "),
+            "query": query
+        }
+
+    def _explanation(self, prompt: str) -> Dict[str, str]:
+        match = ROWS_RE.search(prompt)
+        rows = int(match.group(1)) if match else 0
+        return {
+            "answer": f"Across {rows} result rows, the store's numbers are steady. "
+                      f"Focus stock and promotion on the top entries shown.",
+            "confidence": self._rng.choice(["high", "high", "medium"]),
+            "reasoning": "Summarised from the data digest."
+        }
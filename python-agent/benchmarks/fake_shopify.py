@@ -0,0 +1,217 @@
+import json
+import math
+import time
+import zlib
+import base64
+import random
+import asyncio
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.synthetic import StoreSize, SyntheticStore
+
+API_PREFIX = "/admin/api/"
+MAX_PAGE_SIZE = 250
+# Filtered result sets kept for cursor pagination
+FILTER_CACHE_SIZE = 64
+
+
+def _timestamp(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class LeakyBucket:
+    """Shopify's REST call limit: `capacity` calls, draining at `leak_rate` per second"""
+
+    def __init__(self, capacity: int, leak_rate: float):
+        self.capacity = capacity
+        self.leak_rate = leak_rate
+        self.level = 0.0
+        self.updated_at = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.level = max(0.0, self.level - (now - self.updated_at) * self.leak_rate)
+        self.updated_at = now
+        if self.level + 1 > self.capacity:
+            return False
+        self.level += 1
+        return True
+
+    def header(self) -> str:
+        return f"{min(self.capacity, math.ceil(self.level))}/{self.capacity}"
+
+
+class FakeShopify:
+    """
+    In-process stand-in for the Shopify Admin REST API, served through an
+    httpx transport (ShopifyClientPool(transport=...)).
+
+    Each shop domain gets its own synthetic store, seeded from the domain so
+    runs are reproducible. Supports listings of orders, products, customers
+    and inventory_levels (which, like Shopify, need location_ids or
+    inventory_item_ids), plus locations, with created_at / updated_at filters, `fields`
+    projection, cursor pagination through Link headers, /count endpoints,
+    the X-Shopify-Shop-Api-Call-Limit header and 429s with Retry-After.
+    GraphQL (bulk operations) answers with an error, so large aggregations
+    fall back to REST paging.
+    """
+
+    def __init__(
+        self,
+        size: Optional[StoreSize] = None,
+        latency: float = 0.05,
+        jitter: float = 0.02,
+        bucket_size: int = 40,
+        leak_rate: float = 2.0,
+        seed: int = 7
+    ):
+        self.size = size or StoreSize()
+        self.latency = latency
+        self.jitter = jitter
+        self.bucket_size = bucket_size
+        self.leak_rate = leak_rate
+        self.seed = seed
+        self.stores: Dict[str, SyntheticStore] = {}
+        self.buckets: Dict[str, LeakyBucket] = {}
+        self.requests: Counter = Counter()
+        self.throttled = 0
+        self._rng = random.Random(seed)
+        self._filtered: "OrderedDict[Tuple, List[Dict[str, Any]]]" = OrderedDict()
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    def store(self, shop: str) -> SyntheticStore:
+        store = self.stores.get(shop)
+        if store is None:
+            store = self.stores[shop] = SyntheticStore(self.size, seed=self.seed + zlib.crc32(shop.encode()))
+        return store
+
+    def stats(self) -> Dict[str, Any]:
+        return {"requests": dict(self.requests), "throttled": self.throttled}
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        shop = request.url.host
+        path = request.url.path
+        if not path.startswith(API_PREFIX):
+            return httpx.Response(404, json={"errors": "Not Found"})
+        endpoint = path[len(API_PREFIX):].split("/", 1)[1].removesuffix(".json")
+        self.requests[endpoint] += 1
+
+        if self.latency:
+            await asyncio.sleep(max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter)))
+
+        bucket = self.buckets.setdefault(shop, LeakyBucket(self.bucket_size, self.leak_rate))
+        if not bucket.take():
+            self.throttled += 1
+            return httpx.Response(
+                429,
+                json={"errors": "Exceeded 2 calls per second for api client. Reduce request rates to resume uninterrupted service."},
+                headers={"Retry-After": "1.0", "X-Shopify-Shop-Api-Call-Limit": bucket.header()}
+            )
+        headers = {"X-Shopify-Shop-Api-Call-Limit": bucket.header()}
+
+        if endpoint == "graphql":
+            return httpx.Response(
+                200, json={"errors": [{"message": "Bulk operations are not available on this store"}]}, headers=headers
+            )
+
+        params = dict(request.url.params)
+        resource, _, suffix = endpoint.partition("/")
+        store = self.store(shop)
+        try:
+            store.resource(resource)
+        except KeyError:
+            return httpx.Response(404, json={"errors": "Not Found"}, headers=headers)
+
+        if resource == "inventory_levels" and "page_info" not in params and not (
+            params.get("location_ids") or params.get("inventory_item_ids")
+        ):
+            return httpx.Response(
+                422, json={"errors": "inventory_item_ids or location_ids must be present"}, headers=headers
+            )
+
+        if suffix == "count":
+            return httpx.Response(200, json={"count": len(self._filter(shop, resource, params))}, headers=headers)
+
+        return self._page(request, shop, resource, params, headers)
+
+    def _filter(self, shop: str, resource: str, params: Dict[str, str]) -> List[Dict[str, Any]]:
+        bounds = (
+            _timestamp(params.get("created_at_min")),
+            _timestamp(params.get("created_at_max")),
+            _timestamp(params.get("updated_at_min")),
+        )
+        ids = {
+            name: {int(value) for value in params[f"{name}s"].split(",")}
+            for name in ("location_id", "inventory_item_id")
+            if params.get(f"{name}s")
+        }
+        key = (shop, resource) + bounds + tuple((name, tuple(sorted(values))) for name, values in ids.items())
+        rows = self._filtered.get(key)
+        if rows is not None:
+            self._filtered.move_to_end(key)
+            return rows
+
+        created_min, created_max, updated_min = bounds
+        rows = []
+        for row in self.store(shop).resource(resource):
+            created = _timestamp(row.get("created_at"))
+            if created_min is not None and created is not None and created < created_min:
+                continue
+            if created_max is not None and created is not None and created > created_max:
+                continue
+            if updated_min is not None and _timestamp(row.get("updated_at")) < updated_min:
+                continue
+            if any(row.get(name) not in values for name, values in ids.items()):
+                continue
+            rows.append(row)
+
+        self._filtered[key] = rows
+        if len(self._filtered) > FILTER_CACHE_SIZE:
+            self._filtered.popitem(last=False)
+        return rows
+
+    def _page(
+        self,
+        request: httpx.Request,
+        shop: str,
+        resource: str,
+        params: Dict[str, str],
+        headers: Dict[str, str]
+    ) -> httpx.Response:
+        limit = min(int(params.get("limit", 50)), MAX_PAGE_SIZE)
+
+        if "page_info" in params:
+            cursor = json.loads(base64.urlsafe_b64decode(params["page_info"]))
+            filters, offset = cursor["filters"], cursor["offset"]
+        else:
+            filters = {
+                k: v for k, v in params.items()
+                if k in ("created_at_min", "created_at_max", "updated_at_min", "location_ids", "inventory_item_ids")
+            }
+            offset = 0
+
+        rows = self._filter(shop, resource, filters)
+        page = rows[offset:offset + limit]
+        if params.get("fields"):
+            fields = params["fields"].split(",")
+            page = [{k: row[k] for k in fields if k in row} for row in page]
+
+        if offset + limit < len(rows):
+            cursor = base64.urlsafe_b64encode(
+                json.dumps({"filters": filters, "offset": offset + limit}).encode()
+            ).decode()
+            next_url = request.url.copy_with(params={"limit": limit, "page_info": cursor})
+            headers["Link"] = f'<{next_url}>; rel="next"'
+
+        return httpx.Response(200, json={resource: page}, headers=headers)
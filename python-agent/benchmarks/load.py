@@ -0,0 +1,143 @@
+import time
+import asyncio
+import logging
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import httpx
+import uvicorn
+
+from app.services.metrics import ADMISSION_EVENTS, LLM_REQUEST_SECONDS, PIPELINE_STAGE_SECONDS, SHOPIFY_REQUEST_SECONDS
+from benchmarks.fake_llm import FakeLLM
+from benchmarks.fake_shopify import FakeShopify
+from benchmarks.synthetic import StoreSize
+from benchmarks.timing import summarize
+
+logger = logging.getLogger(__name__)
+
+# Mix of template (fast path), LLM-planned and cross-domain questions
+QUESTIONS = [
+    "What were my top 5 selling products last week?",
+    "Which products are low on stock?",
+    "How many repeat customers do I have?",
+    "Show the daily sales trend for the last 30 days",
+    "What is my average order value this month?",
+    "Who are my top 10 customers by total spent?",
+    "Which low-stock products sold best last month?",
+    "How did revenue from paid orders change compared with the quarter before?",
+]
+
+
+def _stage_means(histogram, label: str) -> Dict[str, Any]:
+    return {
+        " ".join(key) or label: {"count": count, "mean_ms": round(total / count * 1000, 3) if count else None}
+        for key, (count, total) in histogram.totals().items()
+    }
+
+
+async def _request(client: httpx.AsyncClient, endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    if endpoint == "stream":
+        first_token = None
+        status = None
+        async with client.stream("POST", "/api/analyze/stream", json=payload) as response:
+            status = response.status_code
+            async for line in response.aiter_lines():
+                if first_token is None and line in ("event: token", "event: answer"):
+                    first_token = time.perf_counter() - started
+                if line == "event: error":
+                    status = "error_event"
+        return {"status": status, "elapsed": time.perf_counter() - started, "first_token": first_token}
+
+    response = await client.post("/api/analyze", json=payload)
+    return {"status": response.status_code, "elapsed": time.perf_counter() - started}
+
+
+async def run_load(
+    requests: int = 200,
+    concurrency: int = 16,
+    stores: int = 4,
+    endpoint: str = "analyze",
+    size: Optional[StoreSize] = None,
+    shopify_latency: float = 0.05,
+    bucket_size: int = 40,
+    leak_rate: float = 2.0,
+    llm_latency: float = 0.3,
+    tokens_per_second: float = 200.0,
+    questions: List[str] = QUESTIONS
+) -> Dict[str, Any]:
+    """
+    Serve the FastAPI app on a loopback port and drive it with `concurrency`
+    clients, against the fake Admin API and fake LLM. Reports latency
+    percentiles, throughput, status codes and where the time went.
+    """
+    import main
+
+    shopify = FakeShopify(size=size, latency=shopify_latency, bucket_size=bucket_size, leak_rate=leak_rate)
+    llm = FakeLLM(latency=llm_latency, tokens_per_second=tokens_per_second)
+    # Route the app's shared Shopify pool and LLM client to the stand-ins
+    main.shopify_http_pool.transport = shopify.transport()
+    main.agent_registry._llm = llm.chat_model()
+
+    shops = [f"bench-{i}.myshopify.com" for i in range(stores)]
+    for shop in shops:
+        shopify.store(shop)  # generate data up front, outside the timed run
+
+    pending: asyncio.Queue = asyncio.Queue()
+    for i in range(requests):
+        pending.put_nowait(i)
+    samples: List[Dict[str, Any]] = []
+
+    async def client_loop(client: httpx.AsyncClient) -> None:
+        while True:
+            try:
+                i = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            payload = {
+                "store_id": shops[i % len(shops)],
+                "question": questions[(i // len(shops)) % len(questions)],
+                "context": {"access_token": "benchmark", "api_version": "2024-01"},
+            }
+            try:
+                samples.append(await _request(client, endpoint, payload))
+            except Exception as e:
+                samples.append({"status": type(e).__name__, "elapsed": 0.0})
+
+    # A real HTTP server: in-process ASGI transports buffer streamed responses
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=0, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        if serving.done():
+            serving.result()
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    try:
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None, limits=limits) as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+        cache = main.cache_service.stats()
+    finally:
+        server.should_exit = True
+        await serving
+
+    ok = [s for s in samples if s["status"] == 200]
+    result = {
+        "latency": summarize([s["elapsed"] for s in ok], elapsed),
+        "elapsed_s": round(elapsed, 3),
+        "status": dict(Counter(str(s["status"]) for s in samples)),
+        "stages": _stage_means(PIPELINE_STAGE_SECONDS, "stage"),
+        "shopify_calls": _stage_means(SHOPIFY_REQUEST_SECONDS, "endpoint"),
+        "llm_calls": _stage_means(LLM_REQUEST_SECONDS, "stage"),
+        "cache_hit_ratio": cache.get("hit_ratio"),
+        "admission": {" ".join(key): count for key, count in ADMISSION_EVENTS.values().items()},
+        "fake_shopify": shopify.stats(),
+        "fake_llm": llm.stats(),
+    }
+    first_tokens = [s["first_token"] for s in ok if s.get("first_token") is not None]
+    if first_tokens:
+        result["time_to_first_token"] = summarize(first_tokens)
+    return result
@@ -0,0 +1,106 @@
+import logging
+from typing import Any, Dict, List
+
+from app.agents.shopify_agent import ShopifyAnalyticsAgent
+from app.services.cache_service import CacheService
+from app.services.http_client import ShopifyClientPool
+from app.services.rate_limiter import ShopifyRateLimiter
+from app.services.shopify_service import ShopifyService
+from app.services.shopifyql import _plan_normalized, plan_query
+from benchmarks.synthetic import StoreSize, SyntheticStore
+from benchmarks.timing import measure
+
+logger = logging.getLogger(__name__)
+
+QUERIES = [
+    "FROM orders DURING last_30_days GROUP BY product_id ORDER BY SUM(quantity) DESC LIMIT 5",
+    "SELECT day, COUNT(*) AS orders, SUM(total_price) AS total_sales FROM orders DURING last_90_days GROUP BY day ORDER BY day",
+    "SELECT SUM(total_price) AS revenue, AVG(total_price) AS aov FROM orders DURING last_7_days",
+    "FROM inventory WHERE quantity < 10 ORDER BY quantity ASC",
+    "SELECT COUNT(*) AS repeat_customers FROM customers WHERE orders_count > 1",
+    "FROM orders WHERE financial_status = 'paid' AND total_price > 100 DURING last_month LIMIT 20",
+    "WITH sales AS (FROM orders DURING last_30_days GROUP BY product_id), "
+    "stock AS (FROM inventory WHERE quantity < 10) SELECT * FROM sales JOIN stock ORDER BY total_quantity DESC",
+]
+
+AGGREGATIONS = {
+    "top_products": QUERIES[0],
+    "daily_sales": QUERIES[1],
+    "order_totals": QUERIES[2],
+}
+
+
+def _pages(rows: List[Dict[str, Any]], page_size: int = 250):
+    async def pages():
+        for i in range(0, len(rows), page_size):
+            yield rows[i:i + page_size]
+    return pages()
+
+
+async def run_micro(orders: int = 5000, iterations: int = 200) -> Dict[str, Any]:
+    """Micro-benchmarks for query parsing/validation, order aggregation and the cache"""
+    results: Dict[str, Any] = {}
+    service = ShopifyService(
+        store_id="bench.myshopify.com",
+        access_token="benchmark",
+        http_pool=ShopifyClientPool(),
+        rate_limiter=ShopifyRateLimiter()
+    )
+    single = [query for query in QUERIES if not query.startswith("WITH")]
+
+    def parse_filters():
+        for query in single:
+            service._parse_query_filters(query)
+
+    def parse_filters_cold():
+        _plan_normalized.cache_clear()
+        parse_filters()
+
+    results["parse_query_filters.warm"] = await measure(parse_filters, iterations)
+    results["parse_query_filters.cold"] = await measure(parse_filters_cold, iterations)
+
+    def validate():
+        for query in QUERIES:
+            ShopifyAnalyticsAgent.validate_shopifyql(query)
+
+    results["validate_shopifyql.warm"] = await measure(validate, iterations)
+
+    store = SyntheticStore(StoreSize(orders=orders, products=200, customers=1000))
+    for name, query in AGGREGATIONS.items():
+        plan = plan_query(query)
+        rows = store.orders
+
+        async def aggregate(plan=plan, rows=rows):
+            await service._process_orders(_pages(rows), plan, plan.matches_all)
+
+        results[f"process_orders.{name}"] = {
+            "orders": len(rows),
+            **await measure(aggregate, max(5, iterations // 20), warmup=1)
+        }
+
+    cache = CacheService()
+    payload = store.orders[:50]
+    key = "bench:key"
+    await cache.set(key, payload)
+
+    async def cache_get():
+        await cache.get(key)
+
+    async def cache_set():
+        await cache.set(key, payload)
+
+    async def cache_get_or_set():
+        async def compute():
+            return payload
+        await cache.get_or_set(key, compute)
+
+    async def make_key():
+        await cache.make_key("bench.myshopify.com", "orders", QUERIES[0])
+
+    results["cache.get_l1_hit"] = await measure(cache_get, iterations * 10)
+    results["cache.set"] = await measure(cache_set, iterations * 10)
+    results["cache.get_or_set_hit"] = await measure(cache_get_or_set, iterations * 10)
+    results["cache.make_key"] = await measure(make_key, iterations * 10)
+    await cache.aclose()
+
+    return results
@@ -0,0 +1,166 @@
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+FIRST_NAMES = ["Ava", "Ben", "Chloe", "Dan", "Ella", "Finn", "Grace", "Hugo", "Isla", "Jack", "Kai", "Lena"]
+LAST_NAMES = ["Smith", "Jones", "Brown", "Taylor", "Wilson", "Evans", "Thomas", "Roberts", "Walker", "Wright"]
+PRODUCT_TYPES = ["Apparel", "Footwear", "Accessories", "Home", "Beauty", "Outdoor"]
+ADJECTIVES = ["Classic", "Organic", "Vintage", "Everyday", "Premium", "Recycled", "Light", "Heavy"]
+NOUNS = ["Tee", "Hoodie", "Sneaker", "Cap", "Mug", "Candle", "Backpack", "Scarf", "Bottle", "Jacket"]
+VARIANT_TITLES = ["S", "M", "L", "XL"]
+FINANCIAL_STATUSES = ["paid"] * 8 + ["refunded", "pending"]
+LOCATIONS = [61000001, 61000002]
+
+
+@dataclass
+class StoreSize:
+    orders: int = 5000
+    products: int = 200
+    customers: int = 1000
+    days: int = 90
+
+
+def _iso(value: datetime) -> str:
+    return value.isoformat(timespec="seconds")
+
+
+@dataclass
+class SyntheticStore:
+    """
+    Deterministic synthetic shop: products with variants, customers, orders
+    with line items (product popularity is Zipf-skewed, order volume grows
+    over the period) and inventory levels per variant and location.
+    """
+    size: StoreSize = field(default_factory=StoreSize)
+    seed: int = 7
+    now: datetime = field(default_factory=lambda: datetime.now(timezone.utc).replace(microsecond=0))
+
+    def __post_init__(self):
+        rng = random.Random(self.seed)
+        start = self.now - timedelta(days=self.size.days)
+
+        self.products = [self._product(rng, i, start) for i in range(self.size.products)]
+        variants = [variant for product in self.products for variant in product["variants"]]
+        # Popular products sell far more than the long tail
+        weights = [1.0 / (rank + 1) for rank in range(len(variants))]
+        rng.shuffle(weights)
+
+        self.customers = [self._customer(rng, i, start) for i in range(self.size.customers)]
+        self.orders = []
+        for i in range(self.size.orders):
+            # Volume ramps up over the period (sqrt skews created_at towards now)
+            offset = timedelta(seconds=self.size.days * 86400 * rng.random() ** 0.5)
+            created_at = start + offset
+            customer = rng.choice(self.customers) if self.customers else None
+            items = rng.choices(variants, weights=weights, k=rng.randint(1, 4)) if variants else []
+            self.orders.append(self._order(rng, i, created_at, customer, items))
+        self.orders.sort(key=lambda order: order["created_at"], reverse=True)
+
+        for customer in self.customers:
+            customer["orders_count"] = 0
+            customer["total_spent"] = 0.0
+        by_id = {customer["id"]: customer for customer in self.customers}
+        for order in self.orders:
+            customer = by_id.get((order.get("customer") or {}).get("id"))
+            if customer is not None:
+                customer["orders_count"] += 1
+                customer["total_spent"] += float(order["total_price"])
+        for customer in self.customers:
+            customer["total_spent"] = f"{customer['total_spent']:.2f}"
+
+        self.locations = [{"id": location, "name": f"Location {i + 1}"} for i, location in enumerate(LOCATIONS)]
+        self.inventory_levels = [
+            {
+                "inventory_item_id": variant["inventory_item_id"],
+                "location_id": location,
+                "available": max(0, int(rng.gauss(40, 30))),
+                "updated_at": _iso(self.now - timedelta(hours=rng.randint(1, 240))),
+            }
+            for variant in variants
+            for location in LOCATIONS
+        ]
+
+    def _product(self, rng: random.Random, i: int, start: datetime) -> Dict[str, Any]:
+        product_id = 7000000 + i
+        created_at = _iso(start - timedelta(days=rng.randint(1, 365)))
+        title = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {i}"
+        price = round(rng.uniform(8, 180), 2)
+        variants = [
+            {
+                "id": 4000000 + i * 10 + v,
+                "product_id": product_id,
+                "title": VARIANT_TITLES[v],
+                "sku": f"SKU-{i}-{v}",
+                "price": f"{price:.2f}",
+                "inventory_item_id": 5000000 + i * 10 + v,
+                "inventory_quantity": rng.randint(0, 120),
+            }
+            for v in range(rng.randint(1, len(VARIANT_TITLES)))
+        ]
+        return {
+            "id": product_id,
+            "title": title,
+            "product_type": rng.choice(PRODUCT_TYPES),
+            "vendor": "Bench Co",
+            "status": "active" if rng.random() > 0.1 else "draft",
+            "created_at": created_at,
+            "updated_at": created_at,
+            "variants": variants,
+        }
+
+    def _customer(self, rng: random.Random, i: int, start: datetime) -> Dict[str, Any]:
+        created_at = _iso(start - timedelta(days=rng.randint(0, 720)))
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        return {
+            "id": 6000000 + i,
+            "email": f"{first.lower()}.{last.lower()}{i}@example.com",
+            "first_name": first,
+            "last_name": last,
+            "created_at": created_at,
+            "updated_at": created_at,
+        }
+
+    def _order(
+        self,
+        rng: random.Random,
+        i: int,
+        created_at: datetime,
+        customer: Dict[str, Any],
+        variants: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        line_items = []
+        for n, variant in enumerate(variants):
+            product = self.products[(variant["product_id"] - 7000000)]
+            line_items.append({
+                "id": 9000000 + i * 10 + n,
+                "product_id": variant["product_id"],
+                "variant_id": variant["id"],
+                "title": product["title"],
+                "name": f"{product['title']} - {variant['title']}",
+                "sku": variant["sku"],
+                "quantity": rng.choices([1, 2, 3, 5], weights=[70, 20, 7, 3])[0],
+                "price": variant["price"],
+            })
+        subtotal = sum(float(item["price"]) * item["quantity"] for item in line_items)
+        return {
+            "id": 8000000 + i,
+            "name": f"#{1000 + i}",
+            "created_at": _iso(created_at),
+            "updated_at": _iso(created_at),
+            "financial_status": rng.choice(FINANCIAL_STATUSES),
+            "currency": "USD",
+            "subtotal_price": f"{subtotal:.2f}",
+            "total_price": f"{subtotal * 1.08:.2f}",
+            "customer": {"id": customer["id"], "email": customer["email"]} if customer else None,
+            "line_items": line_items,
+        }
+
+    def resource(self, name: str) -> List[Dict[str, Any]]:
+        return {
+            "orders": self.orders,
+            "products": self.products,
+            "customers": self.customers,
+            "inventory_levels": self.inventory_levels,
+            "locations": self.locations,
+        }[name]
@@ -0,0 +1,40 @@
+import time
+import inspect
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+
+def summarize(durations: List[float], elapsed: float = None) -> Dict[str, Any]:
+    """Latency distribution in milliseconds (and throughput when wall time is given)"""
+    values = np.array(durations) * 1000
+    result = {
+        "count": len(durations),
+        "mean_ms": round(float(values.mean()), 4) if len(values) else None,
+        "p50_ms": round(float(np.percentile(values, 50)), 4) if len(values) else None,
+        "p95_ms": round(float(np.percentile(values, 95)), 4) if len(values) else None,
+        "p99_ms": round(float(np.percentile(values, 99)), 4) if len(values) else None,
+        "max_ms": round(float(values.max()), 4) if len(values) else None,
+    }
+    if elapsed:
+        result["throughput_per_s"] = round(len(durations) / elapsed, 2)
+    return result
+
+
+async def measure(fn: Callable[[], Any], iterations: int, warmup: int = 3) -> Dict[str, Any]:
+    """Time `iterations` calls of a sync or async callable"""
+    is_async = inspect.iscoroutinefunction(fn)
+    for _ in range(warmup):
+        result = fn()
+        if is_async:
+            await result
+
+    durations = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        result = fn()
+        if is_async:
+            await result
+        durations.append(time.perf_counter() - t0)
+    return summarize(durations, time.perf_counter() - started)
@@ -1,19 +1,73 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, AsyncIterator, List, Literal
+from contextlib import asynccontextmanager
+import os
+import json
+import time
+import asyncio
 import logging
 from app.agents.shopify_agent import ShopifyAnalyticsAgent
+from app.agents.registry import AgentRegistry
 from app.services.cache_service import CacheService
+from app.services.http_client import ShopifyClientPool
+from app.services.rate_limiter import ShopifyRateLimiter, ShopifyRateLimitError
+from app.services.local_store import LocalStoreManager, LOCAL_STORE_ENABLED
+from app.services.job_queue import JOB_TIMEOUT, JobQueue, JobWorkerPool, JobPriority
+from app.services.metrics import REGISTRY, collect_timings, export_cache_stats
+from app.services.admission import ADMISSION_REQUEST_TIMEOUT, AdmissionController, OverloadedError, Ticket, bind_deadline
+from app.services.bulk_operations import BulkOperationTimeout
+from app.services.webhooks import SHOPIFY_WEBHOOK_SECRET, WebhookProcessor, verify_webhook
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# SSE comment sent while a stage is still running, so proxies keep the stream open
+STREAM_HEARTBEAT_INTERVAL = float(os.getenv("STREAM_HEARTBEAT_INTERVAL", "10"))
+
+# Questions accepted by one /api/analyze/batch call
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "100"))
+
+# Initialize services
+cache_service = CacheService()
+shopify_http_pool = ShopifyClientPool()
+shopify_rate_limiter = ShopifyRateLimiter()
+local_store_manager = LocalStoreManager(on_change=cache_service.invalidate) if LOCAL_STORE_ENABLED else None
+agent_registry = AgentRegistry(
+    cache_service=cache_service,
+    http_pool=shopify_http_pool,
+    rate_limiter=shopify_rate_limiter,
+    local_stores=local_store_manager
+)
+job_queue = JobQueue(lambda: cache_service.redis_client)
+webhook_processor = WebhookProcessor(cache_service, local_store_manager)
+admission = AdmissionController()
+REGISTRY.on_collect(lambda: export_cache_stats(cache_service.stats()))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Own shared resources for the lifetime of the app"""
+    await cache_service.connect()
+    cache_service.start_gc()
+    agent_registry.start()
+    job_workers.start()
+    yield
+    await job_workers.aclose()
+    await agent_registry.aclose()
+    await cache_service.aclose()
+    if local_store_manager:
+        await local_store_manager.aclose()
+    await shopify_http_pool.aclose()
+
 app = FastAPI(
     title="Shopify AI Analytics Agent",
     description="LLM-powered agent for Shopify analytics",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -25,13 +79,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-cache_service = CacheService()
-
 class AnalyzeRequest(BaseModel):
     store_id: str = Field(..., description="Shopify store domain")
     question: str = Field(..., description="Natural language question")
     context: Dict[str, Any] = Field(..., description="Store context and credentials")
+    include_timings: bool = Field(False, description="Return a per-stage timing breakdown")
 
 class AnalyzeResponse(BaseModel):
     answer: str
@@ -39,6 +91,37 @@ class AnalyzeResponse(BaseModel):
     query_used: Optional[str] = None
     data_points: int
     reasoning: Optional[str] = None
+    timings: Optional[Dict[str, float]] = Field(None, description="Milliseconds per stage, when requested")
+    degraded: Optional[str] = Field(None, description="Set when answered in a reduced mode under load")
+
+class BatchRequest(BaseModel):
+    store_id: str = Field(..., description="Shopify store domain")
+    questions: List[str] = Field(..., min_length=1, max_length=BATCH_MAX_QUESTIONS, description="Natural language questions")
+    context: Dict[str, Any] = Field(..., description="Store context and credentials")
+    concurrency: Optional[int] = Field(None, ge=1, le=32, description="Concurrent LLM calls")
+
+class BatchItem(BaseModel):
+    question: str
+    result: Optional[AnalyzeResponse] = None
+    error: Optional[Dict[str, Any]] = None
+
+class BatchResponse(BaseModel):
+    store_id: str
+    results: List[BatchItem]
+
+class JobRequest(AnalyzeRequest):
+    priority: Literal["high", "normal", "low"] = Field("normal", description="Queue priority")
+
+class JobResponse(BaseModel):
+    job_id: str
+    store_id: str
+    status: str
+    priority: str
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[AnalyzeResponse] = None
+    error: Optional[Dict[str, Any]] = None
 
 @app.get("/")
 async def root():
@@ -52,8 +135,25 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """Cache hit/miss/eviction counters for this worker"""
+    return cache_service.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics for this worker: stage, Shopify and LLM latency, tokens, cache and rate limits"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+def _retry_after(e: OverloadedError) -> int:
+    # A cached-only miss is worth retrying once the queue has drained
+    return max(1, int(e.retry_after), admission.retry_after() if e.status == 503 else 0)
+
+def _overloaded(e: OverloadedError) -> HTTPException:
+    return HTTPException(status_code=e.status, detail=str(e), headers={"Retry-After": str(_retry_after(e))})
+
 @app.post("/api/analyze", response_model=AnalyzeResponse)
-async def analyze_question(request: AnalyzeRequest):
+async def analyze_question(request: AnalyzeRequest, x_request_timeout: Optional[float] = Header(None)):
     """
     Main endpoint for analyzing natural language questions about Shopify data.
     
@@ -62,21 +162,26 @@ async def analyze_question(request: AnalyzeRequest):
     2. Generate appropriate ShopifyQL query
     3. Execute the query
     4. Convert results to business-friendly language
+    
+    Requests pass admission control first: when overloaded they get a 429
+    (this store has too many queued) or 503 with Retry-After, or are answered
+    in a degraded mode. X-Request-Timeout (seconds) is the caller's deadline.
     """
     try:
         logger.info(f"Processing question for store: {request.store_id}")
         logger.info(f"Question: {request.question}")
         
-        # Initialize agent
-        agent = ShopifyAnalyticsAgent(
-            store_id=request.store_id,
-            access_token=request.context.get("access_token"),
-            api_version=request.context.get("api_version", "2024-01"),
-            cache_service=cache_service
-        )
-        
-        # Process question
-        result = await agent.process_question(request.question)
+        timings = collect_timings() if request.include_timings else None
+        async with admission.admit(request.store_id, x_request_timeout, request.context.get("weight", 1.0)) as ticket:
+            # Reuse the store's agent (shared LLM client, warm ShopifyService)
+            agent = await agent_registry.get_agent(
+                store_id=request.store_id,
+                access_token=request.context.get("access_token"),
+                api_version=request.context.get("api_version", "2024-01")
+            )
+            
+            # Process question
+            result = await agent.process_question(request.question, ticket.mode)
         
         logger.info(f"Successfully processed question. Confidence: {result['confidence']}")
         
@@ -85,12 +190,26 @@ async def analyze_question(request: AnalyzeRequest):
             confidence=result["confidence"],
             query_used=result.get("query_used"),
             data_points=result.get("data_points", 0),
-            reasoning=result.get("reasoning")
+            reasoning=result.get("reasoning"),
+            timings=timings,
+            degraded=result.get("degraded")
         )
         
+    except OverloadedError as e:
+        raise _overloaded(e)
+    except BulkOperationTimeout as e:
+        logger.warning(f"Question for {request.store_id} handed off: {str(e)}")
+        raise HTTPException(status_code=504, detail=str(e))
     except ValueError as e:
         logger.error(f"Validation error: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
+    except ShopifyRateLimitError as e:
+        logger.warning(f"Shopify throttled store {e.store_id}")
+        raise HTTPException(
+            status_code=503,
+            detail="Shopify rate limit reached for this store, please retry shortly",
+            headers={"Retry-After": str(max(1, int(e.retry_after or 2)))}
+        )
     except Exception as e:
         logger.error(f"Error processing question: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -98,6 +217,239 @@ async def analyze_question(request: AnalyzeRequest):
             detail=f"Failed to process question: {str(e)}"
         )
 
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def _error_payload(e: Exception) -> Dict[str, Any]:
+    """Status code and detail analyze_question would respond with"""
+    if isinstance(e, OverloadedError):
+        return {"status": e.status, "detail": str(e), "retry_after": _retry_after(e)}
+    if isinstance(e, BulkOperationTimeout):
+        return {"status": 504, "detail": str(e)}
+    if isinstance(e, ValueError):
+        return {"status": 400, "detail": str(e)}
+    if isinstance(e, ShopifyRateLimitError):
+        return {
+            "status": 503,
+            "detail": "Shopify rate limit reached for this store, please retry shortly",
+            "retry_after": max(1, int(e.retry_after or 2))
+        }
+    logger.error(f"Error processing question: {str(e)}", exc_info=True)
+    return {"status": 500, "detail": f"Failed to process question: {str(e)}"}
+
+def _error_event(e: Exception) -> str:
+    return _sse("error", _error_payload(e))
+
+async def _event_stream(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    """Format agent events as SSE, with heartbeats while a stage is running"""
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            async for event in events:
+                await queue.put(_sse(event["event"], event["data"]))
+        except Exception as e:
+            await queue.put(_error_event(e))
+        finally:
+            await queue.put(done)
+
+    producer = asyncio.create_task(pump())
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), STREAM_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if item is done:
+                break
+            yield item
+    finally:
+        # Client went away: stop the pipeline too
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+
+async def _admitted(events: AsyncIterator[Dict[str, Any]], ticket: Ticket) -> AsyncIterator[Dict[str, Any]]:
+    """Hold the admission slot until the stream ends"""
+    bind_deadline(ticket)
+    try:
+        async for event in events:
+            yield event
+    finally:
+        admission.release(ticket)
+
+@app.post("/api/analyze/stream")
+async def analyze_question_stream(request: AnalyzeRequest, x_request_timeout: Optional[float] = Header(None)):
+    """
+    Streaming variant of /api/analyze using Server-Sent Events.
+
+    Emits `intent`, `query`, `data` (data_points and preview rows) as each stage
+    completes, `token` events with explanation text as the LLM generates it, and
+    a final `answer` event with the same fields as AnalyzeResponse. Failures
+    arrive as an `error` event carrying the HTTP status /api/analyze would use.
+    Admission control runs before the stream starts, as for /api/analyze.
+    """
+    logger.info(f"Streaming question for store: {request.store_id}")
+    logger.info(f"Question: {request.question}")
+
+    try:
+        ticket = await admission.acquire(request.store_id, x_request_timeout, request.context.get("weight", 1.0))
+    except OverloadedError as e:
+        raise _overloaded(e)
+
+    try:
+        agent = await agent_registry.get_agent(
+            store_id=request.store_id,
+            access_token=request.context.get("access_token"),
+            api_version=request.context.get("api_version", "2024-01")
+        )
+    except BaseException:
+        admission.release(ticket)
+        raise
+
+    return StreamingResponse(
+        _event_stream(_admitted(agent.stream_question(request.question, ticket.mode), ticket)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also covers a client that disconnects before the stream starts (release is idempotent)
+        background=BackgroundTask(admission.release, ticket)
+    )
+
+@app.post("/api/analyze/batch", response_model=BatchResponse)
+async def analyze_batch(request: BatchRequest, x_request_timeout: Optional[float] = Header(None)):
+    """
+    Answer many questions for one store in a single call.
+
+    Questions are planned together; queries scanning the same domain share one
+    Shopify fetch, identical queries run once, and the LLM steps run with at
+    most `concurrency` calls in flight. Each question passes admission control
+    as /api/analyze would, in groups of at most the worker's concurrency, all
+    by the one X-Request-Timeout deadline. Each item carries its result or the
+    error (status and detail) /api/analyze would have returned.
+    """
+    logger.info(f"Processing batch of {len(request.questions)} questions for store: {request.store_id}")
+
+    agent = await agent_registry.get_agent(
+        store_id=request.store_id,
+        access_token=request.context.get("access_token"),
+        api_version=request.context.get("api_version", "2024-01")
+    )
+
+    kwargs = {"concurrency": request.concurrency} if request.concurrency else {}
+    weight = request.context.get("weight", 1.0)
+    deadline = time.monotonic() + (x_request_timeout or ADMISSION_REQUEST_TIMEOUT)
+    results: List[Any] = []
+    for start in range(0, len(request.questions), admission.max_concurrency):
+        group = request.questions[start:start + admission.max_concurrency]
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            error = OverloadedError("Batch ran past its deadline before this question was admitted", admission.retry_after())
+            results.extend(error for _ in group)
+            continue
+
+        async with admission.admit_all(request.store_id, len(group), remaining, weight) as tickets:
+            admitted = [i for i, ticket in enumerate(tickets) if isinstance(ticket, Ticket)]
+            answers = await agent.process_batch(
+                [group[i] for i in admitted], modes=[tickets[i].mode for i in admitted], **kwargs
+            ) if admitted else []
+        answered = list(tickets)
+        for i, answer in zip(admitted, answers):
+            answered[i] = answer
+        results.extend(answered)
+
+    items = []
+    for question, result in zip(request.questions, results):
+        if isinstance(result, Exception):
+            items.append(BatchItem(question=question, error=_error_payload(result)))
+        else:
+            items.append(BatchItem(question=question, result=AnalyzeResponse(**result)))
+
+    return BatchResponse(store_id=request.store_id, results=items)
+
+async def _run_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Answer a queued question. Jobs share admission with /api/analyze; when
+    shed they wait out Retry-After and try again (JOB_TIMEOUT bounds it).
+    """
+    payload = job["payload"]
+    agent = await agent_registry.get_agent(
+        store_id=job["store_id"],
+        access_token=payload["context"].get("access_token"),
+        api_version=payload["context"].get("api_version", "2024-01")
+    )
+    timings = collect_timings() if payload.get("include_timings") else None
+    while True:
+        try:
+            async with admission.admit(
+                job["store_id"], JOB_TIMEOUT, payload["context"].get("weight", 1.0), interactive=False
+            ) as ticket:
+                result = await agent.process_question(payload["question"], ticket.mode)
+            break
+        except OverloadedError as e:
+            logger.info(f"Job {job['id']} shed, retrying in {_retry_after(e)}s: {str(e)}")
+            await asyncio.sleep(_retry_after(e))
+    return AnalyzeResponse(**result, timings=timings).model_dump()
+
+job_workers = JobWorkerPool(job_queue, handler=_run_job, on_error=_error_payload)
+
+def _job_response(job: Dict[str, Any]) -> JobResponse:
+    return JobResponse(job_id=job["id"], **{k: v for k, v in job.items() if k != "id"})
+
+@app.post("/api/jobs", response_model=JobResponse, status_code=202)
+async def submit_job(request: JobRequest):
+    """
+    Queue a question to run off the request path. Jobs pass admission
+    control when a worker picks them up, waiting rather than failing when shed.
+
+    Poll GET /api/jobs/{job_id} until status is completed (result holds the
+    AnalyzeResponse) or failed (error holds the status and detail).
+    """
+    job_id = await job_queue.submit(
+        request.store_id,
+        {"question": request.question, "context": request.context, "include_timings": request.include_timings},
+        priority=JobPriority[request.priority.upper()]
+    )
+    job_workers.notify()
+    return _job_response(await job_queue.get(job_id))
+
+@app.get("/api/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """Status of a queued job, with its result or error once finished"""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return _job_response(job)
+
+@app.post("/webhooks/shopify")
+async def shopify_webhook(request: Request):
+    """
+    Receive Shopify webhooks (orders, products, inventory_levels, customers).
+
+    The raw body must carry a valid X-Shopify-Hmac-Sha256 signature. The
+    change is applied to the store's local copy and only the affected cache
+    namespace is bumped; redeliveries (same X-Shopify-Webhook-Id) are no-ops.
+    """
+    if not SHOPIFY_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail="Webhooks are not configured")
+
+    body = await request.body()
+    if not verify_webhook(body, request.headers.get("X-Shopify-Hmac-Sha256")):
+        logger.warning(f"Rejected webhook with invalid signature from {request.headers.get('X-Shopify-Shop-Domain')}")
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+
+    shop = request.headers.get("X-Shopify-Shop-Domain")
+    topic = request.headers.get("X-Shopify-Topic")
+    if not shop or not topic:
+        raise HTTPException(status_code=400, detail="Missing X-Shopify-Shop-Domain or X-Shopify-Topic")
+
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Webhook body is not valid JSON")
+
+    return await webhook_processor.handle(shop, topic, payload, request.headers.get("X-Shopify-Webhook-Id"))
+
 @app.post("/api/validate-query")
 async def validate_query(query: str):
     """Validate ShopifyQL query syntax"""
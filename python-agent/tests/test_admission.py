@@ -0,0 +1,196 @@
+import asyncio
+
+import pytest
+
+from app.services import admission as admission_module
+from app.services.admission import AdmissionController, Mode, OverloadedError, request_deadline
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def queue_up(controller, *store_ids, timeout=None):
+    """Queue one question per store id, in this order; each task returns its ticket"""
+    tasks = []
+    for store_id in store_ids:
+        tasks.append(asyncio.create_task(controller.acquire(store_id, timeout)))
+        await settle()
+    return tasks
+
+
+async def answer_in_turn(controller, order, questions):
+    """Queue (store, weight) questions in this order; each records its store when admitted and finishes at once"""
+    async def ask(store_id, weight):
+        ticket = await controller.acquire(store_id, weight=weight)
+        order.append(store_id)
+        controller.release(ticket)
+
+    tasks = []
+    for store_id, weight in questions:
+        tasks.append(asyncio.create_task(ask(store_id, weight)))
+        await settle()
+    return tasks
+
+
+async def test_slots_go_to_stores_fairly_not_first_come():
+    controller = AdmissionController(max_concurrency=1)
+    held = await controller.acquire("busy")
+    order = []
+    tasks = await answer_in_turn(controller, order, [("a", 1.0), ("a", 1.0), ("a", 1.0), ("b", 1.0)])
+    assert controller.queued == 4
+
+    controller.release(held)
+    await asyncio.gather(*tasks)
+    # b's first question is tagged level with a's first, ahead of a's backlog
+    assert order == ["a", "b", "a", "a"]
+    assert controller.active == 0 and controller.queued == 0
+
+
+async def test_heavier_weight_gets_more_slots():
+    controller = AdmissionController(max_concurrency=1)
+    held = await controller.acquire("busy")
+    order = []
+    tasks = await answer_in_turn(
+        controller, order, [("a", 1.0), ("a", 1.0), ("a", 1.0), ("b", 3.0), ("b", 3.0), ("b", 3.0)]
+    )
+
+    controller.release(held)
+    await asyncio.gather(*tasks)
+    assert order == ["a", "b", "b", "b", "a", "a"]
+
+
+async def test_store_over_its_queue_gets_429():
+    controller = AdmissionController(max_concurrency=1, store_max_queue=1)
+    held = await controller.acquire("busy")
+    tasks = await queue_up(controller, "a")
+
+    with pytest.raises(OverloadedError) as error:
+        await controller.acquire("a")
+    assert error.value.status == 429 and error.value.retry_after >= 1
+
+    # Other stores still queue
+    tasks += await queue_up(controller, "b")
+    assert controller.queued == 2
+
+    controller.release(held)
+    for task in tasks:
+        controller.release(await task)
+
+
+async def test_full_worker_queue_gets_503():
+    controller = AdmissionController(max_concurrency=1, max_queue=1)
+    held = await controller.acquire("busy")
+    tasks = await queue_up(controller, "a")
+
+    with pytest.raises(OverloadedError) as error:
+        await controller.acquire("b")
+    assert error.value.status == 503
+
+    controller.release(held)
+    controller.release(await tasks[0])
+
+
+async def test_questions_that_cannot_meet_their_deadline_are_shed_up_front():
+    controller = AdmissionController(max_concurrency=1)
+    held = await controller.acquire("busy")
+    # Assumed 5s of service: the first fits a 6s deadline, the next would start too late
+    tasks = await queue_up(controller, "a", timeout=6)
+
+    with pytest.raises(OverloadedError, match="cannot be answered within 6s"):
+        await controller.acquire("a", timeout=6)
+    assert controller.queued == 1
+
+    controller.release(held)
+    controller.release(await tasks[0])
+
+
+async def test_waiters_past_their_deadline_leave_the_queue(monkeypatch):
+    monkeypatch.setattr(admission_module, "ADMISSION_INITIAL_SERVICE_TIME", 0.0)
+    controller = AdmissionController(max_concurrency=1)
+    held = await controller.acquire("busy")
+
+    with pytest.raises(OverloadedError, match="waited past its deadline"):
+        await controller.acquire("a", timeout=0.05)
+    assert controller.queued == 0
+
+    # The expired entry is skipped, not handed a slot
+    controller.release(held)
+    assert controller.active == 0
+
+
+async def test_cancelled_waiters_leave_the_queue():
+    controller = AdmissionController(max_concurrency=1)
+    held = await controller.acquire("busy")
+    tasks = await queue_up(controller, "a")
+
+    tasks[0].cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    assert controller.queued == 0
+
+    controller.release(held)
+    assert controller.active == 0
+
+
+async def test_deep_queue_degrades_new_questions(monkeypatch):
+    monkeypatch.setattr(admission_module, "ADMISSION_SKIP_EXPLANATION_DEPTH", 1)
+    monkeypatch.setattr(admission_module, "ADMISSION_CACHED_ONLY_DEPTH", 2)
+    controller = AdmissionController(max_concurrency=1)
+    held = await controller.acquire("busy")
+    assert held.mode == Mode.FULL
+
+    tasks = await queue_up(controller, "a")
+    assert controller.mode() == Mode.SKIP_EXPLANATION
+    tasks += await queue_up(controller, "b")
+
+    # Cache-only answers skip the queue and hold no slot
+    cached = await controller.acquire("c")
+    assert cached.mode == Mode.CACHED_ONLY and not cached.slot
+    assert controller.queued == 2
+
+    controller.release(held)
+    first = await tasks[0]
+    # Modes are decided when the slot is granted: one question is still queued
+    assert first.mode == Mode.SKIP_EXPLANATION
+    controller.release(first)
+    second = await tasks[1]
+    assert second.mode == Mode.FULL
+    controller.release(second)
+
+
+async def test_release_is_idempotent_and_learns_service_time():
+    controller = AdmissionController(max_concurrency=2)
+    ticket = await controller.acquire("a")
+    await asyncio.sleep(0.01)
+    controller.release(ticket)
+    controller.release(ticket)
+
+    assert controller.active == 0
+    assert controller.service_time("a") < admission_module.ADMISSION_INITIAL_SERVICE_TIME
+
+
+async def test_admit_binds_the_deadline_for_interactive_questions_only():
+    controller = AdmissionController()
+    async with controller.admit("a", timeout=10) as ticket:
+        assert request_deadline() == ticket.deadline
+    assert request_deadline() is None
+
+    async with controller.admit("a", timeout=10, interactive=False):
+        assert request_deadline() is None
+    assert controller.active == 0
+
+
+async def test_admit_all_sheds_per_question_and_releases_everything():
+    controller = AdmissionController(max_concurrency=1, store_max_queue=1)
+    held = await controller.acquire("busy")
+    asyncio.get_running_loop().call_later(0.02, controller.release, held)
+
+    async with controller.admit_all("a", 3) as results:
+        tickets = [result for result in results if not isinstance(result, OverloadedError)]
+        shed = [result for result in results if isinstance(result, OverloadedError)]
+        assert len(tickets) == 1 and len(shed) == 2
+        assert {error.status for error in shed} == {429}
+        assert request_deadline() == tickets[0].deadline
+
+    assert controller.active == 0 and controller.queued == 0
@@ -0,0 +1,120 @@
+import pytest
+
+from app.services.aggregation import AggregationEngine, aggregate_pages
+from app.services.shopifyql import ShopifyQLSyntaxError, plan_query
+
+ORDERS = [
+    {
+        "id": i,
+        "created_at": f"2024-01-0{1 + i % 3}T10:00:00Z",
+        "total_price": float(10 * (i + 1)),
+        "financial_status": "paid" if i % 2 else "pending",
+        "line_items": [{"id": i * 10, "product_id": 100 + i % 4, "name": f"P{i % 4}", "quantity": i % 5 + 1, "price": 5.0}],
+    }
+    for i in range(12)
+]
+
+
+async def run(query, rows=ORDERS, page_size=5):
+    async def pages():
+        for start in range(0, len(rows), page_size):
+            yield rows[start:start + page_size]
+
+    return await aggregate_pages(pages(), plan_query(query))
+
+
+async def test_totals_across_pages():
+    result = await run("SELECT COUNT(*) AS orders, SUM(total_price) AS sales, AVG(total_price) AS aov FROM orders")
+    assert result == [{"orders": 12, "sales": 780.0, "aov": 65.0}]
+
+
+async def test_group_by_day_with_order_and_limit():
+    result = await run("SELECT day, COUNT(*) AS orders FROM orders GROUP BY day ORDER BY day DESC LIMIT 2")
+    assert [(row["day"][:10], row["orders"]) for row in result] == [("2024-01-03", 4), ("2024-01-02", 4)]
+
+
+async def test_line_item_revenue_by_product():
+    result = await run("SELECT product_id, SUM(price * quantity) AS revenue FROM orders GROUP BY product_id ORDER BY revenue DESC LIMIT 1")
+    assert result == [{"product_id": 100, "product_name": "P0", "revenue": 50.0}]
+
+
+async def test_having_on_aggregate_calls():
+    result = await run(
+        "SELECT day, COUNT(*) AS orders, SUM(total_price) AS sales FROM orders "
+        "GROUP BY day HAVING COUNT(*) >= 4 AND SUM(total_price) > 250 ORDER BY day"
+    )
+    assert [(row["day"][:10], row["sales"]) for row in result] == [("2024-01-02", 260.0), ("2024-01-03", 300.0)]
+
+
+async def test_having_on_alias_before_limit():
+    result = await run(
+        "SELECT product_id, SUM(quantity) AS units FROM orders GROUP BY product_id HAVING units > 8 ORDER BY units ASC LIMIT 1"
+    )
+    assert [(row["product_id"], row["units"]) for row in result] == [(103, 9.0)]
+
+
+async def test_having_only_aggregate_is_hidden():
+    result = await run("SELECT financial_status, COUNT(*) AS orders FROM orders GROUP BY financial_status HAVING MAX(total_price) > 115")
+    assert result == [{"financial_status": "paid", "orders": 6}]
+
+
+async def test_having_can_filter_everything():
+    assert await run("SELECT COUNT(*) AS n FROM orders HAVING n > 100") == []
+
+
+def test_having_unknown_column_is_a_syntax_error():
+    with pytest.raises(ShopifyQLSyntaxError):
+        AggregationEngine(plan_query("SELECT day, COUNT(*) FROM orders GROUP BY day HAVING discount > 1"))
+
+
+def test_rollup_compatibility():
+    engine = AggregationEngine(plan_query("SELECT day, SUM(total_price) AS sales FROM orders GROUP BY day"))
+    assert engine.rollup_compatible({"created_at", "total_price"})
+    assert not AggregationEngine(plan_query("SELECT MAX(total_price) FROM orders")).rollup_compatible({"total_price"})
+    assert not AggregationEngine(plan_query("SELECT hour, COUNT(*) FROM orders GROUP BY hour")).rollup_compatible({"created_at"})
+
+
+MIXED_ORDERS = [
+    {
+        "id": 1, "created_at": "2024-01-01T10:00:00Z", "total_price": 40.0,
+        "line_items": [
+            {"id": 11, "product_id": 1, "title": "Shirt", "name": "Shirt", "sku": "SHIRT", "quantity": 2, "price": 15.0},
+            {"id": 12, "product_id": 2, "title": "Hat", "name": "Hat", "sku": "HAT", "quantity": 1, "price": 10.0},
+        ],
+    },
+    {
+        "id": 2, "created_at": "2024-01-02T10:00:00Z", "total_price": 30.0,
+        "line_items": [{"id": 21, "product_id": 2, "title": "Hat", "name": "Hat", "sku": "HAT", "quantity": 3, "price": 10.0}],
+    },
+]
+
+
+@pytest.mark.parametrize("query, expected", [
+    (
+        "SELECT product_title, SUM(quantity) AS units FROM orders WHERE line_items.title = 'Shirt' GROUP BY product_title",
+        [{"product_name": "Shirt", "units": 2.0}],
+    ),
+    (
+        "SELECT product_id, SUM(quantity) AS units FROM orders WHERE sku = 'HAT' AND total_price > 35 GROUP BY product_id",
+        [{"product_id": 2, "product_name": "Hat", "units": 1.0}],
+    ),
+    # Order-level aggregates count the orders with a matching line item
+    ("SELECT COUNT(*) AS orders FROM orders WHERE sku = 'HAT'", [{"orders": 2}]),
+])
+async def test_line_item_conditions_filter_the_exploded_items(query, expected):
+    plan = plan_query(query)
+    assert "line_items" in plan.fields
+
+    async def pages():
+        yield MIXED_ORDERS
+
+    # As the service runs it: the order predicate first, then the engine
+    assert await aggregate_pages(pages(), plan, plan.matches) == expected
+
+
+def test_listings_keep_orders_with_a_matching_line_item():
+    plan = plan_query("FROM orders WHERE line_items.title = 'Shirt' AND quantity >= 2")
+    assert [order["id"] for order in MIXED_ORDERS if plan.matches(order)] == [1]
+    # Both conditions must hold for the same line item
+    plan = plan_query("FROM orders WHERE line_items.title = 'Hat' AND quantity >= 2")
+    assert [order["id"] for order in MIXED_ORDERS if plan.matches(order)] == [2]
@@ -0,0 +1,142 @@
+import asyncio
+
+import httpx
+import pytest
+
+import main
+from app.agents.shopify_agent import ShopifyAnalyticsAgent
+from app.services import admission as admission_module
+from app.services.admission import AdmissionController, Mode, OverloadedError
+from app.services.http_client import ShopifyClientPool
+from app.services.rate_limiter import ShopifyRateLimiter
+from benchmarks.fake_shopify import FakeShopify
+from benchmarks.synthetic import StoreSize
+
+
+class FakeAgent:
+    def __init__(self):
+        self.calls = []
+
+    async def process_batch(self, questions, modes=None, **kwargs):
+        self.calls.append((list(questions), list(modes)))
+        await asyncio.sleep(0.01)
+        return [{"answer": question, "confidence": "high", "data_points": 0} for question in questions]
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    agent = FakeAgent()
+
+    async def get_agent(**kwargs):
+        return agent
+
+    monkeypatch.setattr(main.agent_registry, "get_agent", get_agent)
+    return agent
+
+
+@pytest.fixture
+def admission(monkeypatch):
+    controller = AdmissionController(max_concurrency=2, store_max_queue=1)
+    monkeypatch.setattr(main, "admission", controller)
+    return controller
+
+
+async def post_batch(questions, store_id="a.myshopify.com"):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+        response = await client.post("/api/analyze/batch", json={"store_id": store_id, "questions": questions, "context": {}})
+    assert response.status_code == 200
+    return response.json()["results"]
+
+
+async def test_questions_are_admitted_in_groups_of_the_concurrency(agent, admission):
+    results = await post_batch(["q1", "q2", "q3", "q4", "q5"])
+
+    assert [item["result"]["answer"] for item in results] == ["q1", "q2", "q3", "q4", "q5"]
+    assert [questions for questions, _ in agent.calls] == [["q1", "q2"], ["q3", "q4"], ["q5"]]
+    assert admission.active == 0 and admission.queued == 0
+
+
+async def test_questions_over_the_store_queue_are_shed_individually(agent, admission):
+    # Another store holds both slots, so the batch has to queue
+    held = [await admission.acquire("b.myshopify.com") for _ in range(2)]
+    asyncio.get_running_loop().call_later(0.05, lambda: [admission.release(ticket) for ticket in held])
+
+    results = await post_batch(["q1", "q2"])
+
+    errors = [item["error"] for item in results if item["error"]]
+    assert len(errors) == 1 and errors[0]["status"] == 429
+    assert sum(1 for item in results if item["result"]) == 1
+    assert agent.calls and len(agent.calls[0][0]) == 1
+    assert admission.active == 0 and admission.queued == 0
+
+
+async def test_degraded_mode_reaches_the_agent(agent, admission, monkeypatch):
+    monkeypatch.setattr(admission_module, "ADMISSION_SKIP_EXPLANATION_DEPTH", 0)
+    await post_batch(["q1", "q2"])
+    assert agent.calls[0][1] == [Mode.SKIP_EXPLANATION, Mode.SKIP_EXPLANATION]
+
+
+async def test_process_batch_honours_each_questions_mode(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    agent = ShopifyAnalyticsAgent(
+        "a.myshopify.com", "token", http_pool=ShopifyClientPool(), rate_limiter=ShopifyRateLimiter()
+    )
+    explained = []
+
+    async def plan(question, normalized):
+        return {"domain": "orders"}, f"FROM orders WHERE name = '{question}'"
+
+    async def execute(query, intent, shared=None):
+        return [{"total": 1}]
+
+    async def explain(question, data, query):
+        explained.append(question)
+        return {"answer": "explained", "confidence": "high"}
+
+    monkeypatch.setattr(agent, "_plan", plan)
+    monkeypatch.setattr(agent, "_execute_query", execute)
+    monkeypatch.setattr(agent, "_explain_results", explain)
+
+    full, skipped, cached_only = await agent.process_batch(
+        ["a", "b", "c"], modes=[Mode.FULL, Mode.SKIP_EXPLANATION, Mode.CACHED_ONLY]
+    )
+
+    assert full["answer"] == "explained"
+    assert skipped["degraded"] == Mode.SKIP_EXPLANATION and skipped["answer"].startswith("Found 1 result rows")
+    assert isinstance(cached_only, OverloadedError)
+    assert explained == ["a"]
+
+
+async def test_batch_answers_match_the_single_question_path(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    shopify = FakeShopify(size=StoreSize(orders=200, products=10, customers=20, days=30), latency=0, bucket_size=1000)
+    agent = ShopifyAnalyticsAgent(
+        "a.myshopify.com", "token",
+        http_pool=ShopifyClientPool(transport=shopify.transport()), rate_limiter=ShopifyRateLimiter()
+    )
+    since = "2020-01-01T00:00:00Z"
+    queries = {
+        # API-only filter: Shopify applies it, the fetched rows carry no `status` field
+        "cancelled": f"SELECT COUNT(*) AS orders FROM orders WHERE status = 'cancelled' AND created_at >= '{since}'",
+        "open": f"FROM orders WHERE status = 'open' AND created_at >= '{since}' ORDER BY total_price DESC LIMIT 3",
+        "large": f"SELECT COUNT(*) AS orders FROM orders WHERE total_price > 50 AND created_at >= '{since}'",
+        "daily": f"SELECT day, SUM(total_price) AS sales FROM orders WHERE created_at >= '{since}' GROUP BY day ORDER BY day",
+    }
+    answered = {}
+
+    async def plan(question, normalized):
+        return {"domain": "orders"}, queries[question]
+
+    async def explain(question, data, query):
+        answered[question] = data
+        return {"answer": "explained", "confidence": "high"}
+
+    monkeypatch.setattr(agent, "_plan", plan)
+    monkeypatch.setattr(agent, "_explain_results", explain)
+
+    results = await agent.process_batch(list(queries))
+    assert not [result for result in results if isinstance(result, Exception)]
+    for question, query in queries.items():
+        assert answered[question] == await agent._execute_query(query, {"domain": "orders"})
+    # FakeShopify ignores `status`; matching it on the shared rows found nothing
+    assert answered["cancelled"] == [{"orders": 200}] and len(answered["open"]) == 3
@@ -0,0 +1,146 @@
+import json
+import time
+
+import httpx
+import pytest
+
+from app.services import bulk_operations
+from app.services.admission import AdmissionController, request_deadline
+from app.services.bulk_operations import BULK_DEADLINE_HEADROOM, BulkOperationRunner, BulkOperationTimeout, iter_bulk_orders
+from app.services.http_client import ShopifyClientPool
+from app.services.rate_limiter import ShopifyRateLimiter
+from app.services.shopify_service import ShopifyService
+
+OPERATION_ID = "gid://shopify/BulkOperation/1"
+
+
+class RunningExport:
+    """GraphQL stand-in: one bulk operation that stays RUNNING until `finish_after` polls"""
+
+    def __init__(self, finish_after: int = -1):
+        self.store_id = "test.myshopify.com"
+        self.finish_after = finish_after
+        self.polls = 0
+        self.cancelled = []
+
+    async def graphql(self, query, variables=None):
+        if "bulkOperationRunQuery" in query:
+            return {"bulkOperationRunQuery": {"bulkOperation": {"id": OPERATION_ID, "status": "CREATED"}, "userErrors": []}}
+        if "bulkOperationCancel" in query:
+            self.cancelled.append(variables["id"])
+            return {"bulkOperationCancel": {"bulkOperation": {"id": variables["id"], "status": "CANCELING"}, "userErrors": []}}
+        self.polls += 1
+        status = "COMPLETED" if self.polls == self.finish_after else "RUNNING"
+        return {"currentBulkOperation": {"id": OPERATION_ID, "status": status, "url": "https://x/1.jsonl"}}
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(bulk_operations, "BULK_POLL_INTERVAL", 0.01)
+
+
+async def test_wait_stops_at_the_request_deadline_and_cancels():
+    service = RunningExport()
+    started = time.monotonic()
+    with pytest.raises(BulkOperationTimeout, match="/api/jobs"):
+        await BulkOperationRunner(service).wait(OPERATION_ID, deadline=started + BULK_DEADLINE_HEADROOM + 0.2)
+
+    # Stopped with the headroom still left for the rest of the request
+    assert time.monotonic() - started < 0.4
+    assert service.cancelled == [OPERATION_ID]
+
+
+async def test_wait_without_deadline_polls_until_complete():
+    service = RunningExport(finish_after=5)
+    url = await BulkOperationRunner(service).wait(OPERATION_ID)
+    assert url == "https://x/1.jsonl"
+    assert service.polls == 5
+    assert not service.cancelled
+
+
+async def test_admit_exposes_the_deadline_to_bulk_exports():
+    service = ShopifyService("test.myshopify.com", "token", http_pool=ShopifyClientPool(), rate_limiter=ShopifyRateLimiter())
+    export = RunningExport()
+    service.graphql = export.graphql
+
+    assert request_deadline() is None
+    async with AdmissionController().admit("test.myshopify.com", timeout=BULK_DEADLINE_HEADROOM + 0.2) as ticket:
+        assert request_deadline() == ticket.deadline
+        with pytest.raises(BulkOperationTimeout):
+            async for _ in service._iter_bulk_orders({"status": "any"}):
+                pass
+    assert request_deadline() is None
+    assert export.cancelled
+
+
+# Bulk output: each order row, then its line items pointing back with __parentId
+JSONL = "\n".join(json.dumps(row) for row in [
+    {"id": "gid://shopify/Order/1", "name": "#1001", "createdAt": "2024-03-01T10:00:00Z",
+     "displayFinancialStatus": "PAID", "totalPriceSet": {"shopMoney": {"amount": "30.00"}}},
+    {"id": "gid://shopify/LineItem/11", "name": "Hat", "quantity": 2, "product": {"id": "gid://shopify/Product/7"},
+     "originalUnitPriceSet": {"shopMoney": {"amount": "10.00"}}, "__parentId": "gid://shopify/Order/1"},
+    {"id": "gid://shopify/LineItem/12", "name": "Scarf", "quantity": 1, "product": None,
+     "originalUnitPriceSet": {"shopMoney": {"amount": "10.00"}}, "__parentId": "gid://shopify/Order/1"},
+    {"id": "gid://shopify/Order/2", "name": "#1002", "createdAt": "2024-03-02T10:00:00Z",
+     "displayFinancialStatus": "REFUNDED", "totalPriceSet": {"shopMoney": {"amount": "5.00"}}},
+    {"id": "gid://shopify/LineItem/21", "name": "Orphan", "quantity": 1, "__parentId": "gid://shopify/Order/9"},
+    {"id": "gid://shopify/Order/3", "name": "#1003", "createdAt": "2024-03-03T10:00:00Z",
+     "displayFinancialStatus": "PENDING", "totalPriceSet": {"shopMoney": {"amount": "12.50"}}},
+    {"id": "gid://shopify/LineItem/31", "name": "Hat", "quantity": 1, "product": {"id": "gid://shopify/Product/7"},
+     "originalUnitPriceSet": {"shopMoney": {"amount": "12.50"}}, "__parentId": "gid://shopify/Order/3"},
+]) + "\n\n"
+
+
+def check_orders(pages):
+    orders = [order for page in pages for order in page]
+    assert [order["id"] for order in orders] == [1, 2, 3]
+    assert orders[0] == {
+        "id": 1, "name": "#1001", "created_at": "2024-03-01T10:00:00Z", "financial_status": "paid", "total_price": "30.00",
+        "line_items": [
+            {"id": 11, "product_id": 7, "name": "Hat", "quantity": 2, "price": "10.00"},
+            {"id": 12, "product_id": None, "name": "Scarf", "quantity": 1, "price": "10.00"},
+        ],
+    }
+    # The row whose parent is not the current order is dropped, not attached to #1002
+    assert orders[1]["line_items"] == []
+    assert [item["id"] for item in orders[2]["line_items"]] == [31]
+
+
+@pytest.fixture
+def export_file(tmp_path):
+    path = tmp_path / "bulk.jsonl"
+    path.write_text(JSONL, encoding="utf-8")
+    return path
+
+
+async def test_parses_a_local_file(export_file):
+    check_orders([page async for page in iter_bulk_orders(str(export_file))])
+
+
+async def test_parses_a_file_url_in_pages(export_file):
+    pages = [page async for page in iter_bulk_orders(export_file.as_uri(), page_size=2)]
+    assert [len(page) for page in pages] == [2, 1]
+    check_orders(pages)
+
+
+async def test_streams_a_signed_url_over_http():
+    requested = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requested.append(str(request.url))
+        assert "X-Shopify-Access-Token" not in request.headers
+        return httpx.Response(200, content=JSONL.encode())
+
+    pool = ShopifyClientPool(transport=httpx.MockTransport(handler))
+    service = ShopifyService("test.myshopify.com", "token", http_pool=pool, rate_limiter=ShopifyRateLimiter())
+    url = "https://storage.googleapis.com/shopify-bulk/bulk.jsonl?X-Goog-Signature=abc"
+
+    check_orders([page async for page in iter_bulk_orders(url, service)])
+    assert requested == [url]
+    await pool.aclose()
+
+
+async def test_http_download_needs_a_service():
+    with pytest.raises(ValueError):
+        async for _ in iter_bulk_orders("https://storage.googleapis.com/bulk.jsonl"):
+            pass
@@ -0,0 +1,48 @@
+import time
+from datetime import datetime
+
+import pytest
+
+from app.services import cache_service
+from app.services.cache_service import CACHE_MIN_RESULT_TTL, CACHE_RESULT_TTL, CACHE_WEBHOOK_RESULT_TTL, CacheService
+
+STORE = "a.myshopify.com"
+
+
+@pytest.fixture
+def cache():
+    return CacheService()
+
+
+def at(monkeypatch, value: datetime):
+    monkeypatch.setattr(cache_service, "utc_now", lambda: value)
+
+
+def webhook_backed(cache: CacheService):
+    cache._coverage[STORE] = (time.monotonic() + 60, time.time() + 3600)
+
+
+async def test_default_ttl_mid_day(cache, monkeypatch):
+    at(monkeypatch, datetime(2024, 3, 1, 12, 0))
+    assert await cache.result_ttl(STORE) == CACHE_RESULT_TTL
+
+
+async def test_webhook_ttl_mid_day(cache, monkeypatch):
+    at(monkeypatch, datetime(2024, 3, 1, 12, 0))
+    webhook_backed(cache)
+    assert await cache.result_ttl(STORE) == CACHE_WEBHOOK_RESULT_TTL
+
+
+@pytest.mark.parametrize("backed", [False, True])
+async def test_results_expire_at_utc_midnight(cache, monkeypatch, backed):
+    if backed:
+        webhook_backed(cache)
+    # 100s before midnight: neither the default nor the webhook TTL may cross it
+    at(monkeypatch, datetime(2024, 3, 1, 23, 58, 20))
+    assert await cache.result_ttl(STORE) == 100
+
+
+async def test_ttl_has_a_floor_just_before_midnight(cache, monkeypatch):
+    webhook_backed(cache)
+    at(monkeypatch, datetime(2024, 3, 1, 23, 59, 59, 500000))
+    assert await cache.result_ttl(STORE) == CACHE_MIN_RESULT_TTL
@@ -0,0 +1,80 @@
+import pytest
+
+from app.agents.intent_classifier import IntentClassifier, extract_repeat_threshold, find_qualifiers
+
+
+@pytest.fixture(scope="module")
+def classifier():
+    return IntentClassifier()
+
+
+@pytest.mark.parametrize("question", [
+    "How many orders were unfulfilled last week?",
+    "Total sales from discount code SUMMER10",
+    "Top 5 products in the shoes collection",
+    "low stock items at the Brooklyn warehouse",
+    "Top 3 customers in New York",
+    "How much revenue came from paid orders this month?",
+    "How many orders over 100 dollars yesterday?",
+    # Words the template has no slot for
+    "sales trend for hats",
+    "daily sales for product X",
+    "best selling products on weekends",
+    "total revenue excluding tax last month",
+])
+def test_qualified_questions_go_to_the_llm(classifier, question):
+    result = classifier.classify(question)
+    assert result.slots["qualifiers"]
+    assert not classifier.confident(result)
+
+
+@pytest.mark.parametrize("question, label, query", [
+    (
+        "What were my top 5 selling products last week?",
+        "top_products",
+        "FROM orders DURING last_week GROUP BY product_id ORDER BY SUM(quantity) DESC LIMIT 5",
+    ),
+    ("Show inventory below 10 units", "low_stock", "FROM inventory WHERE quantity < 10 ORDER BY quantity ASC"),
+    ("Who are my top 10 customers by total spent?", "top_customers", "FROM customers ORDER BY total_spent DESC LIMIT 10"),
+    ("top customers by number of orders", "top_customers", "FROM customers ORDER BY orders_count DESC LIMIT 5"),
+    (
+        "How many orders did we get last 7 days?",
+        "order_summary",
+        "SELECT COUNT(*) AS orders, SUM(total_price) AS total_sales FROM orders DURING last_7_days",
+    ),
+])
+def test_formulaic_questions_take_the_fast_path(classifier, question, label, query):
+    result = classifier.classify(question)
+    assert classifier.confident(result)
+    assert result.label == label
+    assert result.query == query
+
+
+@pytest.mark.parametrize("question, condition", [
+    ("How many repeat customers do I have?", "orders_count > 1"),
+    ("customers who placed more than 3 orders", "orders_count > 3"),
+    ("How many customers ordered at least twice?", "orders_count >= 2"),
+])
+def test_repeat_customer_threshold_comes_from_the_question(classifier, question, condition):
+    result = classifier.classify(question)
+    assert result.label == "repeat_customers"
+    assert classifier.confident(result)
+    assert result.query.endswith(f"WHERE {condition}")
+
+
+def test_repeat_threshold_default():
+    assert extract_repeat_threshold("returning customers") == (">", 1)
+    assert extract_repeat_threshold("customers with more than five orders") == (">", 5)
+
+
+def test_template_slots_are_not_qualifiers():
+    assert find_qualifiers("top_products", "top 10 products last 30 days") == []
+    assert find_qualifiers("low_stock", "stock levels under 5") == []
+    assert find_qualifiers("order_summary", "orders in the last 3 months") == []
+    assert find_qualifiers("order_summary", "orders in March") == ["in March"]
+    assert find_qualifiers("sales_trend", "daily sales for product X") == ["product", "x"]
+
+
+def test_reasoning_questions_go_to_the_llm(classifier):
+    result = classifier.classify("Why did sales drop compared to last month?")
+    assert not classifier.confident(result)
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+import main
+from app.services import admission as admission_module
+from app.services.admission import AdmissionController, Mode, request_deadline
+
+JOB = {
+    "id": "job-1",
+    "store_id": "a.myshopify.com",
+    "payload": {"question": "What sold best?", "context": {"access_token": "token"}},
+}
+
+
+class FakeAgent:
+    def __init__(self):
+        self.calls = []
+
+    async def process_question(self, question, mode=Mode.FULL):
+        self.calls.append((question, mode, request_deadline()))
+        return {"answer": "Hats", "confidence": "high", "data_points": 1}
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    agent = FakeAgent()
+
+    async def get_agent(**kwargs):
+        return agent
+
+    monkeypatch.setattr(main.agent_registry, "get_agent", get_agent)
+    return agent
+
+
+@pytest.fixture
+def admission(monkeypatch):
+    controller = AdmissionController(max_concurrency=1, store_max_queue=0)
+    monkeypatch.setattr(main, "admission", controller)
+    monkeypatch.setattr(main, "_retry_after", lambda e: 0.01)
+    return controller
+
+
+async def test_job_runs_through_admission_with_an_explicit_mode(agent, admission):
+    result = await main._run_job(JOB)
+
+    assert result["answer"] == "Hats"
+    # Jobs have no caller waiting on them, so bulk exports get their full timeout
+    assert agent.calls == [("What sold best?", Mode.FULL, None)]
+    assert admission.active == 0
+
+
+async def test_shed_job_waits_and_retries(agent, admission):
+    held = await admission.acquire("b.myshopify.com")
+    asyncio.get_running_loop().call_later(0.05, admission.release, held)
+
+    result = await main._run_job(JOB)
+
+    assert result["answer"] == "Hats"
+    assert len(agent.calls) == 1
+    assert admission.active == 0
+
+
+async def test_job_gets_the_degraded_mode(agent, admission, monkeypatch):
+    monkeypatch.setattr(admission_module, "ADMISSION_SKIP_EXPLANATION_DEPTH", 0)
+    await main._run_job(JOB)
+    assert agent.calls[0][1] == Mode.SKIP_EXPLANATION
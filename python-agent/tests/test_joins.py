@@ -0,0 +1,87 @@
+import pytest
+
+from app.services.joins import join_results, parse_multi_query, validate_query
+from app.services.shopifyql import ShopifyQLSyntaxError
+
+SALES_AND_CATALOGUE = (
+    "WITH sales AS (SELECT product_id, SUM(quantity) AS units FROM orders DURING last_month GROUP BY product_id), "
+    "catalogue AS (FROM products) "
+    "SELECT * FROM sales {how} JOIN catalogue ORDER BY units DESC LIMIT 10"
+)
+
+SALES = [
+    {"product_id": 1, "product_name": "Hat", "units": 5.0},
+    {"product_id": 2, "product_name": "Scarf", "units": 9.0},
+    # No longer in the catalogue
+    {"product_id": 3, "product_name": "Old mug", "units": 1.0},
+]
+
+CATALOGUE = [
+    {"id": 1, "title": "Hat", "variants": [{"id": 11, "inventory_item_id": 111, "sku": "HAT", "title": "Default"}]},
+    {"id": 2, "title": "Scarf", "variants": [{"id": 21, "inventory_item_id": 211, "sku": "SCARF", "title": "Default"}]},
+]
+
+
+def test_parses_steps_and_the_final_select():
+    multi = parse_multi_query(SALES_AND_CATALOGUE.format(how="LEFT"))
+    assert [(step.name, step.domain, step.how) for step in multi.steps] == [
+        ("sales", "orders", "inner"), ("catalogue", "products", "left")
+    ]
+    assert (multi.order_by, multi.descending, multi.limit) == ("units", True, 10)
+
+
+@pytest.mark.parametrize("query", [
+    "WITH a AS (FROM orders) SELECT * FROM a JOIN b",                             # undefined step
+    "WITH a AS (FROM orders), a AS (FROM products) SELECT * FROM a JOIN a",       # duplicate step
+    "WITH a AS (FROM orders), b AS (FROM products) SELECT name FROM a JOIN b",    # not SELECT *
+    "WITH a AS (FROM orders WHERE), b AS (FROM products) SELECT * FROM a JOIN b",  # invalid step
+])
+def test_invalid_multi_queries(query):
+    with pytest.raises(ShopifyQLSyntaxError):
+        validate_query(query)
+
+
+def test_inner_join_keeps_rows_present_on_both_sides():
+    multi = parse_multi_query(SALES_AND_CATALOGUE.format(how=""))
+    rows = join_results(multi, {"sales": SALES, "catalogue": CATALOGUE})
+
+    assert [(row["product_id"], row["sku"], row["units"]) for row in rows] == [(2, "SCARF", 9.0), (1, "HAT", 5.0)]
+
+
+def test_left_join_keeps_rows_with_a_missing_key():
+    multi = parse_multi_query(SALES_AND_CATALOGUE.format(how="LEFT"))
+    rows = join_results(multi, {"sales": SALES, "catalogue": CATALOGUE})
+
+    assert [row["product_id"] for row in rows] == [2, 1, 3]
+    assert rows[-1]["sku"] is None and rows[-1]["product_title"] is None
+
+
+def test_an_empty_step_empties_an_inner_join_only():
+    inner = parse_multi_query(SALES_AND_CATALOGUE.format(how=""))
+    left = parse_multi_query(SALES_AND_CATALOGUE.format(how="LEFT"))
+
+    assert join_results(inner, {"sales": SALES, "catalogue": []}) == []
+    assert [row["product_id"] for row in join_results(left, {"sales": SALES, "catalogue": []})] == [2, 1, 3]
+
+
+def test_line_items_reach_inventory_through_the_variant_bridge():
+    multi = parse_multi_query(
+        "WITH sales AS (FROM orders GROUP BY product_id), stock AS (FROM inventory WHERE quantity < 10) "
+        "SELECT * FROM sales JOIN stock ORDER BY total_quantity DESC"
+    )
+    assert multi.needs_bridge
+
+    sales = [{"product_id": 1, "total_quantity": 5.0}, {"product_id": 2, "total_quantity": 9.0}]
+    stock = [{"inventory_item_id": 111, "location_id": 9, "available": 3}]
+    rows = join_results(multi, {"sales": sales, "stock": stock}, bridge=CATALOGUE)
+
+    assert [(row["product_id"], row["inventory_item_id"], row["available"]) for row in rows] == [(1, 111, 3)]
+
+
+def test_steps_without_a_shared_key_cannot_be_joined():
+    multi = parse_multi_query(
+        "WITH a AS (SELECT day, COUNT(*) AS orders FROM orders GROUP BY day), b AS (FROM inventory) "
+        "SELECT * FROM a JOIN b"
+    )
+    with pytest.raises(ValueError, match="no shared key"):
+        join_results(multi, {"a": [{"day": "2024-03-01", "orders": 2}], "b": [{"inventory_item_id": 1, "available": 3}]})
@@ -0,0 +1,185 @@
+import asyncio
+import sqlite3
+import threading
+
+import httpx
+import pytest
+
+from app.agents.shopify_agent import ShopifyAnalyticsAgent
+from app.services import local_store as local_store_module
+from app.services.http_client import ShopifyClientPool
+from app.services.local_store import LocalStore, LocalStoreManager
+from app.services.rate_limiter import ShopifyRateLimiter
+from app.services.shopify_service import ShopifyService
+from app.services.shopifyql import plan_query
+from benchmarks.fake_shopify import FakeShopify
+from benchmarks.synthetic import StoreSize
+
+
+async def test_store_is_opened_off_the_event_loop_once(tmp_path, monkeypatch):
+    threads = []
+    setup = local_store_module.LocalStore._setup
+
+    def record_setup(self):
+        threads.append(threading.current_thread())
+        setup(self)
+
+    monkeypatch.setattr(local_store_module.LocalStore, "_setup", record_setup)
+    manager = LocalStoreManager(data_dir=str(tmp_path))
+
+    stores = await asyncio.gather(*(manager.get("shop.myshopify.com") for _ in range(5)))
+    assert len({id(store) for store in stores}) == 1
+    assert len(threads) == 1
+    assert threads[0] is not threading.main_thread()
+
+
+async def test_sync_state_round_trip(tmp_path):
+    store = await LocalStoreManager(data_dir=str(tmp_path)).get("shop.myshopify.com")
+    assert not await store.is_fresh("orders")
+    assert await store.high_water_mark("orders") is None
+
+    await store.mark_synced("orders", "2024-01-02T00:00:00Z")
+    await store.mark_synced("orders", None)
+    assert await store.is_fresh("orders")
+    assert await store.high_water_mark("orders") == "2024-01-02T00:00:00Z"
+
+
+@pytest.fixture
+def shopify():
+    return FakeShopify(size=StoreSize(orders=300, products=20, customers=50, days=30), latency=0, bucket_size=1000)
+
+
+def service_for(shopify, shop="shop.myshopify.com"):
+    return ShopifyService(
+        shop, "token", http_pool=ShopifyClientPool(transport=shopify.transport()), rate_limiter=ShopifyRateLimiter()
+    )
+
+
+async def test_sync_pages_inventory_by_location(tmp_path, shopify):
+    changed = []
+
+    async def on_change(store_id, domain):
+        changed.append(domain)
+
+    manager = LocalStoreManager(data_dir=str(tmp_path), on_change=on_change)
+    await manager.sync(service_for(shopify))
+
+    store = await manager.get("shop.myshopify.com")
+    synthetic = shopify.store("shop.myshopify.com")
+    levels = [row async for page in store.iter_pages("inventory_levels", {}) for row in page]
+    assert len(levels) == len(synthetic.inventory_levels)
+    assert shopify.requests["locations"] == 1
+    assert sorted(changed) == ["customers", "inventory", "orders", "products"]
+    for resource in ("orders", "products", "customers", "inventory_levels"):
+        assert await store.is_fresh(resource)
+
+
+async def test_failed_resource_does_not_stop_the_sync(tmp_path, shopify):
+    service = service_for(shopify)
+    iter_pages = service._iter_pages
+
+    def failing_products(endpoint, resource, params, max_rows=None):
+        if resource == "products":
+            raise httpx.HTTPError("products unavailable")
+        return iter_pages(endpoint, resource, params, max_rows)
+
+    service._iter_pages = failing_products
+    manager = LocalStoreManager(data_dir=str(tmp_path))
+    await manager.sync(service)
+
+    store = await manager.get("shop.myshopify.com")
+    assert not await store.is_fresh("products")
+    for resource in ("orders", "customers", "inventory_levels"):
+        assert await store.is_fresh(resource)
+
+
+# Timestamps already in the stored UTC form, so the row reads back unchanged
+ORDER = {
+    "id": 1, "name": "#1001", "created_at": "2024-03-01T10:00:00", "updated_at": "2024-03-01T10:00:00",
+    "processed_at": "2024-03-01T10:00:00", "cancelled_at": None, "financial_status": "paid",
+    "fulfillment_status": "unfulfilled", "currency": "USD", "total_price": 30.0, "subtotal_price": 30.0,
+    "total_discounts": 0.0, "customer": {"id": 7, "email": "a@example.com", "first_name": "Ann", "last_name": "Lee"},
+    "line_items": [
+        {"id": 11, "product_id": 3, "variant_id": 4, "name": "Hat - Red", "title": "Hat", "sku": "HAT-R",
+         "quantity": 2, "price": 10.0},
+        {"id": 12, "product_id": 5, "variant_id": 6, "name": "Scarf", "title": "Scarf", "sku": "SCARF",
+         "quantity": 1, "price": 10.0},
+    ],
+}
+
+
+@pytest.fixture
+async def store(tmp_path):
+    return await LocalStoreManager(data_dir=str(tmp_path)).get("shop.myshopify.com")
+
+
+async def test_orders_read_back_in_the_api_shape(store):
+    await store.upsert("orders", [ORDER])
+    rows = [row async for page in store.iter_pages("orders", {}) for row in page]
+    assert rows == [ORDER]
+
+    service = service_for(FakeShopify())
+    assert await service.query_orders("FROM orders WHERE fulfillment_status = 'unfulfilled'", source=store) == [ORDER]
+    assert await service.query_orders("FROM orders WHERE processed_at >= '2024-03-01'", source=store) == [ORDER]
+    by_sku = await service.query_orders("SELECT sku, SUM(quantity) AS units FROM orders GROUP BY sku ORDER BY sku", source=store)
+    assert by_sku == [{"sku": "HAT-R", "units": 2}, {"sku": "SCARF", "units": 1}]
+
+
+@pytest.mark.parametrize("query, covered", [
+    ("FROM orders WHERE fulfillment_status = 'unfulfilled'", True),
+    ("SELECT product_title, SUM(quantity) FROM orders GROUP BY product_title", True),
+    ("SELECT day, COUNT(*) FROM orders GROUP BY day", True),
+    ("FROM orders WHERE tags = 'vip'", False),
+    ("FROM orders WHERE status = 'open'", False),
+    ("FROM customers WHERE orders_count > 1", True),
+    ("FROM customers WHERE accepts_marketing = true", False),
+])
+def test_covers_only_stored_fields(query, covered):
+    assert LocalStore.covers(plan_query(query)) is covered
+
+
+async def test_fresh_store_falls_back_to_the_api_for_unstored_fields(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    manager = LocalStoreManager(data_dir=str(tmp_path))
+    agent = ShopifyAnalyticsAgent(
+        "shop.myshopify.com", "token", http_pool=ShopifyClientPool(), rate_limiter=ShopifyRateLimiter(),
+        local_stores=manager
+    )
+    store = await manager.get("shop.myshopify.com")
+    await store.upsert("orders", [ORDER])
+    await store.mark_synced("orders", ORDER["updated_at"])
+
+    sources = []
+
+    async def query_orders(query, source=None):
+        sources.append(source)
+        return []
+
+    monkeypatch.setattr(agent.shopify_service, "query_orders", query_orders)
+
+    await agent._run_query("FROM orders WHERE tags = 'vip'", "orders")
+    await agent._run_query("FROM orders WHERE fulfillment_status = 'unfulfilled'", "orders")
+    assert sources == [None, store]
+
+
+async def test_older_stores_gain_new_columns_and_resync(tmp_path):
+    path = tmp_path / "shop.myshopify.com.sqlite3"
+    with sqlite3.connect(path) as conn:
+        conn.executescript(
+            """
+            CREATE TABLE orders (id INTEGER PRIMARY KEY, name TEXT, created_at TEXT, updated_at TEXT,
+                                 financial_status TEXT, total_price REAL, customer_id INTEGER);
+            CREATE TABLE sync_state (resource TEXT PRIMARY KEY, high_water_mark TEXT, synced_at REAL);
+            INSERT INTO orders (id, name) VALUES (1, '#1001');
+            INSERT INTO sync_state VALUES ('orders', '2024-03-01T10:00:00Z', 1e12);
+            """
+        )
+    conn.close()
+
+    store = await LocalStoreManager(data_dir=str(tmp_path)).get("shop.myshopify.com")
+    assert not await store.is_fresh("orders")
+    assert await store.high_water_mark("orders") is None
+
+    await store.upsert("orders", [ORDER])
+    rows = [row async for page in store.iter_pages("orders", {}) for row in page]
+    assert rows == [ORDER]
@@ -0,0 +1,76 @@
+import json
+
+import httpx
+import openai
+import pytest
+from langchain_openai import ChatOpenAI
+
+from app.agents.planner import PLAN_ATTEMPTS, PLAN_FUNCTION, PlanningError, QueryPlanner
+
+VALID = {
+    "domain": "orders",
+    "metrics": ["count"],
+    "time_period": "last_7_days",
+    "filters": {},
+    "intent_summary": "orders last week",
+    "query": "```SELECT COUNT(*) AS orders FROM orders DURING last_7_days```",
+}
+
+
+class ScriptedLLM:
+    """Chat completions stand-in answering each call with the next analysis_plan arguments"""
+
+    def __init__(self, *arguments: str):
+        self.arguments = list(arguments)
+        self.requests = []
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        self.requests.append(body)
+        call = {"id": "call_1", "type": "function", "function": {"name": PLAN_FUNCTION, "arguments": self.arguments.pop(0)}}
+        return httpx.Response(200, json={
+            "id": "chatcmpl-1",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": None, "tool_calls": [call]},
+                "finish_reason": "tool_calls",
+            }],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        })
+
+    def planner(self) -> QueryPlanner:
+        client = openai.AsyncOpenAI(
+            api_key="test", base_url="http://llm/v1", max_retries=0,
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(self.handle))
+        )
+        return QueryPlanner(ChatOpenAI(model="test", api_key="test", async_client=client.chat.completions))
+
+
+async def test_intent_and_query_come_from_one_forced_call():
+    llm = ScriptedLLM(json.dumps(VALID))
+    plan = await llm.planner().plan("How many orders last week?")
+
+    assert len(llm.requests) == 1
+    assert llm.requests[0]["tool_choice"]["function"]["name"] == PLAN_FUNCTION
+    assert plan.query == "SELECT COUNT(*) AS orders FROM orders DURING last_7_days"
+    assert plan.intent == {k: v for k, v in VALID.items() if k != "query"}
+
+
+async def test_malformed_plan_is_retried_with_the_error():
+    llm = ScriptedLLM(json.dumps({**VALID, "query": "SELECT FROM WHERE"}), json.dumps(VALID))
+    plan = await llm.planner().plan("How many orders last week?")
+
+    assert len(llm.requests) == 2
+    retry_prompt = llm.requests[1]["messages"][-1]["content"]
+    assert "invalid ShopifyQL" in retry_prompt and "SELECT FROM WHERE" in retry_prompt
+    assert plan.domain == "orders"
+
+
+async def test_gives_up_after_the_retry():
+    llm = ScriptedLLM(*["not json"] * PLAN_ATTEMPTS)
+    with pytest.raises(PlanningError):
+        await llm.planner().plan("How many orders last week?")
+    assert len(llm.requests) == PLAN_ATTEMPTS
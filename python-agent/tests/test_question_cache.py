@@ -0,0 +1,55 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app.agents.question_cache import QuestionCache, normalize_question
+from app.services.cache_service import CacheService
+
+STORE = "a.myshopify.com"
+NOW = datetime(2024, 3, 20, 12, tzinfo=timezone.utc)
+PLAN = {"intent": {"domain": "orders"}, "query": "FROM orders DURING last_week GROUP BY product_id LIMIT 5"}
+
+
+def normalize(question: str) -> str:
+    return normalize_question(question, NOW)
+
+
+@pytest.fixture
+def questions():
+    return QuestionCache(CacheService())
+
+
+def test_normalization_keeps_what_changes_the_question():
+    assert normalize("How many orders did we get last week?") == normalize("orders last week")
+    assert normalize("orders last week") == "orders @2024-03-11..2024-03-17"
+    assert normalize("customers with more than 3 orders") != normalize("customers with 3 orders")
+
+
+async def test_near_duplicate_questions_reuse_the_plan(questions):
+    await questions.set_plan(normalize("What were my top 5 selling products last week?"), PLAN["intent"], PLAN["query"])
+
+    # Same normalised form, then a rewording found through the index
+    assert await questions.get_plan(normalize("what are the top 5 selling products last week")) == PLAN
+    assert await questions.get_plan(normalize("Last week, which 5 products were top selling?")) == PLAN
+
+
+@pytest.mark.parametrize("question", [
+    "What were my top 10 selling products last week?",  # another number
+    "What were my top 5 selling products this week?",   # another window
+    "Which customers spent the most last week?",        # another question
+])
+async def test_distinct_questions_miss(questions, question):
+    await questions.set_plan(normalize("What were my top 5 selling products last week?"), PLAN["intent"], PLAN["query"])
+    assert await questions.get_plan(normalize(question)) is None
+
+
+async def test_answers_go_stale_when_a_domain_they_read_changes(questions):
+    normalized = normalize("orders last week")
+    await questions.set_answer(STORE, normalized, ["orders"], {"answer": "12 orders"})
+    assert await questions.get_answer(STORE, normalized) == {"answer": "12 orders"}
+
+    await questions.cache.invalidate(STORE, "products")
+    assert await questions.get_answer(STORE, normalized) == {"answer": "12 orders"}
+
+    await questions.cache.invalidate(STORE, "orders")
+    assert await questions.get_answer(STORE, normalized) is None
@@ -0,0 +1,58 @@
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import httpx
+import pytest
+
+from app.services.http_client import ShopifyClientPool
+from app.services.rate_limiter import ShopifyRateLimiter, ShopifyRateLimitError, StoreBucket, parse_retry_after
+from app.services.shopify_service import ShopifyService
+
+
+def http_date(seconds_from_now: float) -> str:
+    return format_datetime(datetime.now(timezone.utc) + timedelta(seconds=seconds_from_now), usegmt=True)
+
+
+@pytest.mark.parametrize("value, expected", [("2", 2.0), ("1.5", 1.5), ("-4", 0.0), ("0", 0.0)])
+def test_delay_seconds(value, expected):
+    assert parse_retry_after(value) == expected
+
+
+def test_http_date():
+    assert 25 <= parse_retry_after(http_date(30)) <= 30
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+
+@pytest.mark.parametrize("value", [None, "", "soon", "inf", "nan", "Someday, 99 Foo 2024"])
+def test_unparseable_values_are_ignored(value):
+    assert parse_retry_after(value) is None
+
+
+def test_observe_handles_an_http_date():
+    bucket = StoreBucket("test.myshopify.com")
+    bucket.observe({"X-Shopify-Shop-Api-Call-Limit": "39/40", "Retry-After": http_date(10)})
+    assert 5 < bucket.blocked_until - time.monotonic() <= 10
+
+    # Garbage leaves the bucket alone instead of raising from the request path
+    bucket = StoreBucket("test.myshopify.com")
+    bucket.observe({"Retry-After": "later"})
+    assert bucket.blocked_until <= time.monotonic()
+
+
+async def test_throttled_request_with_an_http_date_raises_rate_limit_error(monkeypatch):
+    monkeypatch.setattr("app.services.shopify_service.MAX_REQUEST_ATTEMPTS", 1)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(429, headers={"Retry-After": http_date(0)}, json={"errors": "Exceeded"})
+
+    pool = ShopifyClientPool(transport=httpx.MockTransport(handler))
+    limiter = ShopifyRateLimiter()
+    service = ShopifyService("test.myshopify.com", "token", http_pool=pool, rate_limiter=limiter)
+
+    with pytest.raises(ShopifyRateLimitError) as error:
+        await service._make_request("orders", {})
+    assert error.value.retry_after == 0.0
+    # The shared limiter saw the throttle too
+    assert limiter.bucket("test.myshopify.com").level == limiter.bucket("test.myshopify.com").capacity
+    await pool.aclose()
@@ -0,0 +1,27 @@
+from app.services.records import compact_rows, flatten_row
+
+
+def test_flatten_row():
+    row = {
+        "id": 1,
+        "customer": {"id": 7, "email": "a@example.com", "addresses": [{"city": "Oslo"}]},
+        "line_items": [{"id": 11}, {"id": 12}],
+        "total_price": 30.0,
+    }
+    assert flatten_row(row) == {
+        "id": 1,
+        "customer.id": 7,
+        "customer.email": "a@example.com",
+        "line_items_count": 2,
+        "total_price": 30.0,
+    }
+
+
+def test_compact_rows_trims_nested_objects_and_types_money():
+    rows = compact_rows("orders", [{
+        "id": 1,
+        "total_price": "30.00",
+        "billing_address": {"city": "Oslo"},
+        "line_items": [{"id": 11, "price": "10.00", "tax_lines": []}],
+    }])
+    assert rows == [{"id": 1, "total_price": 30.0, "line_items": [{"id": 11, "price": 10.0}]}]
@@ -0,0 +1,28 @@
+import pytest
+
+from app.agents.registry import AgentRegistry
+from app.services.http_client import ShopifyClientPool
+from app.services.rate_limiter import ShopifyRateLimiter
+from app.services.shopify_service import ShopifyService
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    return AgentRegistry(http_pool=ShopifyClientPool(), rate_limiter=ShopifyRateLimiter())
+
+
+async def test_agents_share_the_app_pool_and_limiter(registry):
+    first = await registry.get_agent("a.myshopify.com", "token")
+    second = await registry.get_agent("b.myshopify.com", "token")
+    rebuilt = await registry.get_agent("a.myshopify.com", "rotated")
+
+    for agent in (first, second, rebuilt):
+        assert agent.shopify_service.http_pool is registry.http_pool
+        assert agent.shopify_service.rate_limiter is registry.rate_limiter
+    await registry.aclose()
+
+
+def test_service_requires_the_shared_pool_and_limiter():
+    with pytest.raises(TypeError):
+        ShopifyService("a.myshopify.com", "token")
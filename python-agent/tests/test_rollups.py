@@ -0,0 +1,90 @@
+import pytest
+
+from app.services.aggregation import aggregate_pages
+from app.services.local_store import LocalStore
+from app.services.shopifyql import plan_query
+
+CUSTOMERS = [
+    {"id": 1, "orders_count": 1, "total_spent": "10.00", "updated_at": "2024-01-01T00:00:00Z"},
+    {"id": 2, "orders_count": 3, "total_spent": "90.00", "updated_at": "2024-01-01T00:00:00Z"},
+    {"id": 3, "orders_count": 3, "total_spent": "60.00", "updated_at": "2024-01-01T00:00:00Z"},
+    {"id": 4, "orders_count": 5, "total_spent": "250.00", "updated_at": "2024-01-01T00:00:00Z"},
+]
+
+
+def order(order_id, created_at, total, items):
+    return {
+        "id": order_id,
+        "created_at": created_at,
+        "updated_at": created_at,
+        "total_price": total,
+        "line_items": [
+            {"id": order_id * 10 + i, "product_id": product, "name": f"Product {product}", "quantity": qty, "price": price}
+            for i, (product, qty, price) in enumerate(items)
+        ],
+    }
+
+
+@pytest.fixture
+async def store(tmp_path):
+    store = LocalStore("test.myshopify.com", data_dir=str(tmp_path))
+    await store.open()
+    return store
+
+
+async def from_raw(store, query, resource):
+    plan = plan_query(query)
+    predicate = plan.matches_all if plan.query.where is not None else None
+    return await aggregate_pages(store.iter_pages(resource, plan.api_params()), plan, predicate)
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT SUM(orders_count) AS orders FROM customers",
+    "SELECT AVG(orders_count) AS average_orders FROM customers",
+    "SELECT SUM(orders_count) AS orders FROM customers WHERE orders_count > 1",
+])
+async def test_aggregates_over_bucket_keys_fall_back_to_raw_rows(store, query):
+    await store.upsert("customers", CUSTOMERS)
+    assert await store.query_rollups(plan_query(query)) is None
+
+
+@pytest.mark.parametrize("query", [
+    "SELECT COUNT(*) AS customers FROM customers WHERE orders_count > 1",
+    "SELECT orders_count, COUNT(*) AS customers, SUM(total_spent) AS spent FROM customers GROUP BY orders_count ORDER BY orders_count",
+    "SELECT AVG(total_spent) AS average_spent FROM customers",
+])
+async def test_customer_rollup_matches_raw_rows(store, query):
+    await store.upsert("customers", CUSTOMERS)
+    from_rollup = await store.query_rollups(plan_query(query))
+    assert from_rollup is not None
+    assert from_rollup == await from_raw(store, query, "customers")
+
+
+async def test_customer_update_moves_between_buckets(store):
+    await store.upsert("customers", CUSTOMERS)
+    await store.upsert("customers", [{**CUSTOMERS[0], "orders_count": 3, "total_spent": "40.00"}])
+
+    query = "SELECT orders_count, COUNT(*) AS customers, SUM(total_spent) AS spent FROM customers GROUP BY orders_count ORDER BY orders_count"
+    assert await store.query_rollups(plan_query(query)) == [
+        {"orders_count": 3, "customers": 3, "spent": 190.0},
+        {"orders_count": 5, "customers": 1, "spent": 250.0},
+    ]
+
+
+async def test_edited_order_is_retracted_before_reapplying(store):
+    await store.upsert("orders", [
+        order(1, "2024-03-01T10:00:00Z", "30.00", [(100, 1, 10.0), (200, 2, 10.0)]),
+        order(2, "2024-03-02T10:00:00Z", "15.00", [(100, 3, 5.0)]),
+    ])
+    # Order 1 edited: product 200 removed, moved to the next day
+    await store.upsert("orders", [order(1, "2024-03-02T09:00:00Z", "10.00", [(100, 1, 10.0)])])
+
+    query = "SELECT day, COUNT(*) AS orders, SUM(total_price) AS sales FROM orders SINCE 2024-03-01 UNTIL 2024-03-03 GROUP BY day ORDER BY day"
+    from_rollup = await store.query_rollups(plan_query(query))
+    assert from_rollup == await from_raw(store, query, "orders")
+    assert [row["orders"] for row in from_rollup] == [2]
+
+    query = "SELECT product_id, SUM(quantity) AS units FROM orders SINCE 2024-03-01 UNTIL 2024-03-03 GROUP BY product_id"
+    from_rollup = await store.query_rollups(plan_query(query))
+    assert from_rollup == await from_raw(store, query, "orders")
+    assert [(row["product_id"], row["units"]) for row in from_rollup] == [(100, 4)]
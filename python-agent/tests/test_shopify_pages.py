@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from app.services.http_client import ShopifyClientPool
+from app.services.rate_limiter import ShopifyRateLimiter
+from app.services.shopify_service import ShopifyService
+
+# 70 days: split into several concurrently fetched windows
+PARAMS = {"created_at_min": "2024-01-01T00:00:00+00:00", "created_at_max": "2024-03-11T00:00:00+00:00"}
+
+
+@pytest.fixture
+def service():
+    return ShopifyService("test.myshopify.com", "token", http_pool=ShopifyClientPool(), rate_limiter=ShopifyRateLimiter())
+
+
+def paginate_with(pages_per_window: int, fail_window: int = -1):
+    started = []
+
+    async def paginate(endpoint, resource, params, max_rows=None):
+        index = len(started)
+        started.append(params["created_at_min"])
+        for number in range(pages_per_window):
+            if index == fail_window and number == 2:
+                raise RuntimeError(f"window {index} failed")
+            yield [{"id": index * 1000 + number}]
+            await asyncio.sleep(0)
+
+    return paginate, started
+
+
+async def test_windows_are_fetched_concurrently(service):
+    service._paginate, started = paginate_with(pages_per_window=3)
+    pages = [page async for page in service._iter_pages("orders", "orders", dict(PARAMS))]
+    assert len(started) > 1
+    assert len(pages) == 3 * len(started)
+
+
+async def test_early_close_with_full_queue_does_not_hang(service):
+    service._paginate, started = paginate_with(pages_per_window=100)
+    pages = service._iter_pages("orders", "orders", dict(PARAMS))
+
+    assert await pages.__anext__()
+    # Let every producer fill the bounded queue and block on put
+    for _ in range(20):
+        await asyncio.sleep(0)
+    await asyncio.wait_for(pages.aclose(), timeout=1)
+
+
+async def test_failed_window_raises_without_hanging(service):
+    service._paginate, started = paginate_with(pages_per_window=100, fail_window=1)
+
+    async def consume():
+        return [page async for page in service._iter_pages("orders", "orders", dict(PARAMS))]
+
+    with pytest.raises(RuntimeError, match="window 1 failed"):
+        await asyncio.wait_for(consume(), timeout=1)
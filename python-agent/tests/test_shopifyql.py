@@ -0,0 +1,184 @@
+import dataclasses
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from app.services.shopifyql import (
+    BoolOp,
+    Column,
+    Comparison,
+    FuncCall,
+    ShopifyQLSyntaxError,
+    parse,
+    plan_query,
+    utc_iso,
+)
+
+
+def test_parses_select_where_group_order_limit():
+    query = parse(
+        "SELECT product_id, SUM(quantity) AS units FROM orders "
+        "WHERE financial_status = 'paid' AND total_price > 10 GROUP BY product_id ORDER BY units DESC LIMIT 5"
+    )
+    assert query.table == "orders"
+    assert [item.alias for item in query.select] == [None, "units"]
+    assert isinstance(query.where, BoolOp) and len(query.where.conditions) == 2
+    assert query.order_by[0].descending
+    assert query.limit == 5
+
+
+def test_show_by_is_group_by():
+    query = parse("SHOW total_sales BY product_title FROM orders SINCE -30d")
+    assert [column.name for column in query.group_by] == ["product_title"]
+    assert query.since is not None
+
+
+@pytest.mark.parametrize("query", [
+    "DROP TABLE orders",
+    "SELECT * FROM orders WHERE",
+    "SELECT * WHERE id = 1",
+    "SELECT * FROM nowhere",
+])
+def test_rejects_invalid_queries(query):
+    with pytest.raises(ShopifyQLSyntaxError):
+        plan_query(query)
+
+
+def test_pushes_supported_filters_and_keeps_the_rest_local():
+    plan = plan_query("SELECT * FROM orders WHERE financial_status = 'paid' AND total_price > 100")
+    assert [name for name, _ in plan.pushed] == ["financial_status"]
+    assert plan.residual is not None
+    assert plan.api_params()["financial_status"] == "paid"
+    assert plan.matches({"total_price": "150.00"})
+    assert not plan.matches({"total_price": "50.00"})
+
+
+def test_having_is_parsed_as_a_group_filter():
+    query = parse("SELECT day, COUNT(*) AS orders FROM orders GROUP BY day HAVING COUNT(*) > 5 AND orders < 100")
+    assert isinstance(query.having, BoolOp)
+    first = query.having.conditions[0]
+    assert isinstance(first, Comparison) and isinstance(first.left, FuncCall)
+    assert query.where is None
+
+
+def test_having_makes_an_aggregate_plan_and_is_not_pushed():
+    plan = plan_query("SELECT COUNT(*) AS n FROM orders HAVING n > 1")
+    assert plan.aggregates
+    assert not plan.pushed and plan.residual is None
+
+
+def test_having_aggregate_columns_are_fetched():
+    plan = plan_query("SELECT product_id FROM orders GROUP BY product_id HAVING SUM(quantity) > 10")
+    assert "line_items" in plan.fields
+
+
+def test_cached_plans_are_immutable():
+    plan = plan_query("SELECT * FROM orders WHERE financial_status = 'paid' LIMIT 5")
+    assert plan_query("select *   from orders where financial_status = 'paid' limit 5") is plan
+
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        plan.fields = ("id",)
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        plan.query.limit = 500
+    with pytest.raises(AttributeError):
+        plan.pushed.append(("status", None))
+    assert plan_query("SELECT * FROM orders WHERE financial_status = 'paid' LIMIT 5").limit == 5
+
+
+def test_ast_equality_ignores_sequence_type():
+    assert FuncCall("sum", [Column("quantity")]) == parse("SELECT SUM(quantity) FROM orders").select[0].expr
+
+
+@pytest.fixture
+def new_york(monkeypatch):
+    """Run with a non-UTC local timezone"""
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_api_params_are_utc_whatever_the_local_timezone(new_york):
+    plan = plan_query("FROM orders WHERE created_at >= '2024-03-01T00:00:00-05:00' AND updated_at < '2024-03-02'")
+    params = plan.api_params()
+    assert params["created_at_min"] == "2024-03-01T05:00:00+00:00"
+    assert params["updated_at_max"] == "2024-03-02T00:00:00+00:00"
+
+
+def test_relative_ranges_resolve_against_utc_now(new_york):
+    params = plan_query("FROM orders DURING yesterday").api_params(now=datetime(2024, 3, 10, 2, 0))
+    assert params["created_at_min"] == "2024-03-09T00:00:00+00:00"
+    assert params["created_at_max"] == "2024-03-09T23:59:59+00:00"
+
+    since = plan_query("FROM orders SINCE -1d").api_params()["created_at_min"]
+    expected = datetime.now(timezone.utc) - timedelta(days=1)
+    assert abs((datetime.fromisoformat(since) - expected).total_seconds()) < 5
+
+
+def test_row_timestamps_with_offsets_compare_in_utc(new_york):
+    plan = plan_query("FROM orders WHERE processed_at > '2024-03-01T12:00:00Z'")
+    assert plan.matches_all({"processed_at": "2024-03-01T08:30:00-04:00"})
+    assert not plan.matches_all({"processed_at": "2024-03-01T07:30:00-04:00"})
+
+
+@pytest.mark.parametrize("query", [
+    "FROM inventory WHERE quantity < 10 SINCE -30d",
+    "FROM inventory_levels UNTIL today",
+    "SELECT SUM(quantity) FROM inventory DURING last_week",
+])
+def test_date_ranges_on_inventory_are_rejected(query):
+    with pytest.raises(ShopifyQLSyntaxError, match="updated_at"):
+        plan_query(query)
+
+
+def test_inventory_can_filter_on_updated_at():
+    plan = plan_query("FROM inventory WHERE updated_at >= '2024-03-01' AND quantity < 10")
+    assert plan.api_params()["updated_at_min"] == "2024-03-01T00:00:00+00:00"
+
+
+@pytest.mark.parametrize("table", ["orders", "customers", "products"])
+def test_date_ranges_bound_created_at(table):
+    params = plan_query(f"FROM {table} SINCE 2024-01-01 UNTIL 2024-01-31").api_params()
+    assert params["created_at_min"] == "2024-01-01T00:00:00+00:00"
+    assert params["created_at_max"] == "2024-01-31T00:00:00+00:00"
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2024-03-01T05:00:00-05:00", "2024-03-01T10:00:00"),
+    ("2024-03-01T10:00:00Z", "2024-03-01T10:00:00"),
+    ("2024-03-01T10:00:00", "2024-03-01T10:00:00"),
+    (date(2024, 3, 1), "2024-03-01T00:00:00"),
+    (datetime(2024, 3, 1, 12, tzinfo=timezone(timedelta(hours=2))), "2024-03-01T10:00:00"),
+    ("pending", "pending"),
+    (None, None),
+])
+def test_utc_iso(value, expected):
+    assert utc_iso(value) == expected
+
+
+NOW = datetime(2024, 3, 20, 12)
+
+
+def test_during_intersects_with_a_where_bound():
+    params = plan_query("FROM orders WHERE created_at >= '2024-03-10' DURING last_30_days").api_params(NOW)
+    assert params["created_at_min"] == "2024-03-10T00:00:00+00:00"
+    assert params["created_at_max"] == plan_query("FROM orders DURING last_30_days").api_params(NOW)["created_at_max"]
+
+    # DURING narrower than WHERE keeps the DURING bound
+    params = plan_query("FROM orders WHERE created_at >= '2024-01-01' DURING last_7_days").api_params(NOW)
+    assert params["created_at_min"] == "2024-03-13T12:00:00+00:00"
+
+
+def test_since_and_until_intersect_with_where_bounds():
+    params = plan_query("FROM orders WHERE created_at >= '2024-03-01' SINCE -7d").api_params(NOW)
+    assert params["created_at_min"] == "2024-03-13T12:00:00+00:00"
+
+    params = plan_query("FROM orders WHERE created_at <= '2024-03-01' UNTIL '2024-03-05'").api_params(NOW)
+    assert params["created_at_max"] == "2024-03-01T00:00:00+00:00"
+
+
+def test_offset_is_rejected():
+    with pytest.raises(ShopifyQLSyntaxError, match="OFFSET"):
+        parse("FROM orders LIMIT 10 OFFSET 20")
@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+
+from app.services.singleflight import MISSING, DistributedSingleFlight, SingleFlight
+
+
+class SlowCall:
+    """A call that blocks until released, counting how often it ran"""
+
+    def __init__(self, value="rows"):
+        self.value = value
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        if isinstance(self.value, Exception):
+            raise self.value
+        return self.value
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight("test")
+    call = SlowCall()
+
+    tasks = [asyncio.create_task(flight.do("orders", call)) for _ in range(5)]
+    await settle()
+    call.release.set()
+
+    assert await asyncio.gather(*tasks) == ["rows"] * 5
+    assert call.calls == 1
+    assert flight.counters == {"leaders": 1, "coalesced": 4}
+    assert len(flight) == 0
+
+
+async def test_different_keys_run_separately():
+    flight = SingleFlight("test")
+    call = SlowCall()
+    call.release.set()
+
+    await asyncio.gather(flight.do("orders", call), flight.do("products", call))
+    assert call.calls == 2
+
+
+async def test_errors_reach_every_caller_and_are_not_kept():
+    flight = SingleFlight("test")
+    call = SlowCall(ValueError("shopify down"))
+
+    tasks = [asyncio.create_task(flight.do("orders", call)) for _ in range(3)]
+    await settle()
+    call.release.set()
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+    assert call.calls == 1
+
+    # The next call runs again rather than replaying the error
+    call.value = "rows"
+    assert await flight.do("orders", call) == "rows"
+    assert call.calls == 2
+
+
+async def test_a_follower_takes_over_from_a_cancelled_leader():
+    flight = SingleFlight("test")
+    call = SlowCall()
+
+    leader = asyncio.create_task(flight.do("orders", call))
+    await settle()
+    follower = asyncio.create_task(flight.do("orders", call))
+    await settle()
+
+    leader.cancel()
+    await settle()
+    call.release.set()
+
+    assert await follower == "rows"
+    assert call.calls == 2
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+
+
+class LockedRedis:
+    """The Redis calls DistributedSingleFlight makes, with the lock held by another worker"""
+
+    def __init__(self):
+        self.keys = {}
+
+    async def set(self, key, value, nx=False, px=None):
+        if nx and key in self.keys:
+            return None
+        self.keys[key] = value
+        return True
+
+    async def exists(self, key):
+        return int(key in self.keys)
+
+    async def eval(self, script, numkeys, key, token):
+        if self.keys.get(key) == token:
+            del self.keys[key]
+
+
+async def test_other_workers_wait_for_the_lock_holders_result():
+    client = LockedRedis()
+    client.keys["lock:answer:q"] = "other-worker"
+    flight = DistributedSingleFlight("test", lambda: client, lock_ttl=1, poll_interval=0.01)
+    published = {}
+
+    def loader(key):
+        async def load():
+            return published.get(key, MISSING)
+        return load
+
+    async def compute():
+        return "computed here"
+
+    asyncio.get_running_loop().call_later(0.03, published.update, {"answer:q": "from the other worker"})
+    assert await flight.do("answer:q", compute, load=loader("answer:q")) == "from the other worker"
+
+    # When the holder's lock goes away without a result, this worker computes
+    client.keys["lock:answer:r"] = "other-worker"
+    asyncio.get_running_loop().call_later(0.03, client.keys.pop, "lock:answer:r")
+    assert await flight.do("answer:r", compute, load=loader("answer:r")) == "computed here"
+
+    # Without a lock holder the leader locks, computes and unlocks
+    assert await flight.do("answer:s", compute, load=loader("answer:s")) == "computed here"
+    assert list(client.keys) == ["lock:answer:q"]
+    assert flight.counters["lock_waits"] == 2
@@ -0,0 +1,125 @@
+import base64
+import hashlib
+import hmac
+import json
+
+import httpx
+import pytest
+
+import main
+from app.services.cache_service import CacheService
+from app.services.local_store import LocalStoreManager
+from app.services.webhooks import WebhookProcessor, verify_webhook
+
+SECRET = "shpss_test"
+SHOP = "shop.myshopify.com"
+
+ORDER = {
+    "id": 450789469,
+    "name": "#1001",
+    "created_at": "2024-03-01T10:00:00-05:00",
+    "updated_at": "2024-03-01T10:05:00-05:00",
+    "financial_status": "paid",
+    "total_price": "30.00",
+    "line_items": [{"id": 1, "product_id": 7, "quantity": 2, "price": "15.00"}],
+}
+
+
+def sign(body: bytes, secret: str = SECRET) -> str:
+    return base64.b64encode(hmac.new(secret.encode(), body, hashlib.sha256).digest()).decode()
+
+
+def test_verify_accepts_the_shopify_signature():
+    body = json.dumps(ORDER).encode()
+    assert verify_webhook(body, sign(body), SECRET)
+    # Header values may arrive with surrounding whitespace
+    assert verify_webhook(body, f" {sign(body)}\n", SECRET)
+
+
+@pytest.mark.parametrize("body, signature, secret", [
+    (b'{"id": 2}', sign(b'{"id": 1}'), SECRET),     # tampered body
+    (b'{"id": 1}', sign(b'{"id": 1}', "other"), SECRET),  # signed with another app's secret
+    (b'{"id": 1}', None, SECRET),                   # no header
+    (b'{"id": 1}', "not base64 at all", SECRET),
+    (b'{"id": 1}', sign(b'{"id": 1}', ""), ""),     # webhooks not configured
+])
+def test_verify_rejects(body, signature, secret):
+    assert not verify_webhook(body, signature, secret)
+
+
+@pytest.fixture
+def cache():
+    return CacheService()
+
+
+@pytest.fixture
+def processor(cache, tmp_path):
+    return WebhookProcessor(cache, LocalStoreManager(data_dir=str(tmp_path)))
+
+
+def generation(cache: CacheService, domain: str) -> int:
+    return cache._generations.get(f"ns:{SHOP}:{domain}", (0, 0))[1]
+
+
+async def test_applies_the_change_and_bumps_only_its_domain(processor, cache):
+    result = await processor.handle(SHOP, "orders/create", ORDER, webhook_id="w-1")
+
+    assert result == {"status": "applied", "topic": "orders/create", "domain": "orders", "rows": 1}
+    assert generation(cache, "orders") == 1
+    assert generation(cache, "products") == 0
+
+    store = await processor.local_stores.get(SHOP)
+    rows = [row async for page in store.iter_pages("orders", {}) for row in page]
+    assert [(row["id"], row["total_price"]) for row in rows] == [(450789469, 30.0)]
+    # Webhook-backed stores get the long result TTL
+    assert cache._coverage[SHOP][1] > 0
+
+
+async def test_redelivery_is_a_no_op(processor, cache):
+    await processor.handle(SHOP, "orders/updated", ORDER, webhook_id="w-1")
+    again = await processor.handle(SHOP, "orders/updated", ORDER, webhook_id="w-1")
+
+    assert again["status"] == "duplicate"
+    assert generation(cache, "orders") == 1
+
+    # A different delivery of the same topic is applied
+    assert (await processor.handle(SHOP, "orders/updated", ORDER, webhook_id="w-2"))["status"] == "applied"
+    assert generation(cache, "orders") == 2
+
+
+async def test_failed_delivery_can_be_retried(cache, tmp_path):
+    class FlakyStores(LocalStoreManager):
+        failures = 1
+
+        async def get(self, store_id):
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("disk full")
+            return await super().get(store_id)
+
+    processor = WebhookProcessor(cache, FlakyStores(data_dir=str(tmp_path)))
+    with pytest.raises(RuntimeError):
+        await processor.handle(SHOP, "orders/create", ORDER, webhook_id="w-1")
+    assert generation(cache, "orders") == 0
+
+    # Shopify's retry of the same webhook id goes through
+    assert (await processor.handle(SHOP, "orders/create", ORDER, webhook_id="w-1"))["status"] == "applied"
+
+
+async def test_unsubscribed_topics_are_ignored(processor, cache):
+    result = await processor.handle(SHOP, "app/uninstalled", {}, webhook_id="w-1")
+    assert result["status"] == "ignored"
+    assert not cache._generations
+
+
+async def test_endpoint_rejects_a_bad_signature(monkeypatch):
+    monkeypatch.setattr(main, "SHOPIFY_WEBHOOK_SECRET", SECRET)
+    body = json.dumps(ORDER).encode()
+    headers = {
+        "X-Shopify-Hmac-Sha256": sign(body, "other"),
+        "X-Shopify-Shop-Domain": SHOP,
+        "X-Shopify-Topic": "orders/create",
+    }
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+        response = await client.post("/webhooks/shopify", content=body, headers=headers)
+    assert response.status_code == 401
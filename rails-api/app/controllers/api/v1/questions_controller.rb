@@ -5,7 +5,19 @@ module Api
       before_action :set_question, only: [:show]
 
       # POST /api/v1/questions
+      # With async=true the question is queued and returned as pending; poll
+      # GET /api/v1/questions/:id for the answer.
       def create
+        if ActiveModel::Type::Boolean.new.cast(params[:async])
+          question = Question.create!(
+            store_id: question_params[:store_id],
+            question_text: question_params[:question],
+            status: 'pending'
+          )
+          ProcessQuestionJob.perform_later(question.id)
+          return render json: QuestionSerializer.new(question).serializable_hash, status: :accepted
+        end
+
         question = Question.create!(
           store_id: question_params[:store_id],
           question_text: question_params[:question],
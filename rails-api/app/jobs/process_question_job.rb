@@ -0,0 +1,43 @@
+class ProcessQuestionJob < ApplicationJob
+  queue_as :default
+
+  POLL_INTERVAL = 2.seconds
+  MAX_POLLS = 450 # ~15 minutes
+
+  # Submits the question to the Python agent's job API, then re-enqueues itself
+  # to poll for the result instead of blocking a worker thread while it runs.
+  def perform(question_id, agent_job_id = nil, polls = 0)
+    question = Question.find(question_id)
+
+    if agent_job_id.nil?
+      agent_job_id = PythonAgentService.new(question).submit
+      question.update!(status: 'processing')
+      return self.class.set(wait: POLL_INTERVAL).perform_later(question_id, agent_job_id, 0)
+    end
+
+    job = PythonAgentService.job_status(agent_job_id)
+
+    case job[:status]
+    when 'completed'
+      result = job[:result]
+      question.update!(
+        answer: result[:answer],
+        confidence: result[:confidence],
+        query_used: result[:query_used],
+        data_points: result[:data_points],
+        status: 'completed',
+        processing_time_ms: ((job[:finished_at] - job[:created_at]) * 1000).to_i
+      )
+    when 'failed'
+      question.update!(status: 'failed', error_message: job.dig(:error, :detail))
+    else
+      if polls >= MAX_POLLS
+        question.update!(status: 'failed', error_message: 'Python agent timeout - question too complex')
+      else
+        self.class.set(wait: POLL_INTERVAL).perform_later(question_id, agent_job_id, polls + 1)
+      end
+    end
+  rescue StandardError => e
+    question&.update(status: 'failed', error_message: e.message)
+  end
+end
@@ -1,5 +1,6 @@
 class PythonAgentService
   AGENT_URL = ENV.fetch('PYTHON_AGENT_URL', 'http://localhost:8000')
+  # Idle timeout: the streaming endpoint sends an event or heartbeat well within this
   TIMEOUT = 30 # seconds
 
   def initialize(question)
@@ -7,17 +8,40 @@ class PythonAgentService
     @store = question.store
   end
 
-  def process
+  # Streams /api/analyze/stream so long questions are not cut off by a total
+  # request timeout. Stage events (intent, query, data, token) are yielded to
+  # an optional block as they arrive; the final answer is returned.
+  def process(&on_event)
     start_time = Time.current
+    result = nil
+    error = nil
+    parser = SseParser.new
 
-    response = connection.post('/api/analyze') do |req|
+    response = connection.post('/api/analyze/stream') do |req|
       req.headers['Content-Type'] = 'application/json'
+      req.headers['Accept'] = 'text/event-stream'
+      # Lets the agent shed the request up front if it cannot be answered in time
+      req.headers['X-Request-Timeout'] = TIMEOUT.to_s
       req.body = request_payload.to_json
       req.options.timeout = TIMEOUT
+      req.options.on_data = proc do |chunk, _received_bytes, _env|
+        parser.feed(chunk) do |event, data|
+          case event
+          when 'answer' then result = data
+          when 'error' then error = data
+          else on_event&.call(event, data)
+          end
+        end
+      end
+    end
+
+    raise StandardError, "Python agent error: #{error[:detail]}" if error
+    unless result
+      raise StandardError, "Python agent error: HTTP #{response.status}" unless response.success?
+
+      raise StandardError, 'Python agent stream ended without an answer'
     end
 
-    result = JSON.parse(response.body, symbolize_names: true)
-    
     {
       answer: result[:answer],
       confidence: result[:confidence],
@@ -32,6 +56,55 @@ class PythonAgentService
     raise StandardError, 'Failed to process question with AI agent'
   end
 
+  # Queues the question on the agent's job API and returns the job id
+  def submit(priority: 'normal')
+    response = connection.post('/api/jobs') do |req|
+      req.headers['Content-Type'] = 'application/json'
+      req.body = request_payload.merge(priority: priority).to_json
+      req.options.timeout = TIMEOUT
+    end
+    raise StandardError, "Python agent error: HTTP #{response.status}" unless response.status == 202
+
+    JSON.parse(response.body, symbolize_names: true)[:job_id]
+  rescue Faraday::Error => e
+    Rails.logger.error("Python agent error: #{e.message}")
+    raise StandardError, 'Failed to queue question with AI agent'
+  end
+
+  # Status of a queued job; :result / :error are set once it has finished
+  def self.job_status(job_id)
+    response = Faraday.get("#{AGENT_URL}/api/jobs/#{job_id}") { |req| req.options.timeout = TIMEOUT }
+    return { status: 'failed', error: { detail: 'Job not found or expired' } } if response.status == 404
+    raise StandardError, "Python agent error: HTTP #{response.status}" unless response.success?
+
+    JSON.parse(response.body, symbolize_names: true)
+  end
+
+  # Minimal Server-Sent Events parser for chunked responses
+  class SseParser
+    def initialize
+      @buffer = +''
+    end
+
+    def feed(chunk)
+      @buffer << chunk
+      while (index = @buffer.index("\n\n"))
+        block = @buffer.slice!(0, index + 2)
+        event = 'message'
+        data = []
+        block.each_line(chomp: true) do |line|
+          next if line.empty? || line.start_with?(':') # heartbeat comments
+
+          field, value = line.split(':', 2)
+          value = value.to_s.delete_prefix(' ')
+          event = value if field == 'event'
+          data << value if field == 'data'
+        end
+        yield event, JSON.parse(data.join("\n"), symbolize_names: true) unless data.empty?
+      end
+    end
+  end
+
   private
 
   def request_payload
@@ -52,9 +125,9 @@ class PythonAgentService
         max: 2,
         interval: 0.5,
         backoff_factor: 2,
-        exceptions: [Faraday::TimeoutError, Faraday::ConnectionFailed]
+        exceptions: [Faraday::ConnectionFailed]
       }
       f.adapter Faraday.default_adapter
     end
   end
-end
\ No newline at end of file
+end